@@ -0,0 +1,429 @@
+"""
+Synthetic stand-in for the Gmail API service, used by the benchmarks.
+
+``FakeGmailService`` answers the calls ``gmail_tui.client`` makes, such as
+``service.users().threads().get(...).execute()`` and batch requests, from a
+mailbox of synthetic threads, messages, labels and attachments generated
+from a seed. Every HTTP request waits `latency` seconds, and every request
+and call is counted, so a benchmark can report how many round trips and
+quota units an operation takes.
+"""
+
+import base64
+import copy
+import random
+import threading
+import time
+from collections import Counter
+from typing import Callable, Union
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from gmail_tui.client.scheduler import quota_cost
+
+# Names that are resources rather than methods, such as users().threads()
+RESOURCES = {"users", "threads", "messages", "labels", "history", "attachments"}
+SYSTEM_LABELS = ["INBOX", "UNREAD", "STARRED", "IMPORTANT", "SENT", "TRASH", "SPAM"]
+WORDS = (
+    "invoice meeting report budget project release launch travel flight hotel"
+    " receipt order shipping delivery account security password update team"
+    " weekly digest newsletter offer discount event webinar interview review"
+).split()
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def _not_found(uri: str) -> HttpError:
+    return HttpError(
+        httplib2.Response({"status": 404, "reason": "Not Found"}),
+        b'{"error": {"code": 404, "message": "Requested entity was not found."}}',
+        uri=uri,
+    )
+
+
+class FakeRequest:
+    def __init__(self, service: "FakeGmailService", method_id: str, kwargs: dict):
+        self._service = service
+        self.method_id = method_id
+        self.kwargs = kwargs
+
+    def execute(self) -> dict:
+        self._service._round_trip()
+        return self._service._call(self)
+
+
+class FakeBatch:
+    def __init__(self, service: "FakeGmailService", callback: Callable = None):
+        self._service = service
+        self._callback = callback
+        self._requests: list[tuple[str, FakeRequest, Union[Callable, None]]] = []
+
+    def add(self, request: FakeRequest, callback: Callable = None, request_id=None):
+        if request_id is None:
+            request_id = str(len(self._requests) + 1)
+        self._requests.append((request_id, request, callback))
+
+    def execute(self):
+        # The calls of a batch are sent in a single HTTP request
+        self._service._round_trip()
+        for request_id, request, callback in self._requests:
+            response, exception = None, None
+            try:
+                response = self._service._call(request)
+            except HttpError as error:
+                exception = error
+            (callback or self._callback)(request_id, response, exception)
+
+
+class FakeResource:
+    def __init__(self, service: "FakeGmailService", path: str):
+        self._service = service
+        self._path = path
+
+    def __getattr__(self, name: str):
+        path = f"{self._path}.{name}"
+        if name in RESOURCES:
+            return lambda: FakeResource(self._service, path)
+        if path not in self._service.handlers:
+            raise AttributeError(name)
+        return lambda **kwargs: FakeRequest(self._service, path, kwargs)
+
+
+class FakeGmailService:
+    """
+    Gmail API service that answers from a synthetic mailbox.
+
+    Attributes:
+        requests: The number of HTTP requests sent, a batch counts as one.
+        calls: The number of calls of each method, by method id.
+        units: The quota units the calls would have cost.
+    """
+
+    def __init__(
+        self,
+        threads: int = 500,
+        latency: float = 0.0,
+        attachment_size: int = 256 * 1024,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.calls: Counter[str] = Counter()
+        self.units = 0
+        self.history_id = 100000
+        self.handlers = {
+            "gmail.users.getProfile": self._get_profile,
+            "gmail.users.history.list": self._history_list,
+            "gmail.users.labels.list": self._labels_list,
+            "gmail.users.labels.get": self._labels_get,
+            "gmail.users.threads.list": self._threads_list,
+            "gmail.users.threads.get": self._threads_get,
+            "gmail.users.threads.modify": self._threads_modify,
+            "gmail.users.threads.trash": self._threads_trash,
+            "gmail.users.messages.list": self._messages_list,
+            "gmail.users.messages.get": self._messages_get,
+            "gmail.users.messages.modify": self._messages_modify,
+            "gmail.users.messages.batchModify": self._messages_batch_modify,
+            "gmail.users.messages.trash": self._messages_trash,
+            "gmail.users.messages.attachments.get": self._attachments_get,
+        }
+
+        rng = random.Random(seed)
+        self.labels = {
+            label_id: {"id": label_id, "name": label_id, "type": "system"}
+            for label_id in SYSTEM_LABELS
+        }
+        for index in range(10):
+            self.labels[f"Label_{index}"] = {
+                "id": f"Label_{index}",
+                "name": f"Project {index}",
+                "type": "user",
+                "messageListVisibility": "show",
+                "labelListVisibility": "labelShow",
+            }
+        self.messages: dict[str, dict] = {}
+        self.threads: dict[str, list[str]] = {}
+        # Size of every attachment, its content is made up when it is fetched
+        self.attachments: dict[str, int] = {}
+        for thread_index in range(threads):
+            thread_id = f"{0x18a00000 - thread_index:x}"
+            self.threads[thread_id] = []
+            for index in range(rng.randint(1, 5)):
+                message_id = f"{thread_id}{index:03x}"
+                self.messages[message_id] = self._message(
+                    rng, thread_id, message_id, thread_index, attachment_size
+                )
+                self.threads[thread_id].append(message_id)
+        # Newest first, as Gmail lists them
+        self.thread_order = list(self.threads)
+
+    def _message(
+        self,
+        rng: random.Random,
+        thread_id: str,
+        message_id: str,
+        thread_index: int,
+        attachment_size: int,
+    ) -> dict:
+        sender = rng.randrange(200)
+        subject = " ".join(rng.choices(WORDS, k=4)).capitalize()
+        text = " ".join(rng.choices(WORDS, k=200))
+        html = "".join(f"<p>{text[start:start + 80]}</p>" for start in (0, 80, 160))
+        parts = [
+            {
+                "partId": "0",
+                "mimeType": "multipart/alternative",
+                "filename": "",
+                "headers": [],
+                "body": {"size": 0},
+                "parts": [
+                    {
+                        "partId": "0.0",
+                        "mimeType": "text/plain",
+                        "filename": "",
+                        "headers": [],
+                        "body": {"size": len(text), "data": _b64(text.encode())},
+                    },
+                    {
+                        "partId": "0.1",
+                        "mimeType": "text/html",
+                        "filename": "",
+                        "headers": [],
+                        "body": {"size": len(html), "data": _b64(html.encode())},
+                    },
+                ],
+            }
+        ]
+        if rng.random() < 0.2:
+            attachment_id = f"att-{message_id}"
+            self.attachments[attachment_id] = attachment_size
+            parts.append(
+                {
+                    "partId": "1",
+                    "mimeType": "application/pdf",
+                    "filename": f"{subject}.pdf",
+                    "headers": [],
+                    "body": {"size": attachment_size, "attachmentId": attachment_id},
+                }
+            )
+        labels = ["INBOX"] + rng.sample(
+            ["UNREAD", "IMPORTANT", "STARRED"] + [f"Label_{i}" for i in range(10)],
+            k=rng.randint(0, 3),
+        )
+        return {
+            "id": message_id,
+            "threadId": thread_id,
+            "historyId": str(self.history_id),
+            "labelIds": labels,
+            "snippet": text[:100],
+            "sizeEstimate": len(text) + len(html),
+            "internalDate": str(1700000000000 - thread_index * 3600000),
+            "payload": {
+                "partId": "",
+                "mimeType": "multipart/mixed",
+                "filename": "",
+                "headers": [
+                    {"name": "From", "value": f"Sender {sender} <s{sender}@x.com>"},
+                    {"name": "To", "value": "Me <me@example.com>"},
+                    {"name": "Subject", "value": subject},
+                    {"name": "Date", "value": "Tue, 14 Nov 2023 22:13:20 +0000"},
+                ],
+                "body": {"size": 0},
+                "parts": parts,
+            },
+        }
+
+    def users(self) -> FakeResource:
+        return FakeResource(self, "gmail.users")
+
+    def new_batch_http_request(self, callback: Callable = None) -> FakeBatch:
+        return FakeBatch(self, callback)
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.calls.clear()
+            self.units = 0
+
+    def _round_trip(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _call(self, request: FakeRequest) -> dict:
+        with self._lock:
+            self.calls[request.method_id] += 1
+            self.units += quota_cost(request.method_id)
+            kwargs = {
+                key: value
+                for key, value in request.kwargs.items()
+                if key != "userId" and value is not None
+            }
+            # Callers may change what they get, as they would a parsed response
+            return copy.deepcopy(self.handlers[request.method_id](**kwargs))
+
+    def _format(self, message: dict, format="full", metadataHeaders=None) -> dict:
+        if format == "full":
+            return message
+        message = dict(message)
+        payload = message.pop("payload")
+        if format == "metadata":
+            message["payload"] = {
+                "mimeType": payload["mimeType"],
+                "headers": [
+                    header
+                    for header in payload["headers"]
+                    if not metadataHeaders or header["name"] in metadataHeaders
+                ],
+            }
+        return message
+
+    def _matches(self, message: dict, labelIds=None, q=None) -> bool:
+        labels = set(message["labelIds"])
+        if labelIds and not labels.issuperset(labelIds):
+            return False
+        if ("TRASH" in labels or "SPAM" in labels) and not (
+            labelIds and {"TRASH", "SPAM"} & set(labelIds)
+        ):
+            return False
+        if q:
+            subject = message["payload"]["headers"][2]["value"].lower()
+            text = f"{subject} {message['snippet']}"
+            return all(word in text for word in q.lower().split())
+        return True
+
+    def _page(self, ids: list[str], pageToken="", maxResults=100) -> (list, dict):
+        start = int(pageToken or 0)
+        page = ids[start : start + maxResults]
+        response = {"resultSizeEstimate": len(ids)}
+        if start + maxResults < len(ids):
+            response["nextPageToken"] = str(start + maxResults)
+        return page, response
+
+    def _get_profile(self) -> dict:
+        return {"emailAddress": "me@example.com", "historyId": str(self.history_id)}
+
+    def _history_list(self, startHistoryId, pageToken=None) -> dict:
+        return {"historyId": str(self.history_id)}
+
+    def _labels_list(self) -> dict:
+        return {"labels": list(self.labels.values())}
+
+    def _labels_get(self, id) -> dict:
+        if id not in self.labels:
+            raise _not_found(f"labels/{id}")
+        return self.labels[id]
+
+    def _threads_list(
+        self,
+        labelIds=None,
+        pageToken="",
+        q=None,
+        maxResults=100,
+        includeSpamTrash=False,
+    ) -> dict:
+        ids = [
+            thread_id
+            for thread_id in self.thread_order
+            if any(
+                self._matches(self.messages[message_id], labelIds, q)
+                for message_id in self.threads[thread_id]
+            )
+        ]
+        page, response = self._page(ids, pageToken, maxResults)
+        if page:
+            response["threads"] = [
+                {
+                    "id": thread_id,
+                    "snippet": self.messages[self.threads[thread_id][-1]]["snippet"],
+                    "historyId": self.messages[self.threads[thread_id][-1]][
+                        "historyId"
+                    ],
+                }
+                for thread_id in page
+            ]
+        return response
+
+    def _threads_get(self, id, format="full", metadataHeaders=None) -> dict:
+        if id not in self.threads:
+            raise _not_found(f"threads/{id}")
+        messages = [self.messages[message_id] for message_id in self.threads[id]]
+        return {
+            "id": id,
+            "historyId": messages[-1]["historyId"],
+            "messages": [
+                self._format(message, format, metadataHeaders) for message in messages
+            ],
+        }
+
+    def _modify(self, message_ids: list[str], add: list[str], remove: list[str]):
+        self.history_id += 1
+        for message_id in message_ids:
+            message = self.messages[message_id]
+            labels = [label for label in message["labelIds"] if label not in remove]
+            message["labelIds"] = labels + [
+                label for label in add if label not in labels
+            ]
+            message["historyId"] = str(self.history_id)
+
+    def _threads_modify(self, id, body) -> dict:
+        self._modify(
+            self.threads[id],
+            body.get("addLabelIds", []),
+            body.get("removeLabelIds", []),
+        )
+        return self._threads_get(id, format="minimal")
+
+    def _threads_trash(self, id) -> dict:
+        return self._threads_modify(id, {"addLabelIds": ["TRASH"]})
+
+    def _messages_list(
+        self,
+        labelIds=None,
+        pageToken="",
+        q=None,
+        maxResults=100,
+        includeSpamTrash=False,
+    ) -> dict:
+        ids = [
+            message_id
+            for thread_id in self.thread_order
+            for message_id in reversed(self.threads[thread_id])
+            if self._matches(self.messages[message_id], labelIds, q)
+        ]
+        page, response = self._page(ids, pageToken, maxResults)
+        if page:
+            response["messages"] = [
+                {"id": message_id, "threadId": self.messages[message_id]["threadId"]}
+                for message_id in page
+            ]
+        return response
+
+    def _messages_get(self, id, format="full", metadataHeaders=None) -> dict:
+        if id not in self.messages:
+            raise _not_found(f"messages/{id}")
+        return self._format(self.messages[id], format, metadataHeaders)
+
+    def _messages_modify(self, id, body) -> dict:
+        self._modify([id], body.get("addLabelIds", []), body.get("removeLabelIds", []))
+        return self._messages_get(id, format="minimal")
+
+    def _messages_batch_modify(self, body) -> dict:
+        self._modify(
+            body["ids"], body.get("addLabelIds", []), body.get("removeLabelIds", [])
+        )
+        return {}
+
+    def _messages_trash(self, id) -> dict:
+        return self._messages_modify(id, {"addLabelIds": ["TRASH"]})
+
+    def _attachments_get(self, messageId, id) -> dict:
+        if id not in self.attachments:
+            raise _not_found(f"messages/{messageId}/attachments/{id}")
+        data = random.Random(id).randbytes(self.attachments[id])
+        return {"attachmentId": id, "size": len(data), "data": _b64(data)}
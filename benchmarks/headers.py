@@ -0,0 +1,150 @@
+"""
+Header parsing benchmark for messages with many recipients.
+
+Builds synthetic message headers, as returned by the Gmail API, with
+`--recipients` addresses in To and Cc, some of them with quoted names that
+contain commas, and reports how long it takes to parse the headers of a
+message:
+
+- with a loop over the headers that lowercases every name and splits the
+  addresses on ", ", as messages used to be parsed,
+- with ``email.utils.getaddresses`` alone,
+- with ``gmail_tui.client.headers``, which indexes the headers once and
+  parses the addresses as RFC 5322 does, without and with its cache.
+
+It also reports how many contacts each parser finds.
+
+Run it with::
+
+    python benchmarks/headers.py --recipients 300 --runs 20
+"""
+
+import argparse
+import sys
+import time
+from email.utils import getaddresses
+
+from gmail_tui.client.contact import Contact
+from gmail_tui.client.headers import index_headers, parse_address, parse_addresses
+
+
+def address_list(count: int, domain: str) -> str:
+    addresses = []
+    for index in range(count):
+        if index % 3 == 0:
+            addresses.append(f'"Doe, Jane {index}" <jane.doe{index}@{domain}>')
+        elif index % 3 == 1:
+            addresses.append(f"John Smith {index} <john{index}@{domain}>")
+        else:
+            addresses.append(f"team{index}@{domain}")
+    return ", ".join(addresses)
+
+
+def synthetic_headers(recipients: int) -> list[dict]:
+    return [
+        {"name": "Delivered-To", "value": "me@example.com"},
+        {"name": "Received", "value": "by 2002:a05:6a10:1234 with SMTP id x"},
+        {"name": "Received", "value": "from mail.example.org (mail.example.org)"},
+        {"name": "DKIM-Signature", "value": "v=1; a=rsa-sha256; c=relaxed/relaxed"},
+        {"name": "From", "value": '"Lists, Announce" <announce@example.org>'},
+        {"name": "To", "value": address_list(recipients, "example.com")},
+        {"name": "CC", "value": address_list(recipients // 2, "example.net")},
+        {"name": "Subject", "value": "[announce] Quarterly update"},
+        {"name": "Date", "value": "Mon, 17 Jul 2023 10:00:00 +0000"},
+        {"name": "Message-ID", "value": "<CA+abc123@mail.example.org>"},
+        {"name": "List-Id", "value": "<announce.example.org>"},
+        {"name": "Content-Type", "value": "multipart/alternative; boundary=x"},
+    ]
+
+
+def split_contact(value: str) -> Contact:
+    name = None
+    email = value.replace("<", "").replace(">", "")
+    if value.find("<") > 0:
+        name = value[: value.find("<") - 1]
+        email = value[value.find("<") + 1 : value.find(">")]
+    return Contact(email, name)
+
+
+def loop_parse(headers: list[dict]) -> tuple:
+    """Parses the headers as messages used to be parsed"""
+    sender = None
+    receiver = []
+    cc = ()
+    for hdr in headers:
+        if hdr["name"].lower() == "from":
+            sender = split_contact(hdr["value"])
+        elif hdr["name"].lower() == "to":
+            receiver = [split_contact(value) for value in hdr["value"].split(", ")]
+        elif hdr["name"].lower() == "subject":
+            pass
+        elif hdr["name"].lower() == "cc":
+            cc = tuple(hdr["value"].split(", "))
+        elif hdr["name"].lower() == "bcc":
+            pass
+    return sender, tuple(receiver), cc
+
+
+def stdlib_parse(headers: list[dict]) -> tuple:
+    index = index_headers(headers)
+    return tuple(
+        tuple(
+            Contact(email, name or None)
+            for name, email in getaddresses([index.get(header, "")])
+            if email
+        )
+        for header in ("from", "to", "cc")
+    )
+
+
+def index_parse(headers: list[dict]) -> tuple:
+    index = index_headers(headers)
+    return (
+        parse_address(index["from"]),
+        parse_addresses(index.get("to", "")),
+        parse_addresses(index.get("cc", "")),
+    )
+
+
+def uncached_parse(headers: list[dict]) -> tuple:
+    parse_addresses.cache_clear()
+    return index_parse(headers)
+
+
+def best_of(runs: int, function) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--recipients", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args(args)
+
+    headers = synthetic_headers(args.recipients)
+    parsers = {
+        "loop and split": loop_parse,
+        "getaddresses": stdlib_parse,
+        "RFC 5322, no cache": uncached_parse,
+        "RFC 5322, cached": index_parse,
+    }
+    index_parse(headers)
+    print(f"{args.recipients} To and {args.recipients // 2} Cc recipients")
+    print(f"{'':>20}  {'time':>11}  {'To':>5}  {'Cc':>5}  sender")
+    for name, function in parsers.items():
+        sender, to, cc = function(headers)
+        sender = sender[0] if isinstance(sender, tuple) else sender
+        seconds = best_of(args.runs, lambda: function(headers))
+        print(
+            f"{name:>20}: {seconds * 1000:8.3f} ms  {len(to):5}  {len(cc):5}"
+            f"  {sender.name!r}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,148 @@
+"""
+Memory benchmark for the client model.
+
+Builds synthetic messages (as returned by the Gmail API) and reports how
+many bytes each `Message` takes once built, measured with tracemalloc. The
+same messages are also built with the dict-backed model messages used before
+they became slotted records, as a baseline.
+
+Run it with::
+
+    python benchmarks/memory.py --messages 10000
+"""
+
+import argparse
+import base64
+import html
+import sys
+import tracemalloc
+from datetime import datetime
+
+from gmail_tui.client.label import LabelCatalog
+from gmail_tui.client.message import Message
+
+LABELS = ["INBOX", "UNREAD", "IMPORTANT", "CATEGORY_UPDATES", "Label_1"]
+
+
+def synthetic_message(index: int, senders: int = 200) -> dict:
+    sender = index % senders
+    body = base64.urlsafe_b64encode(
+        f"Hello, this is message {index}.\n".encode() * 20
+    ).decode()
+    return {
+        "id": f"m{index:08x}",
+        "threadId": f"t{index // 3:08x}",
+        "labelIds": LABELS[: 2 + index % 4],
+        "snippet": f"Hello, this is message {index}. Hello, this is message",
+        "internalDate": str(1690000000000 + index * 60000),
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "filename": "",
+            "headers": [
+                {"name": "From", "value": f"Sender {sender} <sender{sender}@x.com>"},
+                {"name": "To", "value": "Me <me@x.com>, Team <team@x.com>"},
+                {"name": "Subject", "value": f"Subject of thread {index // 3}"},
+                {"name": "Date", "value": "Mon, 1 Jan 2024 10:00:00 +0000"},
+            ],
+            "body": {"size": 0},
+            "parts": [
+                {
+                    "mimeType": "text/plain",
+                    "filename": "",
+                    "headers": [],
+                    "body": {"size": 620, "data": body},
+                },
+            ],
+        },
+    }
+
+
+class DictContact:
+    """A contact as it was before interning, one per header"""
+
+    def __init__(self, email: str, name: str = None):
+        self.email = email
+        self.name = name
+
+
+def dict_contact(value: str) -> DictContact:
+    name = None
+    email = value.replace("<", "").replace(">", "")
+    if value.find("<") > 0:
+        name = value[: value.find("<") - 1]
+        email = value[value.find("<") + 1 : value.find(">")]
+    return DictContact(email, name)
+
+
+class DictMessage:
+    """
+    The message model before slotted records: every field is an instance
+    attribute, contacts are not shared and the body is decoded when built.
+    """
+
+    def __init__(self, service, message_id, raw_data, label_catalog, message_format):
+        self._service = service
+        self._store = None
+        self._label_catalog = label_catalog
+        self.id = message_id
+        self.format = message_format
+        self.subject = None
+        payload = raw_data["payload"]
+        self.date = datetime.fromtimestamp(float(raw_data["internalDate"]) / 1000)
+        self.snippet = html.unescape(raw_data["snippet"]).replace("\u200c ", "")
+        self.labels = [label_catalog.get(label) for label in raw_data["labelIds"]]
+        self.receiver = []
+        self.body = None
+        self.html = None
+        self.attachments = []
+        for hdr in payload["headers"]:
+            if hdr["name"].lower() == "from":
+                self.sender = dict_contact(hdr["value"])
+            elif hdr["name"].lower() == "to":
+                for receiver in hdr["value"].split(", "):
+                    self.receiver.append(dict_contact(receiver))
+            elif hdr["name"].lower() == "subject":
+                self.subject = hdr["value"]
+        if message_format != "full":
+            return
+        for part in payload["parts"]:
+            if part["mimeType"] == "text/plain":
+                body = base64.urlsafe_b64decode(part["body"]["data"]).decode()
+                self.body = body if self.body is None else self.body + "\n" + body
+
+
+def label_catalog() -> LabelCatalog:
+    catalog = LabelCatalog(None)
+    catalog.update([{"id": label, "name": label, "type": "system"} for label in LABELS])
+    return catalog
+
+
+def measure(count: int, message_format: str, model=Message) -> float:
+    """Returns the bytes kept alive by each message once its resource is freed"""
+    catalog = label_catalog()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = []
+    for index in range(count):
+        raw = synthetic_message(index)
+        messages.append(model(None, raw["id"], raw, catalog, message_format))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del messages
+    return (after - before) / count
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=10000)
+    args = parser.parse_args(args)
+
+    print(f"{'':>8}  {'dict':>7}  {'slotted':>7}  bytes per message")
+    for message_format in ("metadata", "full"):
+        before = measure(args.messages, message_format, DictMessage)
+        after = measure(args.messages, message_format)
+        print(f"{message_format:>8}: {before:>7,.0f}  {after:>7,.0f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,194 @@
+"""
+MIME payload decoding benchmark.
+
+Builds two synthetic message payloads, as returned by the Gmail API in
+"full" format, and reports how long it takes to decode them:
+
+- a deeply nested message, with `--depth` levels of multipart parts, as
+  long forwarded and replied-to conversations are,
+- a mailing list digest, with `--sections` plain text and HTML parts and a
+  few attachments.
+
+Each payload is decoded by walking it recursively and concatenating its
+parts with ``+=``, as messages used to be decoded, and with
+``gmail_tui.client.mime``, first every kind of part and then only the plain
+text, as rendering a message needs.
+
+Run it with::
+
+    python benchmarks/mime.py --depth 500 --sections 2000 --runs 20
+"""
+
+import argparse
+import base64
+import sys
+import time
+
+from gmail_tui.client.mime import (
+    HTML,
+    PLAIN,
+    attachment_references,
+    join_text,
+    walk_parts,
+)
+
+SECTION = (
+    "Re: [dev] Section {index} of today's digest\n"
+    "> Quoted text of the previous message, wrapped at seventy-two columns\n"
+    "Thanks for the patch, it looks good to me. Merging it later today.\n"
+) * 8
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def text_part(mime_type: str, text: str) -> dict:
+    return {
+        "mimeType": mime_type,
+        "filename": "",
+        "headers": [{"name": "Content-Type", "value": f"{mime_type}; charset=UTF-8"}],
+        "body": {"size": len(text), "data": _b64(text)},
+    }
+
+
+def attachment_part(index: int) -> dict:
+    return {
+        "mimeType": "application/pdf",
+        "filename": f"attachment-{index}.pdf",
+        "headers": [{"name": "Content-Type", "value": "application/pdf"}],
+        "body": {"size": 120000, "attachmentId": f"ANGjdJ{index:04d}"},
+    }
+
+
+def alternative(index: int) -> dict:
+    text = SECTION.format(index=index)
+    return {
+        "mimeType": "multipart/alternative",
+        "filename": "",
+        "headers": [],
+        "body": {"size": 0},
+        "parts": [
+            text_part("text/plain", text),
+            text_part("text/html", f"<div><p>{text}</p></div>"),
+        ],
+    }
+
+
+def nested_payload(depth: int) -> dict:
+    """A reply to a reply..., each level quoting the previous one"""
+    payload = alternative(0)
+    for index in range(1, depth):
+        payload = {
+            "mimeType": "multipart/mixed",
+            "filename": "",
+            "headers": [],
+            "body": {"size": 0},
+            "parts": [alternative(index), payload],
+        }
+    return payload
+
+
+def digest_payload(sections: int, attachments: int = 5) -> dict:
+    return {
+        "mimeType": "multipart/mixed",
+        "filename": "",
+        "headers": [],
+        "body": {"size": 0},
+        "parts": [alternative(index) for index in range(sections)]
+        + [attachment_part(index) for index in range(attachments)],
+    }
+
+
+def recursive_parts(payload: dict) -> list[dict]:
+    """Decodes every part of a payload, as messages used to be decoded"""
+    if "attachmentId" in payload["body"]:
+        return [
+            {
+                "part_type": "attachment",
+                "filetype": payload["mimeType"],
+                "filename": payload["filename"] or "unknown",
+                "attachment_id": payload["body"]["attachmentId"],
+                "part_id": payload.get("partId"),
+                "size": payload["body"].get("size"),
+                "data": None,
+            }
+        ]
+    elif payload["mimeType"] == "text/html":
+        data = base64.urlsafe_b64decode(payload["body"]["data"])
+        return [{"part_type": "html", "body": data.decode("UTF-8", errors="replace")}]
+    elif payload["mimeType"] == "text/plain":
+        data = base64.urlsafe_b64decode(payload["body"]["data"])
+        return [{"part_type": "plain", "body": data.decode("UTF-8")}]
+    elif payload["mimeType"].startswith("multipart"):
+        parts = []
+        for part in payload.get("parts", ()):
+            parts.extend(recursive_parts(part))
+        return parts
+    return []
+
+
+def recursive_decode(payload: dict):
+    body = None
+    html = None
+    attachments = []
+    for part in recursive_parts(payload):
+        if part["part_type"] == "plain":
+            body = part["body"] if body is None else body + "\n" + part["body"]
+        elif part["part_type"] == "html":
+            html = part["body"] if html is None else html + "<br/>" + part["body"]
+        else:
+            attachments.append(part)
+    return body, html, attachments
+
+
+def walk_decode(payload: dict):
+    parts = tuple(walk_parts(payload))
+    return (
+        join_text(parts, PLAIN),
+        join_text(parts, HTML),
+        attachment_references(parts),
+    )
+
+
+def plain_only(payload: dict):
+    return join_text(walk_parts(payload, (PLAIN,)), PLAIN)
+
+
+def best_of(runs: int, function) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int, default=500)
+    parser.add_argument("--sections", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args(args)
+
+    payloads = {
+        f"nested ({args.depth} levels)": nested_payload(args.depth),
+        f"digest ({args.sections} sections)": digest_payload(args.sections),
+    }
+    decoders = {
+        "recursive +=": recursive_decode,
+        "walk_parts": walk_decode,
+        "walk_parts, plain only": plain_only,
+    }
+    # Deep payloads need a deep recursion
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), args.depth * 3 + 100))
+    for name, payload in payloads.items():
+        body, _, _ = walk_decode(payload)
+        print(f"{name}: {len(body) / 1024:,.0f} KiB of plain text")
+        for decoder, function in decoders.items():
+            seconds = best_of(args.runs, lambda: function(payload))
+            print(f"{decoder:>24}: {seconds * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,219 @@
+"""
+Benchmark of fetching messages in 'full' format against 'raw' format.
+
+Builds a mailing list digest with `--sections` quoted-printable sections,
+in plain text and HTML, the same digest with an attachment of
+`--attachment-kib` KiB, and a MIME digest of `--sections` messages, each
+one a message/rfc822 part with its own headers. Each message is encoded
+as the Gmail API returns it in 'full' format, a JSON tree of parts whose
+bodies are base64url-encoded separately and whose attachments are only
+referenced, and in 'raw' format, the message as it was received encoded in
+base64url.
+
+It reports the bytes of each response, before and after the gzip
+compression the API applies, and how long it takes to load the response
+and decode the sender, receivers, subject, body, HTML and attachments of a
+`Message` from it.
+
+Run it with::
+
+    python benchmarks/raw.py --sections 200 --attachment-kib 200 --runs 20
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import random
+import sys
+import time
+from email import policy
+from email.message import EmailMessage
+from email.mime.message import MIMEMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.parser import BytesParser
+
+from gmail_tui.client.label import LabelCatalog
+from gmail_tui.client.message import Message
+
+WORDS = (
+    "release planning freeze version patch review merge branch build test"
+    " failure report issue vote proposal schedule meeting minutes docs api"
+    " change bug fix regression performance memory cache thread worker"
+).split()
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def section(index: int, rng: random.Random) -> str:
+    def sentence(words: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+    return (
+        f"Re: [dev] Topic {index}: {sentence(6)}\n"
+        + "".join(f"> {sentence(10)}\n" for _ in range(3))
+        + "".join(f"{sentence(12)}\n" for _ in range(4))
+    )
+
+
+def digest(sections: int, attachment_kib: int = 0) -> EmailMessage:
+    rng = random.Random(0)
+    texts = [section(index, rng) for index in range(sections)]
+    message = EmailMessage(policy=policy.SMTP)
+    message["From"] = '"Dev list, digest" <dev-request@lists.example.org>'
+    message["To"] = "dev@lists.example.org"
+    message["Cc"] = "Jane Doe <jane@example.com>, john@example.com"
+    message["Subject"] = f"dev Digest, Vol 42, Issue 7 ({sections} messages)"
+    message["Date"] = "Mon, 17 Jul 2023 10:00:00 +0000"
+    message["List-Id"] = "<dev.lists.example.org>"
+    message.set_content("".join(texts), cte="quoted-printable")
+    message.add_alternative(
+        "<html><body>"
+        + "".join(f"<div class='section'><p>{text}</p></div>" for text in texts)
+        + "</body></html>",
+        subtype="html",
+        cte="quoted-printable",
+    )
+    if attachment_kib:
+        message.add_attachment(
+            rng.randbytes(attachment_kib * 1024),
+            maintype="application",
+            subtype="pdf",
+            filename="minutes.pdf",
+        )
+    return message
+
+
+def mime_digest(sections: int) -> MIMEMultipart:
+    """A digest whose messages are message/rfc822 parts, with their headers"""
+    rng = random.Random(0)
+    message = MIMEMultipart("mixed", policy=policy.SMTP)
+    message["From"] = '"Dev list, digest" <dev-request@lists.example.org>'
+    message["To"] = "dev@lists.example.org"
+    message["Subject"] = f"dev Digest, Vol 42, Issue 8 ({sections} messages)"
+    message["Date"] = "Tue, 18 Jul 2023 10:00:00 +0000"
+    message.attach(MIMEText(f"Today's topics: {sections} messages\n", "plain"))
+    messages = MIMEMultipart("digest", policy=policy.SMTP)
+    for index in range(sections):
+        inner = EmailMessage(policy=policy.SMTP)
+        inner["From"] = f"Member {index} <member{index}@example.com>"
+        inner["To"] = "dev@lists.example.org"
+        inner["Date"] = "Mon, 17 Jul 2023 10:00:00 +0000"
+        inner["Subject"] = f"Re: [dev] Topic {index}"
+        inner["Message-ID"] = f"<{index}.{rng.getrandbits(64):x}@example.com>"
+        inner.set_content(section(index, rng), cte="quoted-printable")
+        messages.attach(MIMEMessage(inner))
+    message.attach(messages)
+    return message
+
+
+def payload(part: EmailMessage, part_id: str = "") -> dict:
+    """The payload of a part in 'full' format"""
+    resource = {
+        "partId": part_id,
+        "mimeType": part.get_content_type(),
+        "filename": part.get_filename() or "",
+        "headers": [
+            {"name": name, "value": str(value)} for name, value in part.items()
+        ],
+    }
+    if part.is_multipart():
+        resource["body"] = {"size": 0}
+        resource["parts"] = [
+            payload(child, f"{part_id}.{index}" if part_id else str(index))
+            for index, child in enumerate(part.iter_parts())
+        ]
+    else:
+        data = part.get_payload(decode=True)
+        if part.get_filename():
+            # Attachment ids are long opaque strings
+            resource["body"] = {"attachmentId": "ANGjdJ" + "x" * 400, "size": len(data)}
+        else:
+            resource["body"] = {"size": len(data), "data": _b64(data)}
+    return resource
+
+
+def resources(message: EmailMessage) -> dict[str, str]:
+    """The JSON responses of messages.get, by format"""
+    raw = message.as_bytes()
+    # The parts of the 'full' payload are decoded from the received message
+    received = BytesParser(policy=policy.default).parsebytes(raw)
+    fields = {
+        "id": "m1",
+        "threadId": "t1",
+        "labelIds": ["INBOX", "UNREAD"],
+        "snippet": "Re: [dev] Topic 0: Send your questions for the meeting",
+        "sizeEstimate": len(raw),
+        "historyId": "1",
+        "internalDate": "1689588000000",
+    }
+    return {
+        "full": json.dumps({**fields, "payload": payload(received)}),
+        "raw": json.dumps({**fields, "raw": _b64(raw)}),
+    }
+
+
+def decode(text: str, message_format: str, catalog: LabelCatalog) -> Message:
+    message = Message(None, "m1", json.loads(text), catalog, message_format)
+    message.body, message.html, message.attachments
+    return message
+
+
+def best_of(runs: int, function) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--attachment-kib", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args(args)
+
+    catalog = LabelCatalog(None)
+    catalog.update(
+        [
+            {"id": label, "name": label, "type": "system"}
+            for label in ("INBOX", "UNREAD")
+        ]
+    )
+    messages = {
+        "digest": digest(args.sections),
+        "with attachment": digest(args.sections, args.attachment_kib),
+        "MIME digest": mime_digest(args.sections),
+    }
+    print(f"{'':>22}  {'KiB':>7}  {'gzip KiB':>8}  {'decode':>10}")
+    for name, message in messages.items():
+        decoded = {}
+        for message_format, text in resources(message).items():
+            seconds = best_of(args.runs, lambda: decode(text, message_format, catalog))
+            decoded[message_format] = decode(text, message_format, catalog)
+            print(
+                f"{name + ', ' + message_format:>22}:"
+                f" {len(text) / 1024:7,.0f}"
+                f"  {len(gzip.compress(text.encode())) / 1024:8,.0f}"
+                f"  {seconds * 1000:7.3f} ms"
+            )
+        full, raw = decoded["full"], decoded["raw"]
+        if (
+            full.sender.email != raw.sender.email
+            or full.subject != raw.subject
+            or full.body != raw.body
+            or full.html != raw.html
+            or len(full.cc) != len(raw.cc)
+            or [a.filename for a in full.attachments]
+            != [a.filename for a in raw.attachments]
+        ):
+            print(f"{name}: the formats decode differently")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
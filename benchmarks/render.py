@@ -0,0 +1,143 @@
+"""
+HTML rendering benchmark for message bodies.
+
+Builds a large newsletter-style HTML message (nested layout tables, inline
+styles, tracking links and images) and reports how long it takes to:
+
+- decode the message, which no longer parses the HTML,
+- convert the HTML to Markdown with ``gmail_tui.render``,
+- render it again from the ``RenderCache``,
+- parse it with BeautifulSoup and lxml, as messages used to be decoded,
+  when beautifulsoup4 and lxml are installed.
+
+Run it with::
+
+    python benchmarks/render.py --articles 200 --runs 20
+"""
+
+import argparse
+import base64
+import sys
+import time
+
+from gmail_tui.client.label import LabelCatalog
+from gmail_tui.client.message import Message
+from gmail_tui.render import RenderCache, html_to_markdown
+
+ARTICLE = """
+<tr><td class="article" style="padding:16px 24px;font-family:Arial,sans-serif">
+  <table role="presentation" width="100%" cellpadding="0" cellspacing="0">
+    <tr>
+      <td width="120" style="padding-right:12px">
+        <a href="https://click.example.com/t/{index}?utm_source=newsletter">
+          <img src="https://img.example.com/{index}.png" width="120" alt="">
+        </a>
+      </td>
+      <td style="vertical-align:top">
+        <h2 style="margin:0;font-size:18px;color:#222">Story number {index}:
+          <a href="https://click.example.com/s/{index}">a headline &amp; more</a>
+        </h2>
+        <p style="margin:8px 0;color:#555;line-height:1.4">
+          Lorem ipsum dolor sit amet, <b>consectetur</b> adipiscing elit, sed do
+          eiusmod tempor <i>incididunt</i> ut labore et dolore magna aliqua.
+          Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris.
+        </p>
+        <ul><li>First point</li><li>Second point</li></ul>
+        <a href="https://click.example.com/r/{index}"
+           style="color:#fff;background:#06c;padding:6px 12px">Read more</a>
+      </td>
+    </tr>
+  </table>
+</td></tr>
+"""
+
+NEWSLETTER = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Weekly digest</title>
+<style>{style}</style></head>
+<body style="margin:0;background:#f4f4f4">
+<div style="display:none">Preheader text &nbsp;&zwnj;&nbsp;&zwnj;</div>
+<center><table role="presentation" width="600" align="center">
+<tr><td><h1>The weekly digest</h1></td></tr>
+{articles}
+<tr><td style="font-size:11px;color:#999">
+  You are receiving this email because you subscribed.
+  <a href="https://click.example.com/unsubscribe">Unsubscribe</a>
+</td></tr>
+</table></center>
+<img src="https://open.example.com/pixel.gif" width="1" height="1">
+</body></html>
+"""
+
+
+def newsletter(articles: int) -> str:
+    style = " ".join(f".c{index}{{color:#{index:06x}}}" for index in range(300))
+    return NEWSLETTER.format(
+        style=style,
+        articles="".join(ARTICLE.format(index=index) for index in range(articles)),
+    )
+
+
+def message_resource(html: str) -> dict:
+    return {
+        "id": "m1",
+        "threadId": "t1",
+        "labelIds": ["INBOX"],
+        "snippet": "The weekly digest",
+        "internalDate": "1690000000000",
+        "payload": {
+            "mimeType": "text/html",
+            "filename": "",
+            "headers": [
+                {"name": "From", "value": "Digest <digest@example.com>"},
+                {"name": "Subject", "value": "The weekly digest"},
+            ],
+            "body": {"data": base64.urlsafe_b64encode(html.encode()).decode()},
+        },
+    }
+
+
+def best_of(runs: int, function) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args(args)
+
+    html = newsletter(args.articles)
+    resource = message_resource(html)
+    catalog = LabelCatalog(None)
+    catalog.update([{"id": "INBOX", "name": "INBOX", "type": "system"}])
+    message = Message(None, "m1", resource, catalog)
+    cache = RenderCache()
+    cache.render(message)
+
+    print(f"HTML size: {len(html) / 1024:,.0f} KiB")
+    timings = {
+        "decode message": lambda: Message(None, "m1", resource, catalog),
+        "html_to_markdown": lambda: html_to_markdown(html),
+        "RenderCache hit": lambda: cache.render(message),
+    }
+    try:
+        from bs4 import BeautifulSoup
+
+        timings["BeautifulSoup (lxml)"] = lambda: str(
+            BeautifulSoup(html.encode(), "lxml", from_encoding="utf-8").body
+        )
+    except ImportError:
+        print("beautifulsoup4 is not installed, skipping it")
+
+    for name, function in timings.items():
+        print(f"{name:>22}: {best_of(args.runs, function) * 1000:8.3f} ms")
+    print(f"Markdown size: {len(cache.render(message)) / 1024:,.0f} KiB")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
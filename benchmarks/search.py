@@ -0,0 +1,127 @@
+"""
+Local search benchmark.
+
+Fills a `MessageStore` with synthetic messages, indexed for full-text
+search as they are saved, and reports how long searches of the local index
+take for several kinds of queries.
+
+Run it with::
+
+    python benchmarks/search.py --messages 100000
+"""
+
+import argparse
+import base64
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from gmail_tui.client.search import parse_query
+from gmail_tui.client.store import MessageStore
+
+WORDS = (
+    "invoice meeting report budget project release launch travel flight hotel"
+    " receipt order shipping delivery account security password update team"
+    " weekly digest newsletter offer discount event webinar interview review"
+    " contract proposal agenda notes deadline reminder payment refund ticket"
+).split()
+# Word frequencies follow Zipf's law. The words above take every tenth rank
+# from the tenth, the rest of the vocabulary is made up.
+VOCABULARY = [f"word{rank}" for rank in range(5000)]
+VOCABULARY[10 : 10 + 10 * len(WORDS) : 10] = WORDS
+WEIGHTS = [1 / (rank + 10) for rank in range(len(VOCABULARY))]
+LABELS = ["INBOX", "UNREAD", "IMPORTANT", "STARRED", "Label_1", "Label_2"]
+QUERIES = [
+    "invoice",
+    "ticket",
+    "word4321",
+    "quarterly budget",
+    "from:sender42",
+    'subject:"invoice meeting"',
+    "is:unread",
+    "label:work meeting",
+    "after:2023/08/01 before:2023/09/01",
+    "from:sender7 is:unread -refund",
+]
+
+
+def synthetic_message(index: int, rng: random.Random) -> dict:
+    sender = rng.randrange(500)
+    subject = " ".join(rng.choices(VOCABULARY, WEIGHTS, k=4))
+    body = " ".join(rng.choices(VOCABULARY, WEIGHTS, k=120))
+    return {
+        "id": f"m{index:08x}",
+        "threadId": f"t{index // 3:08x}",
+        "historyId": "1",
+        "labelIds": rng.sample(LABELS, k=rng.randrange(1, 4)),
+        "snippet": body[:100],
+        "internalDate": str(1690000000000 + index * 60000),
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "From", "value": f"Sender {sender} <sender{sender}@x.com>"},
+                {"name": "To", "value": "Me <me@x.com>"},
+                {"name": "Subject", "value": subject},
+            ],
+            "body": {"data": base64.urlsafe_b64encode(body.encode()).decode()},
+        },
+    }
+
+
+def fill(store: MessageStore, count: int) -> float:
+    rng = random.Random(0)
+    store.save_labels(
+        [{"id": label, "name": label, "type": "system"} for label in LABELS[:4]]
+        + [
+            {"id": "Label_1", "name": "Work", "type": "user"},
+            {"id": "Label_2", "name": "Travel", "type": "user"},
+        ]
+    )
+    started = time.perf_counter()
+    for start in range(0, count, 3):
+        messages = [
+            synthetic_message(index, rng)
+            for index in range(start, min(start + 3, count))
+        ]
+        store.save_thread(
+            {"id": messages[0]["threadId"], "historyId": "1", "messages": messages},
+            full=True,
+        )
+    return time.perf_counter() - started
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = MessageStore(os.path.join(directory, "cache.db"))
+        if not store.searchable:
+            print("This SQLite build has no FTS5, there is no local index")
+            return
+        elapsed = fill(store, args.messages)
+        print(
+            f"Indexed {args.messages:,} messages in {elapsed:.1f}s"
+            f" ({args.messages / elapsed:,.0f} messages/s)"
+        )
+        labels = {label["name"].lower(): label["id"] for label in store.get_labels()}
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                threads = store.search_threads(parse_query(query, labels), 25)
+                timings.append(time.perf_counter() - started)
+            print(
+                f"{query:>36}: {statistics.median(timings) * 1000:7.2f} ms,"
+                f" {len(threads)} threads"
+            )
+        store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,99 @@
+"""
+Startup benchmark for the TUI.
+
+Reports how long ``gmail_tui.interface`` takes to import in a fresh
+interpreter, and how long the app takes to paint its first screen while the
+Gmail client is still being built (which, for the real client, means loading
+credentials, refreshing the OAuth token and building the API service).
+
+Run it with::
+
+    python benchmarks/startup.py --client-delay 1.5
+"""
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import gmail_tui.interface; "
+    "print(time.perf_counter() - started)"
+)
+
+
+class IdleGmail:
+    """Stand-in for `Gmail` with an empty mailbox"""
+
+    def __init__(self):
+        from gmail_tui.client import MutationQueue, RequestScheduler
+
+        self.store = None
+        self.scheduler = RequestScheduler()
+        self.mutations = MutationQueue(self)
+
+    def get_cached_threads(self, max_results=10, offset=0, message_format=None):
+        return []
+
+    def sync(self):
+        return set()
+
+    def list_threads(self, **kwargs):
+        return [], ""
+
+    def iter_threads(self, thread_ids, message_format="full", batch_size=None):
+        return iter([])
+
+
+def measure_import(runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        timings.append(float(output))
+    return min(timings)
+
+
+async def measure_paint(client_delay: float) -> (float, float):
+    from gmail_tui.interface import LoadingScreen, Main
+
+    def factory():
+        time.sleep(client_delay)
+        return IdleGmail()
+
+    started = time.perf_counter()
+    app = Main(gmail_factory=factory)
+    first_paint = None
+    async with app.run_test() as pilot:
+        while True:
+            await pilot.pause(0.005)
+            if first_paint is None and isinstance(app.screen, LoadingScreen):
+                first_paint = time.perf_counter() - started
+            if first_paint is not None and app.loading_screen is None:
+                return first_paint, time.perf_counter() - started
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--client-delay",
+        type=float,
+        default=1.0,
+        help="seconds the simulated Gmail client takes to build",
+    )
+    parser.add_argument("--runs", type=int, default=5, help="import runs")
+    args = parser.parse_args(args)
+
+    print(f"import gmail_tui.interface: {measure_import(args.runs) * 1000:.1f} ms")
+    first_paint, ready = asyncio.run(measure_paint(args.client_delay))
+    print(f"first paint:                {first_paint * 1000:.1f} ms")
+    print(f"first page ready:           {ready * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
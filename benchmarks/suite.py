@@ -0,0 +1,246 @@
+"""
+Offline benchmark suite of the main Gmail client operations.
+
+Runs each scenario against ``FakeGmailService`` (see ``fake_gmail.py``), a
+synthetic mailbox that waits `--latency` seconds per HTTP request and
+counts every call, with a fresh `Gmail` client each time:
+
+- list page: list the first page of the inbox and fetch its threads,
+- thread open: fetch a full thread and render its last message,
+- search: list and fetch the first page of a search,
+- load more: list and fetch the second page of the inbox,
+- label mutation: mark the threads of a page as read.
+
+It reports the wall time, the HTTP requests, the API calls, the quota units
+and the peak memory allocated by each scenario. With ``--check`` it compares
+them with a baseline saved by ``--save`` and exits with an error if a
+scenario sends more requests, or takes much more time or memory, so CI can
+catch regressions.
+
+Run it with::
+
+    python benchmarks/suite.py --latency 0.02
+    python benchmarks/suite.py --save benchmarks/baseline.json
+    python benchmarks/suite.py --check benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable, NamedTuple
+
+from fake_gmail import FakeGmailService
+
+from gmail_tui.client import Gmail, Thread
+from gmail_tui.render import RenderCache
+
+PAGE_SIZE = 25
+SEARCH_QUERY = "invoice meeting"
+
+
+class Scenario(NamedTuple):
+    name: str
+    # Prepares what the scenario needs, its requests are not measured
+    setup: Callable[[Gmail], object]
+    run: Callable[[Gmail, object], None]
+
+
+class Result(NamedTuple):
+    seconds: float
+    requests: int
+    calls: int
+    units: int
+    peak_kib: float
+
+
+def first_page(gmail: Gmail) -> (list[str], str):
+    return gmail.list_threads(max_results=PAGE_SIZE)
+
+
+def load_page(gmail: Gmail, page_token: str = "", query: str = None):
+    thread_ids, _ = gmail.list_threads(
+        max_results=PAGE_SIZE, page_token=page_token, query=query
+    )
+    list(gmail.iter_threads(thread_ids, message_format="metadata"))
+
+
+def open_thread(gmail: Gmail, page: (list[str], str)):
+    thread = gmail.get_thread(page[0][0])
+    RenderCache().render(thread.last_message)
+
+
+def page_threads(gmail: Gmail) -> list[Thread]:
+    return list(gmail.iter_threads(first_page(gmail)[0], message_format="metadata"))
+
+
+SCENARIOS = [
+    Scenario("list page", lambda gmail: None, lambda gmail, _: load_page(gmail)),
+    Scenario("thread open", first_page, open_thread),
+    Scenario(
+        "search",
+        lambda gmail: None,
+        lambda gmail, _: load_page(gmail, query=SEARCH_QUERY),
+    ),
+    Scenario(
+        "load more",
+        first_page,
+        lambda gmail, page: load_page(gmail, page_token=page[1]),
+    ),
+    Scenario(
+        "label mutation",
+        page_threads,
+        lambda gmail, threads: gmail.modify_threads(threads, remove_labels=["UNREAD"]),
+    ),
+]
+
+
+def measure(scenario: Scenario, threads: int, latency: float, runs: int) -> Result:
+    """Runs a scenario `runs` times, and once more to trace its memory"""
+    best = None
+    for run in range(runs + 1):
+        service = FakeGmailService(threads=threads, latency=latency)
+        gmail = Gmail(service=service)
+        try:
+            state = scenario.setup(gmail)
+            service.reset_counters()
+            traced = run == runs
+            if traced:
+                tracemalloc.start()
+            started = time.perf_counter()
+            scenario.run(gmail, state)
+            elapsed = time.perf_counter() - started
+            if traced:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                best = best._replace(peak_kib=peak / 1024)
+            elif best is None or elapsed < best.seconds:
+                best = Result(
+                    elapsed,
+                    service.requests,
+                    sum(service.calls.values()),
+                    service.units,
+                    0,
+                )
+        finally:
+            gmail.mutations.close()
+    return best
+
+
+def regressions(
+    results: dict[str, Result],
+    baseline: dict[str, dict],
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> list[str]:
+    found = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for field in ("requests", "calls", "units"):
+            if getattr(result, field) > expected[field]:
+                found.append(
+                    f"{name}: {getattr(result, field)} {field},"
+                    f" the baseline is {expected[field]}"
+                )
+        if result.seconds > expected["seconds"] * time_tolerance:
+            found.append(
+                f"{name}: {result.seconds * 1000:.1f} ms,"
+                f" the baseline is {expected['seconds'] * 1000:.1f} ms"
+            )
+        if result.peak_kib > expected["peak_kib"] * memory_tolerance:
+            found.append(
+                f"{name}: {result.peak_kib:,.0f} KiB peak,"
+                f" the baseline is {expected['peak_kib']:,.0f} KiB"
+            )
+    return found
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--threads", type=int, help="threads in the mailbox (default: 500)"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        help="seconds every HTTP request takes (default: 0.02)",
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--save", metavar="PATH", help="save the results as JSON")
+    parser.add_argument(
+        "--check",
+        metavar="PATH",
+        help="fail if the results regressed from a saved baseline, whose"
+        " --threads and --latency are used by default",
+    )
+    parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        default=2.0,
+        help="how many times the baseline time a scenario may take",
+    )
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=1.5,
+        help="how many times the baseline peak memory a scenario may take",
+    )
+    args = parser.parse_args(args)
+
+    baseline = {}
+    if args.check:
+        with open(args.check, encoding="UTF-8") as file:
+            baseline = json.load(file)
+    threads = args.threads or baseline.get("threads", 500)
+    latency = args.latency if args.latency is not None else baseline.get("latency")
+    latency = 0.02 if latency is None else latency
+
+    print(f"{threads} threads, {latency * 1000:.0f} ms per request")
+    print(f"{'':>15}  {'time':>9} {'requests':>8} {'calls':>6} {'units':>6}  peak")
+    results = {}
+    for scenario in SCENARIOS:
+        result = measure(scenario, threads, latency, args.runs)
+        results[scenario.name] = result
+        print(
+            f"{scenario.name:>15}: {result.seconds * 1000:6.1f} ms"
+            f" {result.requests:8} {result.calls:6} {result.units:6}"
+            f"  {result.peak_kib:,.0f} KiB"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="UTF-8") as file:
+            json.dump(
+                {
+                    "threads": threads,
+                    "latency": latency,
+                    "scenarios": {
+                        name: {
+                            field: round(value, 4)
+                            for field, value in result._asdict().items()
+                        }
+                        for name, result in results.items()
+                    },
+                },
+                file,
+                indent=2,
+            )
+            file.write("\n")
+
+    if args.check:
+        found = regressions(
+            results,
+            baseline["scenarios"],
+            args.time_tolerance,
+            args.memory_tolerance,
+        )
+        for regression in found:
+            print(f"Regression: {regression}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,184 @@
+"""
+Transport benchmark for the Gmail API service.
+
+Starts a local HTTP stand-in for the Gmail API that waits `--connect-delay`
+seconds on every new connection, as a TLS handshake would, and
+`--latency` seconds on every request. Then it gets threads through a
+service built with each transport of ``gmail_tui.client.transport`` and
+reports the latency of a request and the connections opened when the
+requests are sent:
+
+- one after the other from the same thread,
+- one after the other from a new thread each, as Textual workers send them,
+- from a pool of `--workers` threads at once.
+
+Run it with::
+
+    python benchmarks/transport.py --requests 200 --connect-delay 0.05
+"""
+
+import argparse
+import gzip
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+
+from gmail_tui.client.transport import TRANSPORTS
+
+
+def thread_resource(thread_id: str) -> dict:
+    return {
+        "id": thread_id,
+        "historyId": "1",
+        "messages": [
+            {
+                "id": f"{thread_id}-{index}",
+                "threadId": thread_id,
+                "labelIds": ["INBOX", "UNREAD"],
+                "snippet": "Lorem ipsum dolor sit amet, consectetur adipiscing " * 2,
+                "internalDate": "1690000000000",
+                "payload": {
+                    "mimeType": "text/plain",
+                    "headers": [
+                        {"name": "From", "value": "Jane Doe <jane@example.com>"},
+                        {"name": "To", "value": "Me <me@example.com>"},
+                        {"name": "Subject", "value": f"Message {index}"},
+                    ],
+                },
+            }
+            for index in range(3)
+        ],
+    }
+
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, connect_delay: float, latency: float):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.connections = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Send the headers and the body without waiting for an ACK in between
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.connect_delay)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        thread_id = self.path.split("?")[0].rsplit("/", 1)[-1]
+        body = json.dumps(thread_resource(thread_id)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def timed_get(service, thread_id: str) -> float:
+    started = time.perf_counter()
+    service.users().threads().get(userId="me", id=thread_id).execute()
+    return time.perf_counter() - started
+
+
+def same_thread(service, requests: int, workers: int) -> list[float]:
+    return [timed_get(service, f"t{index}") for index in range(requests)]
+
+
+def new_threads(service, requests: int, workers: int) -> list[float]:
+    timings = []
+    for index in range(requests):
+        thread = threading.Thread(
+            target=lambda: timings.append(timed_get(service, f"t{index}"))
+        )
+        thread.start()
+        thread.join()
+    return timings
+
+
+def thread_pool(service, requests: int, workers: int) -> list[float]:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(lambda index: timed_get(service, f"t{index}"), range(requests))
+        )
+
+
+SCENARIOS = {
+    "same thread": same_thread,
+    "new thread each": new_threads,
+    "thread pool": thread_pool,
+}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--connect-delay",
+        type=float,
+        default=0.05,
+        help="seconds the stand-in takes to accept a connection",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.005,
+        help="seconds the stand-in takes to answer a request",
+    )
+    args = parser.parse_args(args)
+
+    server = StandIn(args.connect_delay, args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    print(f"{'':>26}  median     p95  connections  KiB received")
+    for name, transport in TRANSPORTS.items():
+        for scenario, run in SCENARIOS.items():
+            service = build(
+                "gmail",
+                "v1",
+                http=transport(AnonymousCredentials()),
+                static_discovery=True,
+                client_options={"api_endpoint": endpoint},
+            )
+            connections, bytes_sent = server.connections, server.bytes_sent
+            timings = sorted(run(service, args.requests, args.workers))
+            print(
+                f"{name:>8} {scenario:>17}:"
+                f" {statistics.median(timings) * 1000:5.1f}ms"
+                f" {timings[int(len(timings) * 0.95)] * 1000:5.1f}ms"
+                f" {server.connections - connections:12}"
+                f" {(server.bytes_sent - bytes_sent) / 1024:13,.0f}"
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,5 +1,9 @@
-from gmail_tui.client.attachment import Attachment
+from gmail_tui.client.async_gmail import AsyncGmail
+from gmail_tui.client.attachment import Attachment, AttachmentCache
 from gmail_tui.client.contact import Contact
 from gmail_tui.client.gmail import Gmail
 from gmail_tui.client.message import Message
+from gmail_tui.client.mutations import MutationQueue
+from gmail_tui.client.scheduler import Priority, RequestScheduler
+from gmail_tui.client.store import MessageStore
 from gmail_tui.client.thread import Thread
@@ -0,0 +1,373 @@
+import asyncio
+from typing import Union
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from gmail_tui.client.gmail import Gmail
+from gmail_tui.client.message import METADATA_HEADERS, Message
+from gmail_tui.client.scheduler import quota_cost
+from gmail_tui.client.thread import Thread
+
+BASE_URL = "https://gmail.googleapis.com/gmail/v1/users/me/"
+MAX_CONNECTIONS = 10
+
+
+def _method_id(method: str, path: str) -> str:
+    """The method id of a request, such as 'gmail.users.threads.get'"""
+    parts = path.split("/")
+    if len(parts) == 1:
+        action = "list" if method == "GET" else "create"
+    elif len(parts) == 2:
+        # Such as messages/batchModify
+        action = {"GET": "get", "DELETE": "delete"}.get(method, parts[1])
+    else:
+        action = parts[2]
+    return f"gmail.users.{parts[0]}.{action}"
+
+
+class AsyncGmail:
+    """
+    Asyncio counterpart of `Gmail`.
+
+    Requests are sent with an `httpx.AsyncClient` that keeps a pool of up to
+    `max_connections` connections alive, so many threads or messages can be
+    awaited at once without using threads. It shares the credentials, the
+    label catalog, the store and the request scheduler of the wrapped `Gmail`
+    client, and the threads and messages it returns are the same objects
+    `Gmail` returns, so their synchronous methods keep working. The store and
+    the label catalog are read and written from a thread, never from the
+    event loop.
+
+    `transport` is the httpx transport the requests are sent with, such as an
+    `httpx.MockTransport`, the default one when None.
+
+    Requires the `async` extra (`pip install gmail-tui[async]`).
+    """
+
+    def __init__(
+        self,
+        gmail: Gmail,
+        max_connections: int = MAX_CONNECTIONS,
+        http2: bool = False,
+        transport=None,
+    ):
+        try:
+            import httpx
+        except ImportError as error:  # pragma: no cover
+            raise ImportError(
+                "AsyncGmail needs httpx, install it with `pip install gmail-tui[async]`"
+            ) from error
+
+        self.gmail = gmail
+        # The credentials of a client built from a service are the ones of
+        # its transport, see `ThreadLocalHttp` and `SessionHttp`
+        self._credentials = gmail.credentials or getattr(
+            gmail._service._http, "credentials", None
+        )
+        if self._credentials is None:
+            raise ValueError(
+                "AsyncGmail needs credentials, the Gmail client has none and"
+                " neither does the transport of its service"
+            )
+        self._client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            http2=http2,
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=60,
+        )
+        self._refresh_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _authorization(self) -> str:
+        credentials = self._credentials
+        async with self._refresh_lock:
+            if not credentials.valid:
+                from google.auth.transport.requests import Request
+
+                # Refreshing is rare and google-auth only refreshes synchronously
+                await asyncio.to_thread(credentials.refresh, Request())
+        return f"Bearer {credentials.token}"
+
+    async def _request(
+        self, method: str, path: str, params: dict = None, body: dict = None
+    ) -> dict:
+        """
+        Sends a request to the Gmail API.
+
+        Raises:
+            googleapiclient.errors.HttpError: The API returned an error, so
+                callers handle errors the same way as with `Gmail`.
+
+        """
+
+        if params is not None:
+            params = {key: value for key, value in params.items() if value is not None}
+
+        async def send():
+            response = await self._client.request(
+                method,
+                path,
+                params=params,
+                json=body,
+                headers={"Authorization": await self._authorization()},
+            )
+            if response.status_code >= 400:
+                raise HttpError(
+                    httplib2.Response(
+                        {
+                            "status": response.status_code,
+                            "reason": response.reason_phrase,
+                            **response.headers,
+                        }
+                    ),
+                    response.content,
+                    uri=str(response.url),
+                )
+            return response.json() if response.content else {}
+
+        method_id = _method_id(method, path)
+        return await self.gmail.scheduler.run_async(
+            send, quota_cost(method_id), method_id=method_id
+        )
+
+    async def _ensure_labels(self):
+        if self.gmail.label_catalog.is_stale:
+            labels = await self._request("GET", "labels")
+            # The labels are saved in the store
+            await asyncio.to_thread(
+                self.gmail.label_catalog.update, labels.get("labels", [])
+            )
+
+    def _format_params(self, message_format: str) -> dict:
+        return {
+            "format": message_format,
+            "metadataHeaders": METADATA_HEADERS
+            if message_format == "metadata"
+            else None,
+        }
+
+    async def list_threads(
+        self,
+        labels: Union[list[str], None] = None,
+        page_token: str = "",
+        query: str = None,
+        max_results: int = 10,
+        include_spam: bool = False,
+    ) -> (list[str], str):
+        threads = await self._request(
+            "GET",
+            "threads",
+            params={
+                "labelIds": labels,
+                "pageToken": page_token or None,
+                "q": query,
+                "maxResults": max_results,
+                "includeSpamTrash": str(include_spam).lower(),
+            },
+        )
+        if "threads" not in threads:
+            return [], ""
+        for thread in threads["threads"]:
+            self.gmail._history_ids[thread["id"]] = thread.get("historyId")
+        return (
+            [thread["id"] for thread in threads["threads"]],
+            threads.get("nextPageToken", ""),
+        )
+
+    async def get_thread(self, thread_id: str, message_format: str = "full") -> Thread:
+        store = self.gmail.store
+        thread = None
+        if store is not None:
+            thread = await asyncio.to_thread(
+                store.get_thread,
+                thread_id,
+                message_format == "full",
+                self.gmail._history_ids.get(thread_id),
+            )
+        if thread is None:
+            thread = await self._request(
+                "GET", f"threads/{thread_id}", self._format_params(message_format)
+            )
+            if store is not None:
+                await asyncio.to_thread(
+                    store.save_thread, thread, message_format == "full"
+                )
+        await self._ensure_labels()
+        # Resolving the labels reloads the catalog when a label is unknown
+        return await asyncio.to_thread(
+            Thread,
+            self.gmail._service,
+            thread_id,
+            thread,
+            self.gmail.label_catalog,
+            message_format,
+            store,
+        )
+
+    async def get_threads(
+        self,
+        labels: Union[list[str], None] = None,
+        page_token: str = "",
+        query: str = None,
+        max_results: int = 10,
+        include_spam: bool = False,
+        message_format: str = "full",
+    ) -> (list[Thread], str):
+        thread_ids, next_page_token = await self.list_threads(
+            labels, page_token, query, max_results, include_spam
+        )
+        await self._ensure_labels()
+        threads = await asyncio.gather(
+            *[self.get_thread(thread_id, message_format) for thread_id in thread_ids]
+        )
+        return list(threads), next_page_token
+
+    async def load_thread(self, thread: Thread):
+        """Fetches the full messages of a thread listed as metadata"""
+        if not thread.is_loaded:
+            loaded = await self.get_thread(thread.id, "full")
+            thread.format = loaded.format
+            thread.messages = loaded.messages
+            thread.last_message = loaded.last_message
+
+    async def get_message(
+        self, message_id: str, message_format: str = "full"
+    ) -> Message:
+        store = self.gmail.store
+        message = None
+        if store is not None:
+            message = await asyncio.to_thread(
+                store.get_message, message_id, message_format == "full"
+            )
+        if message is None:
+            message = await self._request(
+                "GET", f"messages/{message_id}", self._format_params(message_format)
+            )
+            if store is not None:
+                await asyncio.to_thread(
+                    store.save_message, message, message_format == "full"
+                )
+        await self._ensure_labels()
+        # See get_thread
+        return await asyncio.to_thread(
+            Message,
+            self.gmail._service,
+            message_id,
+            message,
+            self.gmail.label_catalog,
+            message_format,
+            store,
+        )
+
+    async def get_messages(
+        self,
+        labels: Union[list[str], None] = None,
+        page_token: str = "",
+        query: str = None,
+        max_results: int = 10,
+        include_spam: bool = False,
+        message_format: str = "full",
+    ) -> (list[Message], str):
+        messages = await self._request(
+            "GET",
+            "messages",
+            params={
+                "labelIds": labels,
+                "pageToken": page_token or None,
+                "q": query,
+                "maxResults": max_results,
+                "includeSpamTrash": str(include_spam).lower(),
+            },
+        )
+        if "messages" not in messages:
+            return [], ""
+        await self._ensure_labels()
+        return (
+            list(
+                await asyncio.gather(
+                    *[
+                        self.get_message(message["id"], message_format)
+                        for message in messages["messages"]
+                    ]
+                )
+            ),
+            messages.get("nextPageToken", ""),
+        )
+
+    async def modify_message(
+        self,
+        message: Message,
+        add_labels: Union[list[str], None] = None,
+        remove_labels: Union[list[str], None] = None,
+    ) -> dict:
+        """Adds and removes labels of a message, updating its local labels"""
+        add_labels = [label.upper() for label in add_labels or []]
+        remove_labels = [label.upper() for label in remove_labels or []]
+        response = await self._request(
+            "POST",
+            f"messages/{message.id}/modify",
+            body={"addLabelIds": add_labels, "removeLabelIds": remove_labels},
+        )
+        await self._ensure_labels()
+
+        def apply():
+            message.labels = tuple(
+                self.gmail.label_catalog.get(label_id)
+                for label_id in response.get("labelIds", [])
+            )
+            message._save_labels()
+
+        # An unknown label id reloads the catalog and the labels are written
+        # to the store, neither of which may block the event loop
+        await asyncio.to_thread(apply)
+        return response
+
+    async def modify_thread(
+        self,
+        thread: Thread,
+        add_labels: Union[list[str], None] = None,
+        remove_labels: Union[list[str], None] = None,
+    ) -> dict:
+        add_labels = [label.upper() for label in add_labels or []]
+        remove_labels = [label.upper() for label in remove_labels or []]
+        response = await self._request(
+            "POST",
+            f"threads/{thread.id}/modify",
+            body={"addLabelIds": add_labels, "removeLabelIds": remove_labels},
+        )
+        await self._ensure_labels()
+
+        def apply():
+            for message in thread.messages:
+                for label in add_labels:
+                    if not message.has_label(label):
+                        message.labels += (self.gmail.label_catalog.get(label),)
+                message.labels = tuple(
+                    label
+                    for label in message.labels
+                    if label is not None and label.id not in remove_labels
+                )
+                message._save_labels()
+
+        # See modify_message
+        await asyncio.to_thread(apply)
+        return response
+
+    async def mark_as_read(self, message: Message) -> dict:
+        return await self.modify_message(message, remove_labels=["UNREAD"])
+
+    async def mark_as_unread(self, message: Message) -> dict:
+        return await self.modify_message(message, add_labels=["UNREAD"])
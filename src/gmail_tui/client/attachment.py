@@ -1,3 +1,305 @@
+import base64
+import hashlib
+import itertools
+import os
+import re
+import shutil
+import tempfile
+from typing import Iterable, Union
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from gmail_tui.client.scheduler import quota_cost, scheduler_of
+
+ATTACHMENT_METHOD = "gmail.users.messages.attachments.get"
+ATTACHMENT_URL = (
+    "https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}"
+    "/attachments/{attachment_id}?fields=data"
+)
+# Bytes of the response read and decoded at a time
+CHUNK_SIZE = 256 * 1024
+DATA_FIELD = re.compile(rb'"data"\s*:\s*"')
+
+
+def _json_data(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    """Yields the value of the `data` field of a streamed JSON response"""
+    head = b""
+    chunks = iter(chunks)
+    for chunk in chunks:
+        head += chunk
+        match = DATA_FIELD.search(head)
+        if match is not None:
+            break
+    else:
+        return
+    # base64url has no characters that JSON escapes, the value ends at a quote
+    chunk = head[match.end() :]
+    while True:
+        end = chunk.find(b'"')
+        if end >= 0:
+            yield chunk[:end]
+            return
+        yield chunk
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+
+
+def _decode_to(chunks: Iterable[bytes], file) -> (int, str):
+    """
+    Decodes base64url text read in chunks and writes it to a file.
+
+    Returns:
+        The number of bytes written and their SHA-256 digest.
+
+    """
+
+    digest = hashlib.sha256()
+    size = 0
+    rest = b""
+    for chunk in chunks:
+        chunk = rest + chunk.strip()
+        end = len(chunk) - len(chunk) % 4
+        rest = chunk[end:]
+        data = base64.urlsafe_b64decode(chunk[:end])
+        file.write(data)
+        digest.update(data)
+        size += len(data)
+    if rest:
+        data = base64.urlsafe_b64decode(rest + b"=" * (-len(rest) % 4))
+        file.write(data)
+        digest.update(data)
+        size += len(data)
+    return size, digest.hexdigest()
+
+
+def _reserve_path(directory: str, filename: str) -> str:
+    """
+    Creates an empty file named `filename` in a directory, or `name (1).ext`,
+    `name (2).ext`... if the name is taken, and returns its path. Attachments
+    with the same filename, even saved at once, don't overwrite each other.
+    """
+
+    name, extension = os.path.splitext(filename)
+    for index in itertools.count():
+        path = os.path.join(
+            directory, f"{name} ({index}){extension}" if index else filename
+        )
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        return path
+
+
+class AttachmentCache:
+    """
+    Keeps a copy of every downloaded attachment in `directory`, so the same
+    attachment is never fetched twice.
+
+    Files are stored once by the SHA-256 of their content, so a file attached
+    to several messages takes the space of one. Gmail attachment ids change
+    between requests, so downloads are indexed by message id and part id.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "index"), exist_ok=True)
+
+    def _index_path(self, message_id: str, part_id: str) -> str:
+        return os.path.join(self.directory, "index", f"{message_id}-{part_id}")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest)
+
+    def get(self, message_id: str, part_id: str) -> Union[str, None]:
+        """Returns the path of the cached content of an attachment, if any"""
+        try:
+            with open(self._index_path(message_id, part_id), encoding="UTF-8") as index:
+                path = self._object_path(index.read().strip())
+        except FileNotFoundError:
+            return None
+        return path if os.path.exists(path) else None
+
+    def add(self, message_id: str, part_id: str, path: str, digest: str):
+        """Stores a downloaded file, unless a file with its content is stored"""
+        target = self._object_path(digest)
+        if not os.path.exists(target):
+            temporary = f"{target}.{os.getpid()}.tmp"
+            try:
+                os.link(path, temporary)
+            except OSError:
+                shutil.copyfile(path, temporary)
+            os.replace(temporary, target)
+        index_path = self._index_path(message_id, part_id)
+        with open(f"{index_path}.tmp", "w", encoding="UTF-8") as index:
+            index.write(digest)
+        os.replace(f"{index_path}.tmp", index_path)
+
+
 class Attachment:
-    def __init__(self, service, part: dict):
+    __slots__ = (
+        "_service",
+        "message_id",
+        "part_id",
+        "id",
+        "filename",
+        "filetype",
+        "size",
+        "data",
+    )
+
+    def __init__(self, service, part: dict, message_id: str = None):
+        """
+        Args:
+            service: The Gmail API service.
+            part: The attachment part, as returned by
+                `gmail_tui.client.mime.attachment_reference`.
+            message_id: The id of the message the attachment belongs to.
+        """
+
         self._service = service
+        self.message_id = message_id
+        self.part_id = part.get("part_id")
+        self.id = part["attachment_id"]
+        self.filename = part["filename"]
+        self.filetype = part["filetype"]
+        self.size = part.get("size")
+        self.data: Union[bytes, None] = part.get("data")
+
+    def _credentials(self):
+        # The service sends requests through an authorized Http, such as
+        # ThreadLocalHttp, that knows its credentials
+        return getattr(getattr(self._service, "_http", None), "credentials", None)
+
+    def _session(self):
+        # SessionHttp has a session with a pool of connections to reuse
+        return getattr(getattr(self._service, "_http", None), "session", None)
+
+    def _chunks(self, session=None, chunk_size: int = CHUNK_SIZE) -> Iterable[bytes]:
+        """Yields the base64url content of the attachment as it is received"""
+        shared_session = self._session() if session is None else None
+        if shared_session is not None:
+            session = shared_session
+        credentials = self._credentials() if session is None else None
+        if session is None and credentials is None:
+            # Without credentials to stream with, go through the service
+            try:
+                data = (
+                    self._service.users()
+                    .messages()
+                    .attachments()
+                    .get(userId="me", messageId=self.message_id, id=self.id)
+                    .execute()["data"]
+                ).encode()
+            except HttpError as error:
+                raise error
+            for start in range(0, len(data), chunk_size):
+                yield data[start : start + chunk_size]
+            return
+
+        own_session = session is None
+        if own_session:
+            from google.auth.transport.requests import AuthorizedSession
+
+            session = AuthorizedSession(credentials)
+        url = ATTACHMENT_URL.format(message_id=self.message_id, attachment_id=self.id)
+
+        def get():
+            response = session.get(url, stream=True)
+            if response.status_code >= 400:
+                with response:
+                    raise HttpError(
+                        httplib2.Response(
+                            {
+                                "status": response.status_code,
+                                "reason": response.reason,
+                                **response.headers,
+                            }
+                        ),
+                        response.content,
+                        uri=url,
+                    )
+            return response
+
+        # The download doesn't go through the service, so it is scheduled here
+        scheduler = scheduler_of(self._service)
+        try:
+            if scheduler is not None:
+                response = scheduler.run(
+                    get, quota_cost(ATTACHMENT_METHOD), method_id=ATTACHMENT_METHOD
+                )
+            else:
+                response = get()
+            with response:
+                yield from _json_data(response.iter_content(chunk_size))
+        finally:
+            if own_session:
+                session.close()
+
+    def save_to(
+        self,
+        path: str,
+        cache: AttachmentCache = None,
+        session=None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> str:
+        """
+        Downloads the attachment to a file, decoding it as it is received so
+        memory use doesn't grow with the size of the attachment.
+
+        Args:
+            path: The file to write, or a directory to write the attachment
+                into under its filename. A number is added to the filename
+                if a file with that name is in the directory.
+            cache: If given, the attachment is copied from the cache when it
+                was downloaded before, and added to it otherwise.
+            session: A `google.auth.transport.requests.AuthorizedSession` to
+                download with. By default the session of the 'session'
+                transport of the service is used, or a session is opened
+                with the credentials of the service.
+            chunk_size: How many bytes are read and decoded at a time.
+
+        Returns:
+            The path of the written file.
+
+        Raises:
+            googleapiclient.errors.HttpError: There was an error executing the
+                HTTP request.
+
+        """
+
+        reserved = os.path.isdir(path)
+        if reserved:
+            path = _reserve_path(path, os.path.basename(self.filename) or self.id)
+        cached = (
+            cache.get(self.message_id, self.part_id)
+            if cache is not None and self.part_id is not None
+            else None
+        )
+        if cached is not None:
+            shutil.copyfile(cached, path)
+            return path
+
+        # Write next to the target so a failed download leaves no partial file
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), suffix=".part"
+        )
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                if self.data is not None:
+                    file.write(self.data)
+                    digest = hashlib.sha256(self.data).hexdigest()
+                else:
+                    _, digest = _decode_to(self._chunks(session, chunk_size), file)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            if reserved:
+                os.unlink(path)
+            raise
+        if cache is not None and self.part_id is not None:
+            cache.add(self.message_id, self.part_id, path, digest)
+        return path
@@ -1,4 +1,32 @@
+import threading
+from weakref import WeakValueDictionary
+
+
 class Contact:
-    def __init__(self, email: str, name: str = None):
-        self.email = email
-        self.name = name
+    """
+    An email address and the name shown with it.
+
+    Contacts are interned: creating a contact with the same email and name as
+    one that is still alive returns that same instance, so the senders and
+    receivers of thousands of messages share a handful of objects. Contacts
+    are therefore treated as immutable.
+    """
+
+    __slots__ = ("email", "name", "__weakref__")
+
+    _interned: "WeakValueDictionary[tuple, Contact]" = WeakValueDictionary()
+    _lock = threading.Lock()
+
+    def __new__(cls, email: str, name: str = None):
+        key = (email, name)
+        with cls._lock:
+            contact = cls._interned.get(key)
+            if contact is None:
+                contact = super().__new__(cls)
+                contact.email = email
+                contact.name = name
+                cls._interned[key] = contact
+        return contact
+
+    def __repr__(self) -> str:
+        return f"Contact({self.email!r}, {self.name!r})"
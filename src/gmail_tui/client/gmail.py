@@ -1,15 +1,24 @@
 import base64
 import os.path
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Union
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-from gmail_tui.client.message import Message
+from gmail_tui.client.label import LabelCatalog
+from gmail_tui.client.message import BODY_FORMATS, METADATA_HEADERS, Message
+from gmail_tui.client.mutations import MutationQueue
+from gmail_tui.client.scheduler import (
+    Priority,
+    RequestScheduler,
+    is_retryable,
+    quota_cost,
+)
+from gmail_tui.client.search import parse_query
+from gmail_tui.client.store import MessageStore
 from gmail_tui.client.thread import Thread
+from gmail_tui.client.tracing import tracer
+from gmail_tui.client.transport import TRANSPORTS
 
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
@@ -17,12 +26,82 @@ SCOPES = [
 ]
 
 
+# Gmail accepts up to 100 calls per batch, but recommends keeping batches at
+# 50 or fewer to avoid being rate limited.
+BATCH_SIZE = 50
+MAX_WORKERS = 8
+# batchModify and batchDelete accept up to 1000 message ids per call
+MODIFY_CHUNK_SIZE = 1000
+
+
 class Gmail:
-    def __init__(self):
-        creds = self._authenticate()
-        self._service = build("gmail", "v1", credentials=creds)
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        store: MessageStore = None,
+        hydration: str = "batch",
+        max_workers: int = MAX_WORKERS,
+        scheduler: RequestScheduler = None,
+        transport: str = "httplib2",
+        service=None,
+    ):
+        """
+        Args:
+            batch_size: The number of threads or messages fetched per batch
+                request.
+            store: The on-disk cache of threads and messages.
+            hydration: How several threads or messages are fetched. 'batch'
+                sends them in batch requests, 'parallel' sends one request per
+                thread or message from a pool of `max_workers` threads.
+            max_workers: The number of threads used by 'parallel' hydration.
+            scheduler: Sends every request within the quota of the user and
+                retries the rate limited ones. Defaults to a scheduler with
+                the Gmail per-user quota.
+            transport: How requests are sent, one of `TRANSPORTS`.
+                'httplib2' gives every thread its own connection, 'session'
+                shares a pool of keep-alive connections between all threads.
+            service: A Gmail API service to use instead of authenticating and
+                building one, such as the stand-in of the benchmarks.
+        """
+
+        self.scheduler = scheduler or RequestScheduler()
+        if service is not None:
+            self.credentials = None
+            self._service = service
+        else:
+            # Imported here since the auth and discovery modules are slow to
+            # import and are only needed once the client is built
+            from googleapiclient.discovery import build
+
+            creds = self._authenticate()
+            self.credentials = creds
+            # Use the discovery document bundled with googleapiclient instead
+            # of fetching it. Both transports are thread-safe, so the service
+            # can be shared by the hydration pool and the UI workers
+            self._service = build(
+                "gmail",
+                "v1",
+                http=TRANSPORTS[transport](creds),
+                static_discovery=True,
+                requestBuilder=self.scheduler.build_request,
+            )
+        self.batch_size = batch_size
+        self.hydration = hydration
+        self.max_workers = max_workers
+        self._executor: Union[ThreadPoolExecutor, None] = None
+        self.store = store
+        self.label_catalog = LabelCatalog(self._service, store=store)
+        # History id of every listed thread, used to tell if the cached copy
+        # of a thread is still up to date
+        self._history_ids: dict[str, str] = {}
+        # Label changes sent in the background, see `MutationQueue`
+        self.mutations = MutationQueue(self)
 
     def _authenticate(self):
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
         creds = None
         if os.path.exists("token.json"):
             creds = Credentials.from_authorized_user_file("token.json", SCOPES)
@@ -38,14 +117,23 @@ class Gmail:
                 token.write(creds.to_json())
         return creds
 
-    def get_threads(
+    def list_threads(
         self,
         labels: Union[list[str], None] = None,
         page_token: str = "",
         query: str = None,
         max_results: int = 10,
         include_spam: bool = False,
-    ) -> (list[Thread], str):
+    ) -> (list[str], str):
+        """
+        Lists the ids of a page of threads without fetching the threads.
+
+        Returns:
+            The ids of the threads and the token of the next page, empty if
+            this is the last page.
+
+        """
+
         try:
             threads = (
                 self._service.users()
@@ -61,16 +149,475 @@ class Gmail:
                 .execute()
             )
             if "threads" not in threads:
-                return []
+                return [], ""
+
+            for thread in threads["threads"]:
+                self._history_ids[thread["id"]] = thread.get("historyId")
 
             return (
-                [Thread(self._service, thread["id"]) for thread in threads["threads"]],
+                [thread["id"] for thread in threads["threads"]],
                 threads["nextPageToken"] if "nextPageToken" in threads else "",
             )
 
         except HttpError as error:
             raise error
 
+    def get_threads(
+        self,
+        labels: Union[list[str], None] = None,
+        page_token: str = "",
+        query: str = None,
+        max_results: int = 10,
+        include_spam: bool = False,
+        message_format: str = "full",
+    ) -> (list[Thread], str):
+        thread_ids, next_page_token = self.list_threads(
+            labels=labels,
+            page_token=page_token,
+            query=query,
+            max_results=max_results,
+            include_spam=include_spam,
+        )
+        return list(self.iter_threads(thread_ids, message_format)), next_page_token
+
+    def get_thread(self, thread_id: str, message_format: str = "full") -> Thread:
+        return next(self.iter_threads([thread_id], message_format))
+
+    def iter_threads(
+        self,
+        thread_ids: list[str],
+        message_format: str = "full",
+        batch_size: int = None,
+    ) -> Iterator[Thread]:
+        """
+        Fetches several threads using the Gmail batch endpoint.
+
+        The threads are yielded as soon as the batch that contains them is
+        done, so callers can start using the first threads while the rest are
+        still being fetched. Threads that are up to date in the store are not
+        fetched again.
+
+        Args:
+            thread_ids: The ids of the threads to fetch.
+            message_format: The format of the fetched messages, 'full' or
+                'metadata'.
+            batch_size: The number of threads fetched per batch request.
+                Defaults to `Gmail.batch_size`.
+
+        Yields:
+            The hydrated threads, in the same order as `thread_ids`.
+
+        Raises:
+            googleapiclient.errors.HttpError: There was an error executing the
+                HTTP request.
+
+        """
+
+        if batch_size is None:
+            batch_size = self.batch_size
+        full = message_format == "full"
+
+        for start in range(0, len(thread_ids), batch_size):
+            chunk = thread_ids[start : start + batch_size]
+            responses = {}
+            if self.store is not None:
+                for thread_id in chunk:
+                    thread = self.store.get_thread(
+                        thread_id, full, self._history_ids.get(thread_id)
+                    )
+                    tracer.cache_lookup("store", thread is not None)
+                    if thread is not None:
+                        responses[thread_id] = thread
+
+            missing = [thread_id for thread_id in chunk if thread_id not in responses]
+            for thread in self._get_many("threads", missing, message_format):
+                responses[thread["id"]] = thread
+                if self.store is not None:
+                    self.store.save_thread(thread, full)
+
+            for thread_id in chunk:
+                yield Thread(
+                    self._service,
+                    thread_id,
+                    responses[thread_id],
+                    self.label_catalog,
+                    message_format,
+                    self.store,
+                )
+
+    def _get_many(
+        self, resource: str, ids: list[str], message_format: str
+    ) -> list[dict]:
+        """
+        Gets several threads or messages, in batch or in parallel depending on
+        `Gmail.hydration`.
+
+        Args:
+            resource: 'threads' or 'messages'.
+            ids: The ids of the threads or messages.
+            message_format: The format of the fetched messages.
+
+        Returns:
+            The thread or message resources, in the same order as `ids`.
+
+        """
+
+        if self.hydration == "parallel":
+            return self._get_parallel(resource, ids, message_format)
+        return self._get_batch(resource, ids, message_format)
+
+    def _get_request(self, resource: str, resource_id: str, message_format: str):
+        return getattr(self._service.users(), resource)().get(
+            userId="me",
+            id=resource_id,
+            format=message_format,
+            metadataHeaders=METADATA_HEADERS if message_format == "metadata" else None,
+        )
+
+    def _get_parallel(
+        self, resource: str, ids: list[str], message_format: str
+    ) -> list[dict]:
+        """Gets several threads or messages from a pool of threads"""
+        if not ids:
+            return []
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="gmail"
+            )
+        # The pool threads send the requests in the lane of the caller
+        priority = self.scheduler.priority
+
+        def get(resource_id: str) -> dict:
+            with self.scheduler.lane(priority):
+                return self._get_request(
+                    resource, resource_id, message_format
+                ).execute()
+
+        # map keeps the order of the ids
+        return list(self._executor.map(get, ids))
+
+    def _get_batch(
+        self, resource: str, ids: list[str], message_format: str
+    ) -> list[dict]:
+        """
+        Gets several threads or messages with a single batch request. The
+        calls that are rate limited are sent again in a new batch request,
+        after the backoff of the scheduler.
+
+        Args:
+            resource: 'threads' or 'messages'.
+            ids: The ids of the threads or messages.
+            message_format: The format of the fetched messages.
+
+        Returns:
+            The thread or message resources, in the same order as `ids`.
+
+        """
+
+        if not ids:
+            return []
+
+        responses = {}
+        failed = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                if not is_retryable(exception):
+                    raise exception
+                failed[request_id] = exception
+                return
+            responses[request_id] = response
+
+        def execute():
+            # A batch request is only sent once, the scheduler retries a
+            # batch that failed as a whole with a new one
+            failed.clear()
+            batch = self._service.new_batch_http_request(callback=callback)
+            for resource_id in remaining:
+                batch.add(
+                    self._get_request(resource, resource_id, message_format),
+                    request_id=resource_id,
+                )
+            batch.execute()
+
+        method_id = f"gmail.users.{resource}.get"
+        remaining = ids
+        for attempt in range(self.scheduler.max_retries + 1):
+            if attempt > 0:
+                self.scheduler.wait_to_retry(attempt - 1, next(iter(failed.values())))
+            self.scheduler.run(
+                execute,
+                quota_cost(method_id) * len(remaining),
+                method_id=method_id,
+            )
+            remaining = [
+                resource_id for resource_id in remaining if resource_id in failed
+            ]
+            if not remaining:
+                return [responses[resource_id] for resource_id in ids]
+        raise next(iter(failed.values()))
+
+    def get_cached_threads(
+        self, max_results: int = 10, offset: int = 0, message_format: str = "metadata"
+    ) -> list[Thread]:
+        """
+        Returns the newest threads saved in the store, without calling the API.
+        """
+
+        if self.store is None:
+            return []
+
+        threads = []
+        for thread_id in self.store.list_threads(max_results, offset):
+            thread = self.store.get_thread(thread_id, message_format == "full")
+            if thread is not None:
+                threads.append(
+                    Thread(
+                        self._service,
+                        thread_id,
+                        thread,
+                        self.label_catalog,
+                        message_format,
+                        self.store,
+                    )
+                )
+        return threads
+
+    def search_cached_threads(
+        self,
+        query: str,
+        max_results: int = 10,
+        offset: int = 0,
+        message_format: str = "metadata",
+    ) -> list[Thread]:
+        """
+        Returns the threads saved in the store that match a search query,
+        newest first, without calling the API. Only part of the Gmail search
+        syntax is supported, see `parse_query`.
+        """
+
+        if self.store is None:
+            return []
+
+        labels = {
+            label["name"].lower(): label["id"] for label in self.store.get_labels()
+        }
+        thread_ids = self.store.search_threads(
+            parse_query(query, labels), max_results, offset
+        )
+        threads = []
+        for thread_id in thread_ids:
+            thread = self.store.get_thread(thread_id, message_format == "full")
+            if thread is not None:
+                threads.append(
+                    Thread(
+                        self._service,
+                        thread_id,
+                        thread,
+                        self.label_catalog,
+                        message_format,
+                        self.store,
+                    )
+                )
+        return threads
+
+    def sync(self) -> Union[set[str], None]:
+        """
+        Applies the changes made to the mailbox since the last sync to the
+        store, using the history API.
+
+        New messages are fetched in 'metadata' format, label changes and
+        deletions are applied locally, so nothing is fetched again in full.
+        The requests are sent in the background lane of the scheduler.
+
+        Returns:
+            The ids of the threads that changed, or None if the last sync is
+            too old for the history API, in which case the store is cleared.
+
+        Raises:
+            googleapiclient.errors.HttpError: There was an error executing the
+                HTTP request.
+
+        """
+
+        if self.store is None:
+            return set()
+        with self.scheduler.lane(Priority.BACKGROUND):
+            return self._sync()
+
+    def _sync(self) -> Union[set[str], None]:
+        start_history_id = self.store.history_id
+        if start_history_id is None:
+            self._reset_history()
+            return set()
+
+        changed = {}
+        added = {}
+        deleted = set()
+        page_token = None
+        try:
+            while True:
+                history = (
+                    self._service.users()
+                    .history()
+                    .list(
+                        userId="me",
+                        startHistoryId=start_history_id,
+                        pageToken=page_token,
+                    )
+                    .execute()
+                )
+                for record in history.get("history", []):
+                    for change in record.get("messagesAdded", []):
+                        added[change["message"]["id"]] = change["message"]
+                    for change in record.get("messagesDeleted", []):
+                        deleted.add(change["message"]["id"])
+                    for change in record.get("labelsAdded", []) + record.get(
+                        "labelsRemoved", []
+                    ):
+                        message = change["message"]
+                        self.store.update_labels(
+                            message["id"], message.get("labelIds", [])
+                        )
+                        if message["id"] in added:
+                            added[message["id"]] = message
+                    for message in record.get("messages", []):
+                        changed[message["threadId"]] = record["id"]
+                page_token = history.get("nextPageToken")
+                if not page_token:
+                    break
+        except HttpError as error:
+            if error.resp.status == 404:
+                # The start history id is too old, the store can't be synced
+                self.store.clear()
+                self._reset_history()
+                return None
+            raise error
+
+        for message_id in deleted:
+            self.store.delete_message(message_id)
+            added.pop(message_id, None)
+
+        for message in self._get_many("messages", list(added), "metadata"):
+            # The labels of a message may have changed after it was added
+            message["labelIds"] = added[message["id"]].get(
+                "labelIds", message.get("labelIds", [])
+            )
+            self.store.save_message(message, full=False)
+
+        for thread_id, history_id in changed.items():
+            self.store.save_thread_history(thread_id, history_id)
+
+        self.store.history_id = history["historyId"]
+        return set(changed)
+
+    def _reset_history(self):
+        profile = self._service.users().getProfile(userId="me").execute()
+        self.store.history_id = profile["historyId"]
+
+    def batch_modify(
+        self,
+        message_ids: list[str],
+        add_labels: Union[list[str], None] = None,
+        remove_labels: Union[list[str], None] = None,
+    ):
+        """
+        Adds and removes labels of many messages with messages().batchModify,
+        sending one request per MODIFY_CHUNK_SIZE messages.
+
+        Raises:
+            googleapiclient.errors.HttpError: There was an error executing the
+                HTTP request. The chunks sent before the error were applied.
+
+        """
+
+        add_labels = [label.upper() for label in add_labels or []]
+        remove_labels = [label.upper() for label in remove_labels or []]
+        for start in range(0, len(message_ids), MODIFY_CHUNK_SIZE):
+            chunk = message_ids[start : start + MODIFY_CHUNK_SIZE]
+            try:
+                self._service.users().messages().batchModify(
+                    userId="me",
+                    body={
+                        "ids": chunk,
+                        "addLabelIds": add_labels,
+                        "removeLabelIds": remove_labels,
+                    },
+                ).execute()
+            except HttpError as error:
+                raise error
+            if self.store is not None:
+                self.store.modify_labels(chunk, add_labels, remove_labels)
+
+    def batch_delete(self, message_ids: list[str]):
+        """
+        Permanently deletes many messages with messages().batchDelete, sending
+        one request per MODIFY_CHUNK_SIZE messages. Needs the
+        https://mail.google.com/ scope.
+
+        Raises:
+            googleapiclient.errors.HttpError: There was an error executing the
+                HTTP request. The chunks sent before the error were deleted.
+
+        """
+
+        for start in range(0, len(message_ids), MODIFY_CHUNK_SIZE):
+            chunk = message_ids[start : start + MODIFY_CHUNK_SIZE]
+            try:
+                self._service.users().messages().batchDelete(
+                    userId="me", body={"ids": chunk}
+                ).execute()
+            except HttpError as error:
+                raise error
+            if self.store is not None:
+                for message_id in chunk:
+                    self.store.delete_message(message_id)
+
+    def modify_messages(
+        self,
+        messages: list[Message],
+        add_labels: Union[list[str], None] = None,
+        remove_labels: Union[list[str], None] = None,
+    ):
+        """
+        Adds and removes labels of many messages with `batch_modify`.
+
+        The `labels` of the messages are updated before the request is sent,
+        and restored if it fails.
+
+        Raises:
+            googleapiclient.errors.HttpError: There was an error executing the
+                HTTP request.
+
+        """
+
+        add_labels = [label.upper() for label in add_labels or []]
+        remove_labels = [label.upper() for label in remove_labels or []]
+        previous = [message.labels for message in messages]
+        for message in messages:
+            message.apply_labels(add_labels, remove_labels)
+        try:
+            self.batch_modify(
+                [message.id for message in messages], add_labels, remove_labels
+            )
+        except HttpError as error:
+            for message, labels in zip(messages, previous):
+                message.labels = labels
+            raise error
+
+    def modify_threads(
+        self,
+        threads: list[Thread],
+        add_labels: Union[list[str], None] = None,
+        remove_labels: Union[list[str], None] = None,
+    ):
+        """Adds and removes labels of every message of many threads at once"""
+        self.modify_messages(
+            [message for thread in threads for message in thread.messages],
+            add_labels,
+            remove_labels,
+        )
+
     def get_unread_threads(self) -> list[Thread]:
         return self.get_threads(labels=["UNREAD"])
 
@@ -89,7 +636,7 @@ class Gmail:
                 )
                 .execute()
             )
-            return Message(self._service, message["id"], message)
+            return Message(self._service, message["id"], message, self.label_catalog)
         except HttpError as error:
             raise error
 
@@ -100,6 +647,7 @@ class Gmail:
         query: str = None,
         max_results: int = 10,
         include_spam: bool = False,
+        message_format: str = "full",
     ) -> (list[Message], str):
         try:
             messages = (
@@ -116,16 +664,48 @@ class Gmail:
                 .execute()
             )
             if "messages" not in messages:
-                return []
+                return [], ""
             return (
-                [
-                    Message(self._service, message["id"])
-                    for message in messages["messages"]
-                ],
+                self._get_messages(
+                    [message["id"] for message in messages["messages"]],
+                    message_format,
+                ),
                 messages["nextPageToken"] if "nextPageToken" in messages else "",
             )
         except HttpError as error:
             raise error
 
+    def _get_messages(self, message_ids: list[str], message_format: str):
+        # The full payload of a cached message serves 'raw' too
+        full = message_format in BODY_FORMATS
+        responses = {}
+        if self.store is not None:
+            for message_id in message_ids:
+                message = self.store.get_message(message_id, full)
+                if message is not None:
+                    responses[message_id] = message
+
+        missing = [
+            message_id for message_id in message_ids if message_id not in responses
+        ]
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start : start + self.batch_size]
+            for message in self._get_many("messages", chunk, message_format):
+                responses[message["id"]] = message
+                if self.store is not None and "raw" not in message:
+                    self.store.save_message(message, full)
+
+        return [
+            Message(
+                self._service,
+                message_id,
+                responses[message_id],
+                self.label_catalog,
+                message_format,
+                self.store,
+            )
+            for message_id in message_ids
+        ]
+
     def get_unread_messages(self):
         return self.get_messages(labels=["UNREAD"])
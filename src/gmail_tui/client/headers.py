@@ -0,0 +1,84 @@
+import re
+from email.utils import getaddresses
+from functools import lru_cache
+from typing import Union
+
+from gmail_tui.client.contact import Contact
+
+# Address headers whose parsed contacts are kept, most mailboxes repeat a few
+# senders and recipient lists over and over
+ADDRESS_CACHE_SIZE = 4096
+# The common forms of an address, followed by a comma or the end of the
+# header: "Quoted, Name" <email>, Name <email> and a bare email. Headers with
+# anything else, such as comments or groups, are parsed by `getaddresses`.
+ADDRESS = re.compile(
+    r"""\s*(?:
+        (?:"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<name>[^"<>,;:()@]*?))
+        \s*<(?P<angle>[^<>\s]+)>
+        |(?P<bare>[^\s"<>,;:()]+@[^\s"<>,;:()]+)
+    )\s*(?:,|$)""",
+    re.VERBOSE,
+)
+QUOTED_PAIR = re.compile(r"\\(.)")
+
+
+def index_headers(headers: list[dict]) -> dict[str, str]:
+    """
+    Returns the values of the headers of a payload by case-folded name, such
+    as 'from' or 'subject'. A repeated header keeps its last value.
+    """
+    return {header["name"].casefold(): header["value"] for header in headers}
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def parse_addresses(value: str) -> tuple[Contact, ...]:
+    """
+    Parses the value of an address header, such as To or Cc, as RFC 5322
+    does, so quoted names with commas and groups are handled. The common
+    forms of addresses are matched with a precompiled expression.
+
+    Returns:
+        The contacts of the header, interned. Malformed addresses are
+        skipped.
+
+    """
+
+    contacts = []
+    position = 0
+    while position < len(value):
+        match = ADDRESS.match(value, position)
+        if match is None or match.end() == position:
+            # Not one of the common forms, let the full parser handle it
+            return tuple(
+                Contact(email, name or None)
+                for name, email in getaddresses([value])
+                if email
+            )
+        position = match.end()
+        if match["bare"] is not None:
+            contacts.append(Contact(match["bare"]))
+        else:
+            if match["quoted"] is not None:
+                name = QUOTED_PAIR.sub(r"\1", match["quoted"])
+            else:
+                # Whitespace within a name is folded, as getaddresses does
+                name = " ".join(match["name"].split())
+            contacts.append(Contact(match["angle"], name or None))
+    return tuple(contacts)
+
+
+def parse_address(value: str) -> Union[Contact, None]:
+    """
+    Parses the value of a single address header, such as From.
+
+    Returns:
+        The first contact of the header. If the header is malformed, its value
+        is used as the email, so the sender is still shown. None for an empty
+        header.
+
+    """
+
+    contacts = parse_addresses(value)
+    if contacts:
+        return contacts[0]
+    return Contact(value.strip()) if value.strip() else None
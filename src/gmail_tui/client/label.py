@@ -1,10 +1,29 @@
+import threading
+import time
+import weakref
 from typing import Union
 
 from googleapiclient.errors import HttpError
 
+from gmail_tui.client.store import MessageStore
+
 
 class Label:
-    def __init__(self, service, label_id):
+    __slots__ = (
+        "_service",
+        "id",
+        "name",
+        "message_list_visibility",
+        "label_list_visibility",
+        "type",
+        "messages_total",
+        "messages_unread",
+        "threads_total",
+        "threads_unread",
+        "color",
+    )
+
+    def __init__(self, service, label_id, raw_data=None):
         self._service = service
         self.id = label_id
         self.name: str
@@ -14,15 +33,19 @@ class Label:
         self.messages_total: int
         self.messages_unread: int
         self.threads_total: int
-        self.threads_nread: int
+        self.threads_unread: int
         self.color: Union[dict, None]
-        self.get_label_info()
+        self.get_label_info(label=raw_data)
 
-    def get_label_info(self):
+    def get_label_info(self, label=None):
         try:
-            label = (
-                self._service.users().labels().get(userId="me", id=self.id).execute()
-            )
+            if label is None:
+                label = (
+                    self._service.users()
+                    .labels()
+                    .get(userId="me", id=self.id)
+                    .execute()
+                )
             self.name = label["name"]
             self.message_list_visibility = (
                 label["messageListVisibility"]
@@ -33,10 +56,113 @@ class Label:
                 label["labelListVisibility"] if "labelListVisibility" in label else None
             )
             self.type = label["type"]
-            self.messages_total = label["messagesTotal"]
-            self.messages_unread = label["messagesUnread"]
-            self.threads_total = label["threadsTotal"]
-            self.threads_unread = label["threadsUnread"]
+            # labels().list does not include the counters, only labels().get
+            self.messages_total = label.get("messagesTotal")
+            self.messages_unread = label.get("messagesUnread")
+            self.threads_total = label.get("threadsTotal")
+            self.threads_unread = label.get("threadsUnread")
             self.color = label["color"] if "color" in label else None
         except HttpError as error:
             raise error
+
+
+class LabelCatalog:
+    """
+    Caches every label of the account so messages can resolve their label ids
+    without calling the API.
+
+    The whole catalog is loaded with a single labels().list call and reloaded
+    once `ttl` seconds have passed or when an unknown label id is requested.
+    The same `Label` object is handed out for a given id, so messages share
+    their labels and refreshing the catalog updates the labels already
+    attached to messages.
+
+    If a `MessageStore` is given, the catalog starts from the labels saved in
+    it and saves the labels it loads.
+    """
+
+    def __init__(self, service, ttl: float = 300, store: MessageStore = None):
+        self._service = service
+        self._store = store
+        self.ttl = ttl
+        self._labels: dict[str, Label] = {}
+        self._missing: set[str] = set()
+        self._loaded_at: Union[float, None] = None
+        self._lock = threading.RLock()
+        if store is not None and store.get_labels():
+            self._update(store.get_labels())
+
+    def _update(self, labels: list[dict]):
+        for label in labels:
+            if label["id"] in self._labels:
+                self._labels[label["id"]].get_label_info(label=label)
+            else:
+                self._labels[label["id"]] = Label(self._service, label["id"], label)
+        self._missing.clear()
+        self._loaded_at = time.monotonic()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def update(self, labels: list[dict]):
+        """Replaces the catalog with label resources fetched by the caller"""
+        with self._lock:
+            self._update(labels)
+        if self._store is not None:
+            self._store.save_labels(labels)
+
+    def refresh(self):
+        try:
+            labels = self._service.users().labels().list(userId="me").execute()
+            self.update(labels.get("labels", []))
+        except HttpError as error:
+            raise error
+
+    def get(self, label_id: str) -> Union[Label, None]:
+        """
+        Returns the label with the given id, or None if the account has no
+        such label.
+        """
+
+        # Workers resolve labels concurrently, only one of them reloads
+        with self._lock:
+            refreshed = False
+            if self.is_stale:
+                self.refresh()
+                refreshed = True
+            if label_id not in self._labels and label_id not in self._missing:
+                if not refreshed:
+                    self.refresh()
+                if label_id not in self._labels:
+                    # Don't reload the catalog again for this id until the ttl expires
+                    self._missing.add(label_id)
+            return self._labels.get(label_id)
+
+    def __iter__(self):
+        if self._loaded_at is None:
+            self.refresh()
+        return iter(list(self._labels.values()))
+
+
+# Catalogs of the messages and threads built without one, by service
+_shared_catalogs: "weakref.WeakKeyDictionary[object, LabelCatalog]" = (
+    weakref.WeakKeyDictionary()
+)
+_shared_lock = threading.Lock()
+
+
+def shared_catalog(service) -> LabelCatalog:
+    """
+    Returns the catalog shared by every message and thread of a service that
+    was built without a catalog, so they load the labels once.
+    """
+
+    with _shared_lock:
+        catalog = _shared_catalogs.get(service)
+        if catalog is None:
+            # The catalog only holds a proxy of the service, or it would keep
+            # its key alive. Messages using it hold the service themselves.
+            catalog = LabelCatalog(weakref.proxy(service))
+            _shared_catalogs[service] = catalog
+        return catalog
@@ -1,184 +1,320 @@
-import base64
 import html
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import NamedTuple, Union
 
-from bs4 import BeautifulSoup
 from googleapiclient.errors import HttpError
 
-from gmail_tui.client.attachment import Attachment
+from gmail_tui.client.attachment import Attachment, AttachmentCache
 from gmail_tui.client.contact import Contact
-from gmail_tui.client.label import Label
+from gmail_tui.client.headers import index_headers, parse_address, parse_addresses
+from gmail_tui.client.label import Label, LabelCatalog, shared_catalog
+from gmail_tui.client.mime import (
+    ALL_KINDS,
+    ATTACHMENT,
+    HTML,
+    PLAIN,
+    attachment_references,
+    email_headers,
+    join_text,
+    parse_raw,
+    walk_email,
+    walk_parts,
+)
+from gmail_tui.client.store import MessageStore
+from gmail_tui.client.tracing import tracer
+
+# Headers requested when a message is fetched in "metadata" format, enough to
+# render a row of the inbox table and to search the message by `to:` locally.
+METADATA_HEADERS = ["From", "To", "Cc", "Subject", "Date"]
+# Formats that fetch the body of a message
+BODY_FORMATS = ("full", "raw")
+
+
+class MessageHeader(NamedTuple):
+    """The part of a message shown in lists, available in every format"""
+
+    sender: Contact
+    receiver: tuple[Contact, ...]
+    subject: Union[str, None]
+    date: datetime
+    snippet: str
+    cc: tuple[Contact, ...] = ()
+    bcc: tuple[Contact, ...] = ()
+
+
+class MessageBody(NamedTuple):
+    """The decoded content of a message, only available in 'full' format"""
+
+    body: Union[str, None]
+    html: Union[str, None]
+    attachments: tuple[Attachment, ...]
 
 
 class Message:
-    def __init__(self, service, message_id, raw_data=None):
+    __slots__ = (
+        "_service",
+        "_store",
+        "_label_catalog",
+        "id",
+        "format",
+        "header",
+        "labels",
+        "_leaves",
+        "_parts",
+    )
+
+    def __init__(
+        self,
+        service,
+        message_id,
+        raw_data=None,
+        label_catalog: LabelCatalog = None,
+        message_format: str = "full",
+        store: MessageStore = None,
+    ):
+        """
+        Args:
+            service: The Gmail API service.
+            message_id: The id of the message.
+            raw_data: The message resource, if it was already fetched.
+            label_catalog: The catalog used to resolve the message labels.
+                Defaults to the catalog shared by the service, see
+                `shared_catalog`.
+            message_format: 'full' fetches and decodes the whole message, while
+                'metadata' only fetches the headers in METADATA_HEADERS. The
+                body of a 'metadata' message is fetched by `load`, or the
+                first time `content` is read. 'raw' fetches the whole message
+                as it was received, smaller than its 'full' payload, and
+                parses it locally. Messages fetched in 'raw' format are not
+                saved in the store, but their 'full' payload is read from it.
+        """
+
         self._service = service
+        self._store = store
+        self._label_catalog = (
+            label_catalog if label_catalog is not None else shared_catalog(service)
+        )
         self.id = message_id
-        self.sender: Contact
-        self.receiver: list[Contact] = []
-        self.subject = None
-        self.body: str
-        self.attachments = None
-        self.date = None
-        self.labels: list[Label]
-        self.snippet: str
+        self.format = message_format
+        self.header: MessageHeader = None
+        self.labels: tuple[Label, ...] = ()
+        # Leaf parts of a full or raw message, until all of them are decoded
+        self._leaves: Union[tuple[tuple[str, object], ...], None] = None
+        # Decoded parts, by kind, see `_decode`
+        self._parts: Union[dict, None] = None
         self.get_message_info(message=raw_data)
 
-    def _evaluate_message_payload(
-        self, payload: dict, attachments: str = "reference"
-    ) -> list[dict]:
+    @property
+    def is_loaded(self) -> bool:
+        return self.format in BODY_FORMATS
+
+    def load(self):
+        """Fetch the full message if only its metadata was fetched"""
+        if not self.is_loaded:
+            self.format = "full"
+            self.get_message_info()
+
+    @property
+    def content(self) -> MessageBody:
+        """The body of the message, fetched the first time it is needed"""
+        self.load()
+        return MessageBody(self.body, self.html, self.attachments)
+
+    @property
+    def sender(self) -> Contact:
+        return self.header.sender
+
+    @property
+    def receiver(self) -> tuple[Contact, ...]:
+        return self.header.receiver
+
+    @property
+    def subject(self) -> Union[str, None]:
+        return self.header.subject
+
+    @property
+    def date(self) -> datetime:
+        return self.header.date
+
+    @property
+    def snippet(self) -> str:
+        return self.header.snippet
+
+    @property
+    def cc(self) -> tuple[Contact, ...]:
+        return self.header.cc
+
+    @property
+    def bcc(self) -> tuple[Contact, ...]:
+        return self.header.bcc
+
+    @property
+    def body(self) -> Union[str, None]:
+        return self._decode(PLAIN)
+
+    @property
+    def html(self) -> Union[str, None]:
+        # The HTML is only converted when it is shown, see gmail_tui.render
+        return self._decode(HTML)
+
+    @property
+    def attachments(self) -> tuple[Attachment, ...]:
+        attachments = self._decode(ATTACHMENT)
+        return attachments if attachments is not None else ()
+
+    def _decode(self, kind: str):
         """
-        Recursively evaluates a message payload.
-
-        Args:
-            payload: The message payload object (response from Gmail API)..
-            attachments: Accepted values are 'ignore' which completely ignores
-                all attachments, 'reference' which includes attachment
-                information but does not download the data, and 'download' which
-                downloads the attachment data to store locally. Default
-                'reference'.
-
-        Returns:
-            A list of message parts.
-
-        Raises:
-            googleapiclient.errors.HttpError: There was an error executing the
-                HTTP request.
-
+        Decodes the parts of a kind of a full message the first time they
+        are read, so a message whose HTML is never shown never decodes it.
+        The leaf parts are dropped once every kind is decoded.
         """
 
-        if "attachmentId" in payload["body"]:  # if it's an attachment
-            if attachments == "ignore":
-                return []
-
-            att_id = payload["body"]["attachmentId"]
-            filename = payload["filename"]
-            if not filename:
-                filename = "unknown"
-
-            obj = {
-                "part_type": "attachment",
-                "filetype": payload["mimeType"],
-                "filename": filename,
-                "attachment_id": att_id,
-                "data": None,
-            }
-
-            if attachments == "reference":
-                return [obj]
-
-            else:  # attachments == 'download'
-                if "data" in payload["body"]:
-                    data = payload["body"]["data"]
-                else:
-                    res = (
-                        self._service.users()
-                        .messages()
-                        .attachments()
-                        .get(userId="me", messageId=self.id, id=att_id)
-                        .execute()
-                    )
-                    data = res["data"]
-
-                file_data = base64.urlsafe_b64decode(data)
-                obj["data"] = file_data
-                return [obj]
-
-        elif payload["mimeType"] == "text/html":
-            data = payload["body"]["data"]
-            data = base64.urlsafe_b64decode(data)
-            body = BeautifulSoup(data, "lxml", from_encoding="utf-8").body
-            return [{"part_type": "html", "body": str(body)}]
-
-        elif payload["mimeType"] == "text/plain":
-            data = payload["body"]["data"]
-            data = base64.urlsafe_b64decode(data)
-            body = data.decode("UTF-8")
-            return [{"part_type": "plain", "body": body}]
-
-        elif payload["mimeType"].startswith("multipart"):
-            ret = []
-            if "parts" in payload:
-                for part in payload["parts"]:
-                    ret.extend(self._evaluate_message_payload(part, attachments))
-            return ret
-
-        return []
+        parts, leaves = self._parts, self._leaves
+        if parts is not None and kind in parts:
+            return parts[kind]
+        if leaves is None:
+            return None
+        with tracer.span("message.decode", "parse", kind=kind):
+            if kind == ATTACHMENT:
+                value = tuple(
+                    Attachment(self._service, reference, self.id)
+                    for reference in attachment_references(leaves)
+                )
+            else:
+                value = join_text(leaves, kind)
+        if parts is None:
+            parts = self._parts = {}
+        parts[kind] = value
+        if len(parts) == len(ALL_KINDS):
+            self._leaves = None
+        return value
 
     def get_message_info(self, message=None):
         try:
+            if message is None and self._store is not None:
+                message = self._store.get_message(self.id, full=self.is_loaded)
+                tracer.cache_lookup("store", message is not None)
             if message is None:
                 message = (
                     self._service.users()
                     .messages()
-                    .get(userId="me", id=self.id)
+                    .get(
+                        userId="me",
+                        id=self.id,
+                        format=self.format,
+                        metadataHeaders=METADATA_HEADERS
+                        if self.format == "metadata"
+                        else None,
+                    )
                     .execute()
                 )
-            payload = message["payload"]
-            headers = payload["headers"]
-            self.date = datetime.fromtimestamp(float(message["internalDate"]) / 1000)
-            self.snippet = html.unescape(message["snippet"]).replace("\u200c ", "")
-            self.labels = [
-                Label(self._service, label_id) for label_id in message["labelIds"]
-            ]
-            self.body = None
-            self.html = None
-            self.attachments = []
-
-            for hdr in headers:
-                if hdr["name"].lower() == "from":
-                    sender = hdr["value"]
-                    sender_name = None
-                    sender_mail = sender.replace("<", "").replace(">", "")
-                    if sender.find("<") > 0:
-                        sender_name = sender[: sender.find("<") - 1]
-                        sender_mail = sender[sender.find("<") + 1 : sender.find(">")]
-                    self.sender = Contact(sender_mail, sender_name)
-                elif hdr["name"].lower() == "to":
-                    receivers = hdr["value"].split(", ")
-                    for receiver in receivers:
-                        receiver_name = None
-                        receiver_mail = receiver.replace("<", "").replace(">", "")
-                        if receiver.find("<") > 0:
-                            receiver_name = receiver[: receiver.find("<") - 1]
-                            receiver_mail = receiver[
-                                receiver.find("<") + 1 : receiver.find(">")
-                            ]
-                        self.receiver.append(Contact(receiver_mail, receiver_name))
-                elif hdr["name"].lower() == "subject":
-                    self.subject = hdr["value"]
-                elif hdr["name"].lower() == "cc":
-                    self.cc = hdr["value"].split(", ")
-                elif hdr["name"].lower() == "bcc":
-                    self.bcc = hdr["value"].split(", ")
-
-            parts = self._evaluate_message_payload(payload)
-            for part in parts:
-                if part["part_type"] == "plain":
-                    if self.body is None:
-                        self.body = part["body"]
-                    else:
-                        self.body += "\n" + part["body"]
-                elif part["part_type"] == "html":
-                    if self.html is None:
-                        self.html = part["body"]
-                    else:
-                        self.html += "<br/>" + part["body"]
-                elif part["part_type"] == "attachment":
-                    attm = Attachment(self._service, part)
-                    self.attachments.append(attm)
+                if self._store is not None and "raw" not in message:
+                    self._store.save_message(message, full=self.is_loaded)
+            with tracer.span("message.parse", "parse", format=self.format):
+                if "raw" in message:
+                    parsed = parse_raw(message["raw"])
+                    headers = index_headers(email_headers(parsed))
+                    leaves = tuple(walk_email(parsed))
+                else:
+                    payload = message["payload"]
+                    headers = index_headers(payload["headers"])
+                    leaves = tuple(walk_parts(payload)) if self.is_loaded else None
+                self.labels = tuple(
+                    self._label_catalog.get(label_id)
+                    for label_id in message["labelIds"]
+                )
+                self.header = MessageHeader(
+                    sender=parse_address(headers["from"])
+                    if "from" in headers
+                    else None,
+                    receiver=parse_addresses(headers.get("to", "")),
+                    subject=headers.get("subject"),
+                    date=datetime.fromtimestamp(float(message["internalDate"]) / 1000),
+                    snippet=html.unescape(message["snippet"]).replace("\u200c ", ""),
+                    cc=parse_addresses(headers.get("cc", "")),
+                    bcc=parse_addresses(headers.get("bcc", "")),
+                )
+
+                # Only the leaf parts are kept, they are decoded when read
+                self._parts = None
+                self._leaves = leaves
 
         except HttpError as error:
             raise error
 
+    def save_attachments(
+        self,
+        directory: str,
+        max_workers: int = 4,
+        cache: AttachmentCache = None,
+    ) -> list[str]:
+        """
+        Downloads every attachment of the message into a directory.
+
+        Args:
+            directory: The directory to write the attachments into.
+            max_workers: How many attachments are downloaded at once.
+            cache: The cache attachments are copied from when they were
+                downloaded before. See `Attachment.save_to`.
+
+        Returns:
+            The paths of the written files, in the order of `attachments`.
+
+        Raises:
+            googleapiclient.errors.HttpError: There was an error executing the
+                HTTP request.
+
+        """
+
+        attachments = self.content.attachments
+        if max_workers <= 1 or len(attachments) <= 1:
+            return [attachment.save_to(directory, cache) for attachment in attachments]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                executor.map(
+                    lambda attachment: attachment.save_to(directory, cache),
+                    attachments,
+                )
+            )
+
+    def has_label(self, label: str) -> bool:
+        return any(lbl is not None and lbl.id == label.upper() for lbl in self.labels)
+
+    def apply_labels(
+        self,
+        add_labels: Union[list[str], None] = None,
+        remove_labels: Union[list[str], None] = None,
+    ):
+        """Adds and removes labels locally, without calling the API"""
+        remove_labels = [label.upper() for label in remove_labels or []]
+        labels = [
+            label
+            for label in self.labels
+            if label is not None and label.id not in remove_labels
+        ]
+        for label_id in add_labels or []:
+            if not any(label.id == label_id.upper() for label in labels):
+                label = self._label_catalog.get(label_id.upper())
+                if label is not None:
+                    labels.append(label)
+        self.labels = tuple(labels)
+
+    def _save_labels(self):
+        if self._store is not None:
+            self._store.update_labels(
+                self.id, [label.id for label in self.labels if label is not None]
+            )
+
     def add_label(self, label: str):
         try:
             self._service.users().messages().modify(
                 userId="me", id=self.id, body={"addLabelIds": [f"{label.upper()}"]}
             ).execute()
 
-            if label.upper() not in self.labels:
-                self.labels.append(label.upper())
+            if not self.has_label(label):
+                self.labels += (self._label_catalog.get(label.upper()),)
+                self._save_labels()
 
         except HttpError as error:
             raise error
@@ -191,8 +327,12 @@ class Message:
                 body={"removeLabelIds": [f"{label.upper()}"]},
             ).execute()
 
-            if label.upper() in self.labels:
-                self.labels.remove(label.upper())
+            self.labels = tuple(
+                lbl
+                for lbl in self.labels
+                if lbl is not None and lbl.id != label.upper()
+            )
+            self._save_labels()
 
         except HttpError as error:
             raise error
@@ -213,8 +353,9 @@ class Message:
         try:
             self._service.users().messages().trash(userId="me", id=self.id).execute()
 
-            if "TRASH" not in self.labels:
-                self.labels.append("TRASH")
+            if not self.has_label("TRASH"):
+                self.labels += (self._label_catalog.get("TRASH"),)
+                self._save_labels()
         except HttpError as error:
             raise error
 
@@ -222,8 +363,12 @@ class Message:
         try:
             self._service.users().messages().untrash(userId="me", id=self.id).execute()
 
-            if "TRASH" in self.labels:
-                self.labels.remove("TRASH")
+            self.labels = tuple(
+                label
+                for label in self.labels
+                if label is not None and label.id != "TRASH"
+            )
+            self._save_labels()
 
         except HttpError as error:
             raise error
@@ -0,0 +1,170 @@
+import base64
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from typing import Iterable, Iterator, Union
+
+# Kinds of the leaf parts of a message payload
+PLAIN = "plain"
+HTML = "html"
+ATTACHMENT = "attachment"
+ALL_KINDS = frozenset((PLAIN, HTML, ATTACHMENT))
+# What the text parts of a kind are joined with
+SEPARATORS = {PLAIN: "\n", HTML: "<br/>"}
+
+
+def part_kind(part: dict) -> Union[str, None]:
+    """The kind of a leaf part, or None for multipart and unsupported parts"""
+    if "attachmentId" in part.get("body", ()):
+        return ATTACHMENT
+    mime_type = part.get("mimeType", "")
+    if mime_type == "text/plain":
+        return PLAIN
+    if mime_type == "text/html":
+        return HTML
+    return None
+
+
+def walk_parts(
+    payload: dict, kinds: Iterable[str] = ALL_KINDS
+) -> Iterator[tuple[str, dict]]:
+    """
+    Walks the parts of a message payload in a single pass, without recursion,
+    so deeply nested messages don't reach the recursion limit.
+
+    Nothing is decoded, the text of a part is decoded by `decode_text` when
+    the caller needs it.
+
+    Args:
+        payload: The message payload object (response from Gmail API).
+        kinds: The kinds of the parts yielded, PLAIN, HTML or ATTACHMENT.
+            The other parts are skipped.
+
+    Yields:
+        The kind and the part of every leaf part of one of `kinds`, in the
+        order they appear in the message.
+
+    """
+
+    kinds = frozenset(kinds)
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        kind = part_kind(part)
+        if kind is None:
+            if part.get("mimeType", "").startswith("multipart"):
+                # Reversed, so the first child is popped first
+                stack.extend(reversed(part.get("parts", ())))
+        elif kind in kinds:
+            yield kind, part
+
+
+def parse_raw(raw: str) -> EmailMessage:
+    """Parses the 'raw' field of a message fetched in 'raw' format"""
+    return BytesParser(policy=policy.default).parsebytes(base64.urlsafe_b64decode(raw))
+
+
+def email_headers(message: EmailMessage) -> list[dict]:
+    """The headers of a parsed message, as in a payload of the Gmail API"""
+    return [{"name": name, "value": str(value)} for name, value in message.items()]
+
+
+def email_part_kind(part: EmailMessage) -> Union[str, None]:
+    """Counterpart of `part_kind` for a part of a parsed message"""
+    # The Gmail API gives an attachment id to every part with a filename
+    if part.get_filename():
+        return ATTACHMENT
+    content_type = part.get_content_type()
+    if content_type == "text/plain":
+        return PLAIN
+    if content_type == "text/html":
+        return HTML
+    return None
+
+
+def walk_email(
+    message: EmailMessage, kinds: Iterable[str] = ALL_KINDS
+) -> Iterator[tuple[str, EmailMessage]]:
+    """
+    Counterpart of `walk_parts` for a message parsed by `parse_raw`. Its
+    parts are decoded by `decode_text` and `attachment_reference` too.
+    """
+
+    kinds = frozenset(kinds)
+    stack = [message]
+    while stack:
+        part = stack.pop()
+        kind = email_part_kind(part)
+        if kind is None:
+            if part.get_content_maintype() == "multipart":
+                stack.extend(reversed(part.get_payload()))
+        elif kind in kinds:
+            yield kind, part
+
+
+def _email_bytes(part: EmailMessage) -> bytes:
+    return part.get_payload(decode=True) or b""
+
+
+def decode_text(part: Union[dict, EmailMessage]) -> str:
+    """Decodes the text of a text/plain or text/html part"""
+    if isinstance(part, EmailMessage):
+        try:
+            # Decodes the transfer encoding and the charset of the part
+            return part.get_content()
+        except LookupError:
+            # An unknown charset
+            return _email_bytes(part).decode("UTF-8", errors="replace")
+    data = part.get("body", {}).get("data", "")
+    return base64.urlsafe_b64decode(data).decode("UTF-8", errors="replace")
+
+
+def join_text(parts: Iterable[tuple[str, dict]], kind: str) -> Union[str, None]:
+    """
+    Decodes the text parts of a kind, PLAIN or HTML, and joins them.
+
+    Args:
+        parts: Parts of any kind, as yielded by `walk_parts` or `walk_email`.
+        kind: PLAIN or HTML.
+
+    Returns:
+        The text of the parts, or None if there is no part of the kind.
+
+    """
+
+    texts = [decode_text(part) for part_kind, part in parts if part_kind == kind]
+    return SEPARATORS[kind].join(texts) if texts else None
+
+
+def attachment_reference(part: Union[dict, EmailMessage]) -> dict:
+    """
+    The reference to the attachment of a part, see `Attachment`. The
+    attachments of a parsed message have no attachment id, their data is
+    decoded from the message instead.
+    """
+
+    if isinstance(part, EmailMessage):
+        data = _email_bytes(part)
+        return {
+            "part_type": ATTACHMENT,
+            "filetype": part.get_content_type(),
+            "filename": part.get_filename(),
+            "attachment_id": None,
+            "part_id": None,
+            "size": len(data),
+            "data": data,
+        }
+    return {
+        "part_type": ATTACHMENT,
+        "filetype": part["mimeType"],
+        "filename": part.get("filename") or "unknown",
+        "attachment_id": part["body"]["attachmentId"],
+        "part_id": part.get("partId"),
+        "size": part["body"].get("size"),
+        "data": None,
+    }
+
+
+def attachment_references(parts: Iterable[tuple[str, dict]]) -> list[dict]:
+    """The references to the attachments among walked parts, not downloaded"""
+    return [attachment_reference(part) for kind, part in parts if kind == ATTACHMENT]
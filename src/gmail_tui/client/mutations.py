@@ -0,0 +1,212 @@
+import logging
+import threading
+from typing import Callable, NamedTuple, Union
+
+from gmail_tui.client.message import Message
+from gmail_tui.client.scheduler import Priority
+
+# Seconds changes wait in the queue, so changes made together are sent in
+# the same batchModify call
+FLUSH_DELAY = 1.0
+
+_logger = logging.getLogger(__name__)
+
+
+class PendingMutation(NamedTuple):
+    """The labels still to be added to and removed from a message"""
+
+    add: set[str]
+    remove: set[str]
+    # The labels of the message before it was changed, restored on failure
+    original: list[str]
+
+
+class MutationQueue:
+    """
+    Write-behind queue of label changes.
+
+    Changes are applied to the messages at once and sent in the background,
+    `delay` seconds later, with `Gmail.batch_modify`. The changes queued for
+    a message are collapsed into one, and messages with the same changes are
+    sent in the same call. If a call fails, with an HTTP, transport or
+    authentication error, the messages get back the labels they had and
+    `on_error` is called from the queue thread with the error and the ids of
+    the messages.
+
+    When the client has a store, the queued changes are saved in it and sent
+    when the next client is built, so they survive a crash.
+    """
+
+    def __init__(
+        self,
+        gmail,
+        delay: float = FLUSH_DELAY,
+        on_error: Callable[[Exception, list[str]], None] = None,
+    ):
+        self._gmail = gmail
+        self._store = gmail.store
+        self.delay = delay
+        self.on_error = on_error
+        self._condition = threading.Condition()
+        self._pending: dict[str, PendingMutation] = {}
+        self._messages: dict[str, Message] = {}
+        self._thread: Union[threading.Thread, None] = None
+        self._closed = False
+        if self._store is not None:
+            for message_id, add, remove, original in self._store.get_mutations():
+                self._pending[message_id] = PendingMutation(
+                    set(add), set(remove), original
+                )
+            if self._pending:
+                self._start()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="mutations", daemon=True
+            )
+            self._thread.start()
+
+    def modify(
+        self,
+        messages: list[Message],
+        add_labels: Union[list[str], None] = None,
+        remove_labels: Union[list[str], None] = None,
+    ):
+        """Adds and removes labels of messages now, and queues the request"""
+        add_labels = [label.upper() for label in add_labels or []]
+        remove_labels = [label.upper() for label in remove_labels or []]
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The mutation queue is closed")
+            for message in messages:
+                pending = self._pending.get(message.id)
+                if pending is None:
+                    pending = PendingMutation(
+                        set(), set(), [label.id for label in message.labels if label]
+                    )
+                    self._pending[message.id] = pending
+                message.apply_labels(add_labels, remove_labels)
+                message._save_labels()
+                self._messages[message.id] = message
+                pending.add.difference_update(remove_labels)
+                pending.add.update(add_labels)
+                pending.remove.difference_update(add_labels)
+                pending.remove.update(remove_labels)
+                labels = {label.id for label in message.labels if label}
+                if labels == set(pending.original):
+                    # The changes cancel out, there's nothing to send
+                    del self._pending[message.id]
+                    if self._store is not None:
+                        self._store.delete_mutations([message.id])
+                elif self._store is not None:
+                    self._store.save_mutation(
+                        message.id,
+                        sorted(pending.add),
+                        sorted(pending.remove),
+                        pending.original,
+                    )
+            self._start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._closed:
+                    # Let more changes arrive, they are sent together
+                    self._condition.wait(self.delay)
+                if not self._pending:
+                    if self._closed:
+                        return
+                    continue
+            self._flush()
+
+    def _flush(self):
+        with self._condition:
+            pending, self._pending = self._pending, {}
+            messages, self._messages = self._messages, {}
+
+        groups: dict[tuple[frozenset, frozenset], list[str]] = {}
+        for message_id, mutation in pending.items():
+            key = (frozenset(mutation.add), frozenset(mutation.remove))
+            groups.setdefault(key, []).append(message_id)
+
+        for (add_labels, remove_labels), message_ids in groups.items():
+            try:
+                with self._gmail.scheduler.lane(Priority.BACKGROUND):
+                    self._gmail.batch_modify(
+                        message_ids, sorted(add_labels), sorted(remove_labels)
+                    )
+            except Exception as error:
+                # The changes were taken out of the queue, they are lost unless
+                # the messages are rolled back, whatever the error
+                self._rollback(message_ids, pending, messages)
+                if self.on_error is not None:
+                    try:
+                        self.on_error(error, message_ids)
+                    except Exception:
+                        _logger.exception("Error handler of the mutation queue")
+                continue
+            if self._store is not None:
+                with self._condition:
+                    # Keep the changes queued again while the request was sent
+                    sent = [
+                        message_id
+                        for message_id in message_ids
+                        if message_id not in self._pending
+                    ]
+                self._store.delete_mutations(sent)
+
+    def _rollback(
+        self,
+        message_ids: list[str],
+        pending: dict[str, PendingMutation],
+        messages: dict[str, Message],
+    ):
+        with self._condition:
+            for message_id in message_ids:
+                original = pending[message_id].original
+                newer = self._pending.get(message_id)
+                if newer is not None:
+                    # Changes queued since then are applied on top of the
+                    # labels the message still has on the server
+                    self._pending[message_id] = newer._replace(original=original)
+                elif self._store is not None:
+                    self._store.delete_mutations([message_id])
+                if self._store is not None:
+                    self._store.update_labels(message_id, original)
+                message = messages.get(message_id) or self._messages.get(message_id)
+                if message is None:
+                    continue
+                message.apply_labels(
+                    original, [label.id for label in message.labels if label]
+                )
+                if newer is not None:
+                    message.apply_labels(newer.add, newer.remove)
+                    if self._store is not None:
+                        self._store.save_mutation(
+                            message_id,
+                            sorted(newer.add),
+                            sorted(newer.remove),
+                            original,
+                        )
+                message._save_labels()
+
+    def flush(self):
+        """Sends the queued changes now, from the calling thread"""
+        self._flush()
+
+    def close(self, timeout: float = None):
+        """Sends the queued changes and stops the queue"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
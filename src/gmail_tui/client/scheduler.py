@@ -0,0 +1,333 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from enum import IntEnum
+from typing import Callable, Iterator, TypeVar, Union
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from gmail_tui.client.tracing import tracer
+
+# Quota units of each method, from
+# https://developers.google.com/gmail/api/reference/quota
+QUOTA_COSTS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.labels.get": 1,
+    "gmail.users.labels.list": 1,
+    "gmail.users.labels.create": 5,
+    "gmail.users.labels.delete": 5,
+    "gmail.users.labels.patch": 5,
+    "gmail.users.labels.update": 5,
+    "gmail.users.messages.attachments.get": 5,
+    "gmail.users.messages.batchDelete": 50,
+    "gmail.users.messages.batchModify": 50,
+    "gmail.users.messages.delete": 10,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.import": 25,
+    "gmail.users.messages.insert": 25,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.modify": 5,
+    "gmail.users.messages.send": 100,
+    "gmail.users.messages.trash": 5,
+    "gmail.users.messages.untrash": 5,
+    "gmail.users.threads.delete": 20,
+    "gmail.users.threads.get": 10,
+    "gmail.users.threads.list": 10,
+    "gmail.users.threads.modify": 10,
+    "gmail.users.threads.trash": 10,
+    "gmail.users.threads.untrash": 10,
+}
+# Cost of the methods missing above
+DEFAULT_COST = 5
+# Gmail allows each user 250 quota units per second, as a moving average
+QUOTA_RATE = 250
+MAX_RETRIES = 5
+# Seconds waited before the first retry, doubled on every retry
+BASE_DELAY = 1.0
+MAX_DELAY = 32.0
+# Statuses of the errors worth retrying, besides 403 rate limit errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """Lanes of the scheduler, requests of lower lanes are sent first"""
+
+    INTERACTIVE = 0
+    PREFETCH = 1
+    BACKGROUND = 2
+
+
+def quota_cost(method_id: Union[str, None]) -> int:
+    """Returns the quota units of a method, such as 'gmail.users.threads.get'"""
+    return QUOTA_COSTS.get(method_id, DEFAULT_COST)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a request that failed with the error can be sent again"""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status in RETRY_STATUSES:
+        return True
+    return status == 403 and any(
+        reason in (error.content or b"") for reason in RATE_LIMIT_REASONS
+    )
+
+
+class RequestScheduler:
+    """
+    Sends every request to the Gmail API within the per-user quota.
+
+    Requests take their quota cost from a token bucket that refills at `rate`
+    units per second and holds up to `capacity` units. While a request waits
+    for units, requests of a lower `Priority` lane go first, so the rows the
+    user is waiting for are fetched before prefetches and syncs. A request
+    that fails with a rate limit or server error is sent again up to
+    `max_retries` times, after an exponential backoff with jitter. Each
+    request is timed by `tracer`, retries and waits included.
+
+    Services built by `Gmail` build their requests with `build_request`, so
+    `request.execute()` goes through the scheduler. Batch requests, which
+    are sent as one HTTP request, go through `run` with the cost of all of
+    their calls.
+
+    The clock, the sleep function and the random numbers of the jitter can
+    be replaced, to test the scheduler without waiting.
+    """
+
+    def __init__(
+        self,
+        rate: float = QUOTA_RATE,
+        capacity: float = None,
+        max_retries: int = MAX_RETRIES,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        jitter: Callable[[], float] = random.random,
+    ):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._sleep = sleep
+        self._jitter = jitter
+        self._condition = threading.Condition()
+        self._tokens = self.capacity
+        self._updated = clock()
+        # Tickets of the requests waiting for units, (priority, arrival)
+        self._waiting: list[tuple[int, int]] = []
+        self._tickets = itertools.count()
+        self._lane = contextvars.ContextVar("lane", default=Priority.INTERACTIVE)
+        # Quota units spent, retries and calls, by method id
+        self.units = 0
+        self.retries = 0
+        self.calls: Counter[str] = Counter()
+
+    @contextlib.contextmanager
+    def lane(self, priority: Priority) -> Iterator[None]:
+        """Sends the requests made in the block, in this thread, in a lane"""
+        token = self._lane.set(priority)
+        try:
+            yield
+        finally:
+            self._lane.reset(token)
+
+    @property
+    def priority(self) -> Priority:
+        """The lane of the requests made from the current thread"""
+        return self._lane.get()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def _poll(self, ticket: tuple[int, int], cost: float) -> Union[float, None]:
+        """
+        Takes the units of a waiting request if it is its turn. Call it with
+        the condition held.
+
+        Returns:
+            0 if the units were taken, the seconds until there are enough
+            units if it is the request's turn, otherwise None.
+
+        """
+
+        if self._waiting[0] != ticket:
+            return None
+        self._refill()
+        if self._tokens < cost:
+            return (cost - self._tokens) / self.rate
+        self._tokens -= cost
+        heapq.heappop(self._waiting)
+        self._condition.notify_all()
+        return 0
+
+    def _leave(self, ticket: tuple[int, int]):
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            self._condition.notify_all()
+
+    def acquire(self, cost: float, priority: Priority = None):
+        """Waits until `cost` quota units can be spent, and spends them"""
+        cost = min(cost, self.capacity)
+        priority = self.priority if priority is None else priority
+        with self._condition:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    wait = self._poll(ticket, cost)
+                    if wait == 0:
+                        return
+                    if wait is None:
+                        self._condition.wait()
+                        continue
+                    # Sleep without the lock, a request of a lower lane that
+                    # arrives meanwhile takes the turn
+                    self._condition.release()
+                    try:
+                        self._sleep(wait)
+                    finally:
+                        self._condition.acquire()
+            finally:
+                self._leave(ticket)
+
+    async def acquire_async(self, cost: float, priority: Priority = None):
+        """Counterpart of `acquire` that waits without blocking the loop"""
+        cost = min(cost, self.capacity)
+        priority = self.priority if priority is None else priority
+        with self._condition:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._poll(ticket, cost)
+                if wait == 0:
+                    return
+                # Poll again soon when it's another request's turn
+                await asyncio.sleep(0.01 if wait is None else wait)
+        finally:
+            with self._condition:
+                self._leave(ticket)
+
+    def _count(self, cost: float, method_id: Union[str, None]):
+        tracer.request()
+        with self._condition:
+            self.units += cost
+            if method_id is not None:
+                self.calls[method_id] += 1
+
+    def backoff(self, attempt: int, error: HttpError = None) -> float:
+        """
+        Returns the seconds to wait before retrying a request for the
+        `attempt`th time, counting from 0, and empties the bucket so the
+        other requests wait too.
+        """
+
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        # Half of the delay is random, so clients don't retry all at once
+        delay = delay / 2 + self._jitter() * delay / 2
+        retry_after = error.resp.get("retry-after") if error is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        with self._condition:
+            self._refill()
+            self._tokens = min(self._tokens, 0)
+            self.retries += 1
+        return delay
+
+    def wait_to_retry(self, attempt: int, error: HttpError = None):
+        """Sleeps the backoff of the `attempt`th retry of a request"""
+        self._sleep(self.backoff(attempt, error))
+
+    def run(
+        self,
+        function: Callable[[], T],
+        cost: float = DEFAULT_COST,
+        priority: Priority = None,
+        method_id: str = None,
+    ) -> T:
+        """
+        Calls a function that sends a request once its quota units can be
+        spent, retrying it while it fails with a retryable error.
+
+        Raises:
+            googleapiclient.errors.HttpError: The request failed with an error
+                that can't be retried, or failed `max_retries` times.
+
+        """
+
+        with tracer.span(method_id or "request", "api", cost=cost):
+            for attempt in itertools.count():
+                self.acquire(cost, priority)
+                self._count(cost, method_id)
+                try:
+                    return function()
+                except HttpError as error:
+                    if attempt >= self.max_retries or not is_retryable(error):
+                        raise error
+                    self.wait_to_retry(attempt, error)
+
+    async def run_async(
+        self,
+        function: Callable[[], T],
+        cost: float = DEFAULT_COST,
+        priority: Priority = None,
+        method_id: str = None,
+    ) -> T:
+        """Counterpart of `run` for a function that returns an awaitable"""
+        with tracer.span(method_id or "request", "api", cost=cost):
+            for attempt in itertools.count():
+                await self.acquire_async(cost, priority)
+                self._count(cost, method_id)
+                try:
+                    return await function()
+                except HttpError as error:
+                    if attempt >= self.max_retries or not is_retryable(error):
+                        raise error
+                    await asyncio.sleep(self.backoff(attempt, error))
+
+    def build_request(self, http, postproc, uri, **kwargs) -> "ScheduledRequest":
+        """`requestBuilder` of services whose requests go through the scheduler"""
+        return ScheduledRequest(self, http, postproc, uri, **kwargs)
+
+
+class ScheduledRequest(HttpRequest):
+    """`HttpRequest` that is sent through a `RequestScheduler`"""
+
+    def __init__(self, scheduler: RequestScheduler, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    def execute(self, http=None, num_retries=0):
+        return self.scheduler.run(
+            lambda: super(ScheduledRequest, self).execute(http, num_retries),
+            quota_cost(self.methodId),
+            method_id=self.methodId,
+        )
+
+
+def scheduler_of(service) -> Union[RequestScheduler, None]:
+    """Returns the scheduler the requests of a service go through, if any"""
+    builder = getattr(service, "_requestBuilder", None)
+    scheduler = getattr(builder, "__self__", None)
+    return scheduler if isinstance(scheduler, RequestScheduler) else None
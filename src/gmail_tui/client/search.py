@@ -0,0 +1,121 @@
+import re
+from datetime import datetime
+from typing import NamedTuple, Union
+
+# A term, optionally negated and prefixed by an operator, such as `subject:hi`
+# or `-from:"Jane Doe"`
+TERM = re.compile(r'(-)?(?:(\w+):)?("[^"]*"?|\S+)')
+# FTS column searched by each operator
+COLUMNS = {"from": "sender", "to": "recipients", "subject": "subject"}
+# Label checked by each `is:` operator, and whether the label must be present
+IS_LABELS = {
+    "unread": ("UNREAD", True),
+    "read": ("UNREAD", False),
+    "starred": ("STARRED", True),
+    "important": ("IMPORTANT", True),
+}
+# Label checked by each `in:` operator, other values are looked up like `label:`
+IN_LABELS = {
+    "inbox": "INBOX",
+    "sent": "SENT",
+    "draft": "DRAFT",
+    "drafts": "DRAFT",
+    "spam": "SPAM",
+    "trash": "TRASH",
+    "starred": "STARRED",
+    "important": "IMPORTANT",
+}
+DATE_FORMATS = ("%Y/%m/%d", "%Y-%m-%d", "%m/%d/%Y")
+
+
+class SearchQuery(NamedTuple):
+    """A Gmail search query, parsed to run against the local index"""
+
+    # FTS5 MATCH expressions of the messages to find and to leave out, None
+    # if the query has no such text terms
+    match: Union[str, None] = None
+    exclude: Union[str, None] = None
+    # Labels the messages must have, and must not have
+    labels: tuple[str, ...] = ()
+    excluded_labels: tuple[str, ...] = ()
+    # Bounds of the message dates, in milliseconds since the epoch
+    after: Union[int, None] = None
+    before: Union[int, None] = None
+
+
+def _phrase(value: str) -> str:
+    """Quotes a value as an FTS5 string, matching it as a prefix"""
+    value = value.strip('"')
+    if not value:
+        return ""
+    return '"' + value.replace('"', '""') + '"*'
+
+
+def _timestamp(value: str) -> Union[int, None]:
+    if value.isdigit():
+        return int(value) * 1000
+    for date_format in DATE_FORMATS:
+        try:
+            return int(datetime.strptime(value, date_format).timestamp() * 1000)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_query(query: str, labels: dict[str, str] = None) -> SearchQuery:
+    """
+    Parses the subset of the Gmail search syntax that the local index
+    supports: text terms, `from:`, `to:`, `subject:`, `is:unread`, `is:read`,
+    `is:starred`, `is:important`, `in:`, `label:`, `after:` and `before:`.
+    Any term can be negated with `-`. Other operators are searched as text.
+
+    Args:
+        query: The search query.
+        labels: Label ids by their lowercase name, to resolve `label:`.
+
+    Returns:
+        The parsed query.
+
+    """
+
+    labels = labels or {}
+    positive = []
+    negative = []
+    included = []
+    excluded = []
+    after = None
+    before = None
+    for negated, operator, value in TERM.findall(query):
+        operator = operator.lower()
+        if operator == "is" and value.lower() in IS_LABELS:
+            label_id, present = IS_LABELS[value.lower()]
+            (included if present != bool(negated) else excluded).append(label_id)
+        elif operator in ("in", "label"):
+            name = value.strip('"').lower()
+            label_id = labels.get(name) or labels.get(name.replace("-", " "))
+            if operator == "in":
+                label_id = IN_LABELS.get(name, label_id)
+            (excluded if negated else included).append(label_id or name.upper())
+        elif operator in ("after", "before") and _timestamp(value) is not None:
+            if operator == "after":
+                after = _timestamp(value)
+            else:
+                before = _timestamp(value)
+        else:
+            term = _phrase(value)
+            if operator in COLUMNS and term:
+                term = f"{COLUMNS[operator]} : {term}"
+            elif operator and term:
+                # Unsupported operators are searched as text
+                term = _phrase(f"{operator} {value.strip(chr(34))}")
+            if term:
+                (negative if negated else positive).append(term)
+
+    return SearchQuery(
+        " AND ".join(positive) or None,
+        " OR ".join(negative) or None,
+        tuple(included),
+        tuple(excluded),
+        after,
+        before,
+    )
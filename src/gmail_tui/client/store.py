@@ -0,0 +1,594 @@
+import base64
+import html
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Union
+
+from gmail_tui.client.search import SearchQuery
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS labels (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS threads (
+    id TEXT PRIMARY KEY,
+    history_id TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    history_id TEXT,
+    internal_date INTEGER NOT NULL,
+    snippet TEXT,
+    label_ids TEXT NOT NULL,
+    hidden INTEGER NOT NULL,
+    mime_type TEXT,
+    headers TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_thread ON messages (thread_id);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (internal_date);
+CREATE TABLE IF NOT EXISTS mutations (
+    message_id TEXT PRIMARY KEY,
+    add_labels TEXT NOT NULL,
+    remove_labels TEXT NOT NULL,
+    original_labels TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bodies (
+    message_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bodies_accessed ON bodies (accessed);
+"""
+
+# Full-text index of the messages, its rows are matched with messages by
+# the rowid of search_ids. Only created if SQLite was built with FTS5.
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_ids (
+    rowid INTEGER PRIMARY KEY,
+    message_id TEXT UNIQUE NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (
+    subject, sender, recipients, snippet, body,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Threads whose messages all have one of these labels are not listed, like
+# threads().list does unless includeSpamTrash is set.
+HIDDEN_LABELS = {"SPAM", "TRASH"}
+# Fraction of max_body_bytes the bodies are evicted down to
+EVICT_TO = 0.9
+# Headers indexed for search, by the column they go to
+SEARCH_HEADERS = {"from": "sender", "to": "recipients", "cc": "recipients"}
+TAG = re.compile(r"<[^>]*>")
+# Environment variable with the path of the store, see `open_store`
+CACHE_PATH_VARIABLE = "GMAIL_TUI_CACHE"
+
+
+def _body_text(payload: dict) -> str:
+    """Returns the text parts of a payload, or its HTML parts without tags"""
+    texts = []
+    htmls = []
+    parts = [payload]
+    while parts:
+        part = parts.pop()
+        mime_type = part.get("mimeType", "")
+        data = part.get("body", {}).get("data")
+        if data and mime_type in ("text/plain", "text/html"):
+            text = base64.urlsafe_b64decode(data).decode("UTF-8", errors="replace")
+            (texts if mime_type == "text/plain" else htmls).append(text)
+        parts.extend(reversed(part.get("parts", [])))
+    if texts:
+        return "\n".join(texts)
+    return html.unescape(TAG.sub(" ", " ".join(htmls)))
+
+
+class MessageStore:
+    """
+    On-disk SQLite cache of the threads, messages, labels and message bodies
+    fetched from the API, keyed by their Gmail ids.
+
+    Message metadata (headers, labels, snippet) is kept forever, while message
+    bodies are evicted, least recently used first, once they take more than
+    `max_body_bytes`.
+
+    When SQLite has FTS5, the subject, sender, recipients, snippet and text
+    body of every saved message are indexed, so `search_threads` can search
+    the cached mail. Evicted bodies stay in the index.
+    """
+
+    def __init__(self, path: str, max_body_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.max_body_bytes = max_body_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # The store is a cache, it's enough for commits to survive a crash of
+        # the app, which saves an fsync per commit
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(SCHEMA)
+        # Upper bound of the size of the bodies, so evict() only sums them up
+        # once they may take more than max_body_bytes
+        (self._body_bytes,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM bodies"
+        ).fetchone()
+        try:
+            self._db.executescript(SEARCH_SCHEMA)
+            self.searchable = True
+        except sqlite3.OperationalError:
+            # SQLite was built without FTS5, searches go to the server only
+            self.searchable = False
+        if self.searchable:
+            self._index_messages()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @property
+    def history_id(self) -> Union[str, None]:
+        """The history id the cache is up to date with"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'history_id'"
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    @history_id.setter
+    def history_id(self, value: str):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('history_id', ?)",
+                (value,),
+            )
+
+    def save_labels(self, labels: list[dict]):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM labels")
+            self._db.executemany(
+                "INSERT INTO labels (id, data) VALUES (?, ?)",
+                [(label["id"], json.dumps(label)) for label in labels],
+            )
+
+    def get_labels(self) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM labels").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def save_thread(self, thread: dict, full: bool):
+        """
+        Stores a thread resource and its messages.
+
+        Args:
+            thread: The thread resource (response from Gmail API).
+            full: Whether the messages were fetched in 'full' format, in
+                which case their bodies are stored too.
+
+        """
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO threads (id, history_id) VALUES (?, ?)",
+                (thread["id"], thread.get("historyId")),
+            )
+            for message in thread["messages"]:
+                self._save_message(message, full)
+        if full and self._body_bytes > self.max_body_bytes:
+            self.evict()
+
+    def save_message(self, message: dict, full: bool):
+        with self._lock, self._db:
+            self._save_message(message, full)
+        if full and self._body_bytes > self.max_body_bytes:
+            self.evict()
+
+    def _save_message(self, message: dict, full: bool):
+        payload = message["payload"]
+        label_ids = message.get("labelIds", [])
+        self._db.execute(
+            "INSERT OR REPLACE INTO messages (id, thread_id, history_id,"
+            " internal_date, snippet, label_ids, hidden, mime_type, headers)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                message["id"],
+                message["threadId"],
+                message.get("historyId"),
+                int(message["internalDate"]),
+                message.get("snippet", ""),
+                json.dumps(label_ids),
+                int(not HIDDEN_LABELS.isdisjoint(label_ids)),
+                payload.get("mimeType"),
+                json.dumps(payload.get("headers", [])),
+            ),
+        )
+        if full:
+            data = json.dumps(payload)
+            self._db.execute(
+                "INSERT OR REPLACE INTO bodies (message_id, payload, size, accessed)"
+                " VALUES (?, ?, ?, ?)",
+                (message["id"], data, len(data), time.time()),
+            )
+            self._body_bytes += len(data)
+        if self.searchable:
+            self._index_message(message, full)
+
+    def _index_messages(self):
+        """Indexes the messages cached before the index existed"""
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT m.id, m.thread_id, m.history_id, m.internal_date,"
+                " m.snippet, m.label_ids, m.mime_type, m.headers, b.payload"
+                " FROM messages m LEFT JOIN bodies b ON b.message_id = m.id"
+                " WHERE m.id NOT IN (SELECT message_id FROM search_ids)"
+            ).fetchall()
+            for row in rows:
+                payload = {"mimeType": row[6], "headers": json.loads(row[7])}
+                if row[8] is not None:
+                    payload = json.loads(row[8])
+                self._index_message(
+                    {"id": row[0], "snippet": row[4], "payload": payload},
+                    full=row[8] is not None,
+                )
+
+    def _index_message(self, message: dict, full: bool):
+        payload = message["payload"]
+        self._db.execute(
+            "INSERT OR IGNORE INTO search_ids (message_id) VALUES (?)",
+            (message["id"],),
+        )
+        (rowid,) = self._db.execute(
+            "SELECT rowid FROM search_ids WHERE message_id = ?", (message["id"],)
+        ).fetchone()
+        row = self._db.execute(
+            "SELECT body, recipients FROM search WHERE rowid = ?", (rowid,)
+        ).fetchone()
+        if full:
+            body = _body_text(payload)
+        else:
+            # Keep the body indexed when the message was fetched in full
+            body = row[0] if row is not None else ""
+        if row is not None:
+            self._db.execute("DELETE FROM search WHERE rowid = ?", (rowid,))
+        columns = {"subject": [], "sender": [], "recipients": []}
+        for header in payload.get("headers", []):
+            name = header["name"].lower()
+            if name == "subject":
+                columns["subject"].append(header["value"])
+            elif name in SEARCH_HEADERS:
+                columns[SEARCH_HEADERS[name]].append(header["value"])
+        if not columns["recipients"] and row is not None:
+            # Keep the recipients indexed when the message was fetched
+            # without its To and Cc headers
+            columns["recipients"].append(row[1])
+        self._db.execute(
+            "INSERT INTO search (rowid, subject, sender, recipients, snippet, body)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                rowid,
+                " ".join(columns["subject"]),
+                " ".join(columns["sender"]),
+                " ".join(columns["recipients"]),
+                html.unescape(message.get("snippet", "")),
+                body,
+            ),
+        )
+
+    def get_thread(
+        self, thread_id: str, full: bool, history_id: str = None
+    ) -> Union[dict, None]:
+        """
+        Rebuilds a thread resource from the cache.
+
+        Args:
+            thread_id: The id of the thread.
+            full: Whether the bodies of the messages are needed.
+            history_id: If given, the cached thread is only returned if it
+                was stored at this history id.
+
+        Returns:
+            The thread resource, or None if the thread (or any of its bodies
+            when `full` is set) is not cached.
+
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT history_id FROM threads WHERE id = ?", (thread_id,)
+            ).fetchone()
+            if row is None or (history_id is not None and row[0] != history_id):
+                return None
+            messages = self._get_messages(
+                "WHERE m.thread_id = ? ORDER BY m.internal_date", (thread_id,), full
+            )
+        if not messages or (full and any(m is None for m in messages)):
+            return None
+        return {"id": thread_id, "historyId": row[0], "messages": messages}
+
+    def get_message(self, message_id: str, full: bool) -> Union[dict, None]:
+        with self._lock:
+            messages = self._get_messages("WHERE m.id = ?", (message_id,), full)
+        return messages[0] if messages else None
+
+    def _get_messages(self, where: str, params: tuple, full: bool) -> list:
+        rows = self._db.execute(
+            "SELECT m.id, m.thread_id, m.history_id, m.internal_date, m.snippet,"
+            " m.label_ids, m.mime_type, m.headers, b.payload"
+            " FROM messages m LEFT JOIN bodies b ON b.message_id = m.id " + where,
+            params,
+        ).fetchall()
+        messages = []
+        for row in rows:
+            if full and row[8] is None:
+                messages.append(None)
+                continue
+            messages.append(
+                {
+                    "id": row[0],
+                    "threadId": row[1],
+                    "historyId": row[2],
+                    "internalDate": str(row[3]),
+                    "snippet": row[4],
+                    "labelIds": json.loads(row[5]),
+                    "payload": json.loads(row[8])
+                    if full
+                    else {"mimeType": row[6], "headers": json.loads(row[7])},
+                }
+            )
+        if full:
+            with self._db:
+                self._db.executemany(
+                    "UPDATE bodies SET accessed = ? WHERE message_id = ?",
+                    [(time.time(), message["id"]) for message in messages if message],
+                )
+        return messages
+
+    def list_threads(self, max_results: int = 10, offset: int = 0) -> list[str]:
+        """Returns the ids of the cached threads, newest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT thread_id FROM messages GROUP BY thread_id"
+                " HAVING SUM(hidden) < COUNT(*)"
+                " ORDER BY MAX(internal_date) DESC LIMIT ? OFFSET ?",
+                (max_results, offset),
+            ).fetchall()
+        return [thread_id for (thread_id,) in rows]
+
+    def search_threads(
+        self, query: SearchQuery, max_results: int = 10, offset: int = 0
+    ) -> list[str]:
+        """
+        Returns the ids of the cached threads with messages that match a
+        query, by their newest matching message.
+        """
+
+        if not self.searchable:
+            return []
+        where = []
+        params = []
+        if HIDDEN_LABELS.isdisjoint(query.labels):
+            # Like Gmail, spam and trash are only searched with `in:spam`
+            # or `in:trash`
+            where.append("m.hidden = 0")
+        if query.match is not None:
+            where.append(
+                "m.id IN (SELECT i.message_id FROM search_ids i"
+                " JOIN search ON search.rowid = i.rowid WHERE search MATCH ?)"
+            )
+            params.append(query.match)
+        if query.exclude is not None:
+            where.append(
+                "m.id NOT IN (SELECT i.message_id FROM search_ids i"
+                " JOIN search ON search.rowid = i.rowid WHERE search MATCH ?)"
+            )
+            params.append(query.exclude)
+        for label_id in query.labels:
+            where.append(
+                "EXISTS (SELECT 1 FROM json_each(m.label_ids) WHERE value = ?)"
+            )
+            params.append(label_id)
+        for label_id in query.excluded_labels:
+            where.append(
+                "NOT EXISTS (SELECT 1 FROM json_each(m.label_ids) WHERE value = ?)"
+            )
+            params.append(label_id)
+        if query.after is not None:
+            where.append("m.internal_date >= ?")
+            params.append(query.after)
+        if query.before is not None:
+            where.append("m.internal_date < ?")
+            params.append(query.before)
+        thread_ids = {}
+        with self._lock:
+            try:
+                # Walk the matches from the newest, so queries matching many
+                # messages stop as soon as the page is full
+                rows = self._db.execute(
+                    "SELECT m.thread_id FROM messages m WHERE "
+                    + " AND ".join(where)
+                    + " ORDER BY m.internal_date DESC",
+                    params,
+                )
+                for (thread_id,) in rows:
+                    thread_ids[thread_id] = None
+                    if len(thread_ids) >= offset + max_results:
+                        break
+            except sqlite3.OperationalError:
+                # The query is not valid FTS5 syntax
+                return []
+        return list(thread_ids)[offset:]
+
+    def update_labels(self, message_id: str, label_ids: list[str]):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE messages SET label_ids = ?, hidden = ? WHERE id = ?",
+                (
+                    json.dumps(label_ids),
+                    int(not HIDDEN_LABELS.isdisjoint(label_ids)),
+                    message_id,
+                ),
+            )
+
+    def modify_labels(
+        self, message_ids: list[str], add_labels: list[str], remove_labels: list[str]
+    ):
+        """Adds and removes labels of the cached messages with these ids"""
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT id, label_ids FROM messages WHERE id IN"
+                f" ({', '.join('?' * len(message_ids))})",
+                message_ids,
+            ).fetchall()
+            updates = []
+            for message_id, label_ids in rows:
+                label_ids = [
+                    label_id
+                    for label_id in json.loads(label_ids)
+                    if label_id not in remove_labels
+                ]
+                label_ids += [
+                    label_id for label_id in add_labels if label_id not in label_ids
+                ]
+                updates.append(
+                    (
+                        json.dumps(label_ids),
+                        int(not HIDDEN_LABELS.isdisjoint(label_ids)),
+                        message_id,
+                    )
+                )
+            self._db.executemany(
+                "UPDATE messages SET label_ids = ?, hidden = ? WHERE id = ?", updates
+            )
+
+    def save_mutation(
+        self,
+        message_id: str,
+        add_labels: list[str],
+        remove_labels: list[str],
+        original_labels: list[str],
+    ):
+        """Saves the label changes queued for a message, see MutationQueue"""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO mutations (message_id, add_labels,"
+                " remove_labels, original_labels) VALUES (?, ?, ?, ?)",
+                (
+                    message_id,
+                    json.dumps(add_labels),
+                    json.dumps(remove_labels),
+                    json.dumps(original_labels),
+                ),
+            )
+
+    def get_mutations(self) -> list[tuple[str, list[str], list[str], list[str]]]:
+        """Returns the queued label changes, as saved by `save_mutation`"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT message_id, add_labels, remove_labels, original_labels"
+                " FROM mutations"
+            ).fetchall()
+        return [
+            (message_id, json.loads(add), json.loads(remove), json.loads(original))
+            for message_id, add, remove, original in rows
+        ]
+
+    def delete_mutations(self, message_ids: list[str]):
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM mutations WHERE message_id = ?",
+                [(message_id,) for message_id in message_ids],
+            )
+
+    def save_thread_history(self, thread_id: str, history_id: str):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO threads (id, history_id) VALUES (?, ?)",
+                (thread_id, history_id),
+            )
+
+    def delete_message(self, message_id: str):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+            self._db.execute("DELETE FROM bodies WHERE message_id = ?", (message_id,))
+            if self.searchable:
+                self._db.execute(
+                    "DELETE FROM search WHERE rowid IN"
+                    " (SELECT rowid FROM search_ids WHERE message_id = ?)",
+                    (message_id,),
+                )
+                self._db.execute(
+                    "DELETE FROM search_ids WHERE message_id = ?", (message_id,)
+                )
+
+    def clear(self):
+        with self._lock, self._db:
+            for table in ("meta", "labels", "threads", "messages", "bodies"):
+                self._db.execute(f"DELETE FROM {table}")
+            if self.searchable:
+                self._db.execute("DELETE FROM search")
+                self._db.execute("DELETE FROM search_ids")
+            self._body_bytes = 0
+
+    def evict(self):
+        """
+        Drops the least recently used bodies once they take more than
+        `max_body_bytes`, until they take EVICT_TO of it, so that a full
+        cache doesn't evict on every save.
+        """
+
+        with self._lock, self._db:
+            (total,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM bodies"
+            ).fetchone()
+            self._body_bytes = total
+            if total <= self.max_body_bytes:
+                return
+            rows = self._db.execute(
+                "SELECT message_id, size FROM bodies ORDER BY accessed"
+            )
+            evicted = []
+            for message_id, size in rows:
+                if total <= self.max_body_bytes * EVICT_TO:
+                    break
+                evicted.append((message_id,))
+                total -= size
+            self._db.executemany("DELETE FROM bodies WHERE message_id = ?", evicted)
+            self._body_bytes = total
+
+
+def cache_path() -> str:
+    """
+    The path of the store of the app: the GMAIL_TUI_CACHE environment
+    variable if it is set, otherwise cache.db in the gmail-tui directory of
+    the user cache directory, so it doesn't depend on where the app is run.
+    """
+
+    path = os.environ.get(CACHE_PATH_VARIABLE)
+    if path:
+        return os.path.expanduser(path)
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "gmail-tui", "cache.db")
+
+
+def open_store(path: str = None, **kwargs) -> MessageStore:
+    """
+    Opens the store of the app at `path`, `cache_path()` by default, creating
+    its directory if needed. The other arguments go to `MessageStore`.
+    """
+
+    path = os.path.expanduser(path) if path else cache_path()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    return MessageStore(path, **kwargs)
@@ -1,30 +1,90 @@
 from googleapiclient.errors import HttpError
 
-from gmail_tui.client.message import Message
+from gmail_tui.client.label import LabelCatalog, shared_catalog
+from gmail_tui.client.message import METADATA_HEADERS, Message
+from gmail_tui.client.store import MessageStore
+from gmail_tui.client.tracing import tracer
 
 
 class Thread:
-    def __init__(self, service, thread_id):
+    __slots__ = (
+        "_service",
+        "_store",
+        "_label_catalog",
+        "id",
+        "format",
+        "messages",
+        "last_message",
+    )
+
+    def __init__(
+        self,
+        service,
+        thread_id,
+        raw_data=None,
+        label_catalog: LabelCatalog = None,
+        message_format: str = "full",
+        store: MessageStore = None,
+    ):
         self._service = service
+        self._store = store
+        self._label_catalog = (
+            label_catalog if label_catalog is not None else shared_catalog(service)
+        )
         self.id = thread_id
+        self.format = message_format
         self.messages: list[Message] = None
         self.last_message: Message = None
-        self.get_thread_info()
+        self.get_thread_info(thread=raw_data)
 
-    def get_thread_info(self):
+    def get_thread_info(self, thread=None):
         """Get the thread info from the API and store it in the object"""
         try:
-            thread = (
-                self._service.users().threads().get(userId="me", id=self.id).execute()
-            )
-            self.messages = [
-                Message(self._service, message["id"], message)
-                for message in thread["messages"]
-            ]
+            if thread is None and self._store is not None:
+                thread = self._store.get_thread(self.id, full=self.format == "full")
+                tracer.cache_lookup("store", thread is not None)
+            if thread is None:
+                thread = (
+                    self._service.users()
+                    .threads()
+                    .get(
+                        userId="me",
+                        id=self.id,
+                        format=self.format,
+                        metadataHeaders=METADATA_HEADERS
+                        if self.format == "metadata"
+                        else None,
+                    )
+                    .execute()
+                )
+                if self._store is not None:
+                    self._store.save_thread(thread, full=self.format == "full")
+            with tracer.span("thread.parse", "parse", format=self.format):
+                self.messages = [
+                    Message(
+                        self._service,
+                        message["id"],
+                        message,
+                        self._label_catalog,
+                        self.format,
+                        self._store,
+                    )
+                    for message in thread["messages"]
+                ]
             self.last_message = self.messages[-1]
         except HttpError as error:
             raise error
 
+    @property
+    def is_loaded(self) -> bool:
+        return all(message.is_loaded for message in self.messages)
+
+    def load(self):
+        """Fetch the full messages of the thread if only their metadata was fetched"""
+        if not self.is_loaded:
+            self.format = "full"
+            self.get_thread_info()
+
     def add_label(self, label: str) -> dict:
         try:
             thread = (
@@ -0,0 +1,215 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, NamedTuple, TypeVar, Union
+
+# Spans kept for the performance HUD of the interface
+MAX_SPANS = 500
+
+T = TypeVar("T")
+
+
+class Span(NamedTuple):
+    name: str
+    category: str
+    # Seconds since the tracer was created
+    start: float
+    duration: float
+    thread_id: int
+    # HTTP requests sent from the thread of the span while it lasted
+    requests: int
+    args: dict
+
+
+class _Timer:
+    """Context manager that records a span when its block ends"""
+
+    __slots__ = ("_tracer", "name", "category", "args", "_start", "_requests")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: dict):
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self) -> "_Timer":
+        self._requests = self._tracer._thread_requests()
+        self._start = self._tracer._clock()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        tracer = self._tracer
+        tracer.record(
+            Span(
+                self.name,
+                self.category,
+                self._start - tracer.origin,
+                tracer._clock() - self._start,
+                threading.get_ident(),
+                tracer._thread_requests() - self._requests,
+                self.args,
+            )
+        )
+        return False
+
+
+class Tracer:
+    """
+    Records how long the operations of the client and the interface take.
+
+    Every `span` is timed with `time.perf_counter` and kept in memory: the
+    last `max_spans` of them for the performance HUD, and all of them while
+    a trace is recorded, see `start_trace`, to write them to a file in the
+    Chrome trace format. The tracer also counts the HTTP requests sent and
+    the hits and misses of each cache.
+
+    It is shared by the whole application through `tracer`, and it is
+    thread-safe.
+    """
+
+    def __init__(
+        self, max_spans: int = MAX_SPANS, clock: Callable[[], float] = time.perf_counter
+    ):
+        self._clock = clock
+        self.origin = clock()
+        self.spans: deque[Span] = deque(maxlen=max_spans)
+        # Every span since `start_trace`, None when no trace is recorded
+        self.trace: Union[list[Span], None] = None
+        self.requests = 0
+        # Lookups of each cache, by (cache name, whether it was a hit)
+        self.lookups: Counter[tuple[str, bool]] = Counter()
+        self._thread_names: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, name: str, category: str = "", **args) -> _Timer:
+        """
+        Times the block of a `with` statement.
+
+        Args:
+            name: What the block does, shown in the HUD and the trace.
+            category: 'api', 'parse', 'render' or 'ui'. The HUD lists the
+                'ui' spans as operations and sums up the others.
+            args: Details of the span written to the trace, such as ids.
+        """
+        return _Timer(self, name, category, args)
+
+    def traced(self, name: str, category: str = "") -> Callable[[T], T]:
+        """Decorator that times every call of a function"""
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name, category):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def _thread_requests(self) -> int:
+        return getattr(self._local, "requests", 0)
+
+    def record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+            if self.trace is not None:
+                self.trace.append(span)
+                if span.thread_id not in self._thread_names:
+                    self._thread_names[span.thread_id] = threading.current_thread().name
+
+    def request(self):
+        """Counts an HTTP request sent from the current thread"""
+        self._local.requests = self._thread_requests() + 1
+        with self._lock:
+            self.requests += 1
+
+    def cache_lookup(self, cache: str, hit: bool):
+        """Counts a lookup of a cache, such as 'store' or 'render'"""
+        with self._lock:
+            self.lookups[(cache, hit)] += 1
+
+    def hit_rates(self) -> dict[str, float]:
+        """The share of the lookups of each cache that were hits"""
+        with self._lock:
+            caches = sorted({cache for cache, _ in self.lookups})
+            return {
+                cache: self.lookups[(cache, True)]
+                / (self.lookups[(cache, True)] + self.lookups[(cache, False)])
+                for cache in caches
+            }
+
+    def recent(self, count: int = None, category: str = None) -> list[Span]:
+        """The last spans, of a category if given, most recent first"""
+        with self._lock:
+            spans = list(self.spans)
+        spans.reverse()
+        if category is not None:
+            spans = [span for span in spans if span.category == category]
+        return spans[:count]
+
+    def start_trace(self):
+        """Keeps every span from now on, until the trace is written"""
+        with self._lock:
+            self.trace = []
+            self._thread_names = {}
+
+    def write_chrome_trace(self, path: str):
+        """
+        Writes the spans recorded since `start_trace` as a Chrome trace,
+        which chrome://tracing, Perfetto or speedscope can open.
+        """
+
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.trace or ())
+            thread_names = dict(self._thread_names)
+            lookups = dict(self.lookups)
+            requests = self.requests
+        events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": name},
+            }
+            for thread_id, name in thread_names.items()
+        ]
+        events += [
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                # Microseconds
+                "ts": round(span.start * 1e6, 3),
+                "dur": round(span.duration * 1e6, 3),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {**span.args, "requests": span.requests},
+            }
+            for span in spans
+        ]
+        with open(path, "w", encoding="UTF-8") as file:
+            json.dump(
+                {
+                    "traceEvents": events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {
+                        "requests": requests,
+                        "cache_lookups": {
+                            f"{cache} {'hits' if hit else 'misses'}": count
+                            for (cache, hit), count in sorted(lookups.items())
+                        },
+                    },
+                },
+                file,
+                default=str,
+            )
+
+
+# The tracer of the application
+tracer = Tracer()
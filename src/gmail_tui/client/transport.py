@@ -0,0 +1,105 @@
+import threading
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import build_http
+
+# Connections SessionHttp keeps open to each host
+POOL_SIZE = 10
+# Seconds to wait for a response, as build_http does
+TIMEOUT = 60
+# Headers that describe the body as it was sent, not as it is returned
+ENCODING_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class ThreadLocalHttp:
+    """
+    Authorized `httplib2.Http` that can be shared by several threads.
+
+    `httplib2.Http` is not thread-safe, so every thread that sends a request
+    through this object gets its own authorized `Http`, created the first
+    time the thread uses it. A service built with it can be used from a
+    thread pool or from Textual workers.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self._local = threading.local()
+
+    def _http(self) -> AuthorizedHttp:
+        if not hasattr(self._local, "http"):
+            self._local.http = AuthorizedHttp(self.credentials, http=build_http())
+        return self._local.http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+
+class SessionHttp:
+    """
+    `httplib2.Http` look-alike that sends requests with a
+    `google.auth.transport.requests.AuthorizedSession`.
+
+    The session keeps a pool of up to `pool_size` keep-alive connections per
+    host that every thread shares, so a request reuses an open connection
+    even when it is sent from a new thread, as Textual workers are. Responses
+    are gzip-compressed and decompressed by `requests`.
+    """
+
+    def __init__(self, credentials, pool_size: int = POOL_SIZE, timeout=TIMEOUT):
+        # Imported here like the other auth transports, see `Gmail.__init__`
+        from google.auth.transport.requests import AuthorizedSession
+        from requests.adapters import HTTPAdapter
+
+        self.credentials = credentials
+        self.timeout = timeout
+        self.session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body=None,
+        headers: dict = None,
+        redirections: int = 5,
+        connection_type=None,
+    ) -> (httplib2.Response, bytes):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        # googleapiclient adds the credentials of an http to some requests
+        # itself, the session adds its own, refreshed when they expire
+        headers = {
+            key: value
+            for key, value in (headers or {}).items()
+            if key.lower() != "authorization"
+        }
+        response = self.session.request(
+            method,
+            uri,
+            data=body,
+            headers=headers,
+            timeout=self.timeout,
+            allow_redirects=redirections > 0,
+        )
+        # The content is already decompressed
+        info = {
+            key.lower(): value
+            for key, value in response.headers.items()
+            if key.lower() not in ENCODING_HEADERS
+        }
+        info["status"] = response.status_code
+        info["reason"] = response.reason
+        return httplib2.Response(info), response.content
+
+    def close(self):
+        self.session.close()
+
+
+# Transports `Gmail` can send requests with, by name
+TRANSPORTS = {"httplib2": ThreadLocalHttp, "session": SessionHttp}
@@ -1,16 +1,37 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
+from typing import Callable, Iterable, NamedTuple, Union
 
+from rich.console import Group
+from rich.table import Table
 from rich.text import Text
-from textual import events
+from textual import events, work
 from textual.app import App, Binding, ComposeResult
 from textual.containers import VerticalScroll
 from textual.coordinate import Coordinate
 from textual.screen import ModalScreen, Screen
+from textual.timer import Timer
 from textual.widgets import DataTable, Footer, Input, Label, Markdown, Static
+from textual.worker import Worker, get_current_worker
 
-from gmail_tui.client import Contact, Gmail, Thread
+from gmail_tui.client import Contact, Gmail, Priority, Thread
+from gmail_tui.client.store import open_store
+from gmail_tui.client.tracing import tracer
+from gmail_tui.pages import PageCache, TableView
+from gmail_tui.render import RenderCache
 
-gmail = Gmail()
+_logger = logging.getLogger(__name__)
+
+# Seconds the search query must stay unchanged before it is searched
+SEARCH_DEBOUNCE = 0.3
+# Operations listed by the performance HUD
+HUD_OPERATIONS = 10
+# Seconds between updates of the performance HUD while it is shown
+HUD_INTERVAL = 0.5
 
 
 def parse_date(date: datetime, short_format: bool = True) -> str:
@@ -56,6 +77,31 @@ def parse_contact(contact: Contact) -> str:
         return contact.name + " <" + contact.email + ">"
 
 
+class ThreadRow(NamedTuple):
+    """What the inbox table shows of a thread"""
+
+    id: str
+    sender: str
+    subject: str
+    snippet: str
+    date: datetime
+    unread: bool
+
+    @classmethod
+    def from_thread(cls, thread: Thread) -> "ThreadRow":
+        message = thread.last_message
+        return cls(
+            thread.id,
+            message.sender.name
+            if message.sender.name is not None
+            else message.sender.email,
+            message.subject,
+            message.snippet,
+            message.date,
+            message.has_label("UNREAD"),
+        )
+
+
 class ThreadScreen(Screen):
     BINDINGS = [("escape", "app.pop_screen", "Go Back")]
 
@@ -103,7 +149,7 @@ class ThreadScreen(Screen):
                 classes="mail-screen-attr",
             ),
             Label("-------------------------------", classes="mail-screen-attr"),
-            Markdown(self.mail.body),
+            Markdown(self.app.render_cache.render(self.mail)),
             classes="mail-screen",
         )
         yield Footer()
@@ -118,9 +164,24 @@ class ThreadScreen(Screen):
 class SearchScreen(ModalScreen[str]):
     BINDINGS = [("escape", "app.pop_screen", "Go Back")]
 
-    def __init__(self, search_query: str = ""):
+    def __init__(
+        self,
+        search_query: str = "",
+        on_change: Callable[[str], None] = None,
+        debounce: float = SEARCH_DEBOUNCE,
+    ):
+        """
+        Args:
+            search_query: The query the input starts with.
+            on_change: Called with the query as it is typed, once it has not
+                changed for `debounce` seconds.
+            debounce: Seconds to wait after the last keystroke.
+        """
         super().__init__(search_query)
         self.search_query = search_query
+        self.on_change = on_change
+        self.debounce = debounce
+        self._timer: Union[Timer, None] = None
 
     def compose(self) -> ComposeResult:
         yield Input(
@@ -128,39 +189,196 @@ class SearchScreen(ModalScreen[str]):
             value=self.search_query,
         )
 
+    def on_input_changed(self, event: Input.Changed) -> None:
+        if self.on_change is None:
+            return
+        # Restart the wait on every keystroke
+        if self._timer is not None:
+            self._timer.stop()
+        value = event.value
+        self._timer = self.set_timer(self.debounce, lambda: self.on_change(value))
+
     def key_enter(self) -> None:
+        if self._timer is not None:
+            self._timer.stop()
         self.dismiss(self.query_one(Input).value)
 
 
+class PerformanceHud(Static):
+    """
+    Shows the latency and requests of the last operations of the interface,
+    the time spent in each stage of the client, such as API calls and
+    parsing, the requests sent and the hit rate of each cache. The numbers
+    come from `tracer` and are updated while the HUD is shown.
+    """
+
+    def __init__(self, operations: int = HUD_OPERATIONS):
+        super().__init__(classes="hud")
+        self.operations = operations
+
+    def on_mount(self) -> None:
+        self.display = False
+        self.timer = self.set_interval(HUD_INTERVAL, self.update_stats, pause=True)
+
+    def toggle(self) -> None:
+        self.display = not self.display
+        if self.display:
+            self.update_stats()
+            self.timer.resume()
+        else:
+            self.timer.pause()
+
+    def update_stats(self) -> None:
+        operations = Table("Operation", "ms", "Requests", box=None, padding=(0, 1))
+        for span in tracer.recent(self.operations, "ui"):
+            operations.add_row(
+                span.name, f"{span.duration * 1000:.1f}", str(span.requests)
+            )
+
+        # Stages of the recent spans, (count, total seconds) by name
+        stages: dict[str, list] = {}
+        for span in tracer.recent():
+            if span.category != "ui":
+                stage = stages.setdefault(span.name, [0, 0.0])
+                stage[0] += 1
+                stage[1] += span.duration
+        totals = Table("Stage", "Calls", "Mean ms", box=None, padding=(0, 1))
+        for name, (count, seconds) in sorted(
+            stages.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            totals.add_row(name, str(count), f"{seconds / count * 1000:.1f}")
+
+        summary = Text(f"{tracer.requests} requests")
+        for cache, rate in tracer.hit_rates().items():
+            summary.append(f"\n{cache} cache: {rate:.0%} hits")
+        self.update(Group(operations, Text(), totals, Text(), summary))
+
+
 class LoadingScreen(Screen):
     def compose(self) -> ComposeResult:
         yield Label("Loading...")
 
+    def on_screen_resume(self) -> None:
+        # Loading finished while another screen was pushed over this one. The
+        # event may also arrive after the screen was popped.
+        if self.app.loading_screen is not self and self.is_current:
+            self.dismiss()
+
 
 class Main(App):
     BINDINGS = [
         Binding("q", "quit", "Quit"),
         Binding("d", "toggle_dark", "Toggle dark mode"),
         Binding("/", "show_search", "Search"),
+        Binding("left_square_bracket", "back", "Back"),
+        Binding("right_square_bracket", "forward", "Forward"),
+        Binding("space", "toggle_selection", "Select"),
+        Binding("r", "mark_read", "Read"),
+        Binding("u", "mark_unread", "Unread"),
+        Binding("a", "archive", "Archive"),
+        Binding("t", "trash", "Trash"),
+        Binding("p", "toggle_hud", "Performance"),
     ]
 
     CSS_PATH = "style.css"
 
+    def __init__(
+        self,
+        gmail_factory: Callable[[], Gmail] = None,
+        prefetch_pages: int = 1,
+        prefetch_depth: int = 1,
+        prefetch_budget: int = 3,
+        thread_window: int = 100,
+        render_cache_size: int = 4 * 1024 * 1024,
+        page_cache_size: int = 16,
+        search_debounce: float = SEARCH_DEBOUNCE,
+        table_cache_size: int = 1024 * 1024,
+        table_cache_ttl: float = 300,
+    ):
+        """
+        Args:
+            gmail_factory: Builds the Gmail client. It is called the first
+                time the client is needed, from a worker, since building it
+                may authenticate over the network. Defaults to a client that
+                caches mail in the store of `open_store`.
+            prefetch_pages: How many pages after the last one shown are
+                fetched in the background. 0 disables page prefetching.
+            prefetch_depth: How many rows above and below the cursor have
+                their full thread fetched in the background.
+            prefetch_budget: The maximum number of threads fetched each time
+                the cursor moves. 0 disables thread prefetching.
+            thread_window: How many rows around the cursor keep their
+                `Thread` in memory. The other rows only keep what the table
+                shows, and their thread is fetched again when opened.
+            render_cache_size: How many characters of rendered message
+                bodies are kept, so reopening a message doesn't convert its
+                HTML again.
+            page_cache_size: How many pages of rows are kept, by search
+                query and page token, so going back to a recent search or
+                loading a prefetched page needs no request.
+            search_debounce: Seconds the search query must stay unchanged
+                while it is typed before it is searched.
+            table_cache_size: How many bytes of rows, roughly, are kept of
+                the tables of recent search queries, so going back to one
+                restores its rows and scroll position without requests.
+            table_cache_ttl: Seconds a kept table or page is shown for
+                before it is fetched again.
+        """
+        super().__init__()
+        self.prefetch_pages = prefetch_pages
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_budget = prefetch_budget
+        self.thread_window = thread_window
+        self.render_cache = RenderCache(render_cache_size)
+        self.page_cache_size = page_cache_size
+        self.search_debounce = search_debounce
+        # Rows of the recent pages, shown and fetched ahead, by search query
+        # and page token, least recently used first, with when they were
+        # fetched. Their threads are in `threads` while they are around the
+        # cursor, like the rows of any other page.
+        self.pages: OrderedDict[
+            tuple[Union[str, None], str], tuple[tuple[ThreadRow, ...], str, float]
+        ] = OrderedDict()
+        self.views = PageCache(table_cache_size, table_cache_ttl)
+        self._gmail_factory = gmail_factory or (lambda: Gmail(store=open_store()))
+        self._gmail: Union[Gmail, None] = None
+        self._gmail_lock = threading.Lock()
+        # Threads being fetched by a worker, by id, see `get_thread`
+        self._thread_loads: dict[str, Future] = {}
+        self._thread_loads_lock = threading.Lock()
+
+    @property
+    def gmail(self) -> Gmail:
+        with self._gmail_lock:
+            if self._gmail is None:
+                started = time.perf_counter()
+                self._gmail = self._gmail_factory()
+                self._gmail.mutations.on_error = self.mutation_failed
+                _logger.debug(
+                    "Gmail client built in %.3fs", time.perf_counter() - started
+                )
+        return self._gmail
+
     def compose(self) -> ComposeResult:
         yield DataTable(classes="table")
+        yield PerformanceHud()
         yield Footer()
 
     def on_mount(self) -> None:
-        self.push_screen(LoadingScreen())
         self.max_results = 25
+        # Rows are added every time a batch of this many threads is fetched
+        self.stream_batch_size = 5
         self.next_page_token = ""
         self.search_query = None
-        self.threads, self.next_page_token = gmail.get_threads(
-            max_results=self.max_results,
-            page_token=self.next_page_token,
-            query=self.search_query,
-        )
-        self.pop_screen()
+        # Searched queries, for going back and forward
+        self.history: list[Union[str, None]] = [None]
+        self.history_index = 0
+        self.rows: list[ThreadRow] = []
+        # Threads of the rows around the cursor, by id
+        self.threads: dict[str, Thread] = {}
+        # Ids of the threads selected for a bulk action
+        self.selected: set[str] = set()
+        self.loading_screen: Union[LoadingScreen, None] = None
         self.table = self.query_one(DataTable)
         self.table.cursor_type = "row"
         self.table.add_column("", key="is_unread", width=1)
@@ -168,41 +386,365 @@ class Main(App):
         self.table.add_column("Subject", key="subject", width=20)
         self.table.add_column("Date", key="date", width=None)
         self.table.columns["subject"].auto_width = False
+        self.table.columns["subject"].width = self.size.width - 37
         self.table.action_select_cursor = self.action_select_cursor
-        self.add_threads(self.threads)
+        self.show_loading()
+        self.load_threads(from_cache=True)
+
+    def show_loading(self) -> None:
+        if self.loading_screen is None:
+            self.loading_screen = LoadingScreen()
+            self.push_screen(self.loading_screen)
+
+    def hide_loading(self) -> None:
+        """Removes the loading screen, but not a screen pushed over it"""
+        screen = self.loading_screen
+        if screen is not None:
+            self.loading_screen = None
+            if self.screen is screen:
+                self.pop_screen()
+
+    @work(thread=True, exclusive=True, group="threads")
+    @tracer.traced("load page", "ui")
+    def load_threads(self, page_token: str = "", from_cache: bool = False) -> None:
+        """
+        Fetch a page of threads, adding each row as soon as it is fetched.
+
+        With `from_cache`, the threads saved by the last session are shown
+        first, then the store is synced and the rows are replaced only if the
+        first page changed. The first page of a search shows the matching
+        threads of the store the same way while the server is searched.
+        """
+        worker = get_current_worker()
+        started = time.perf_counter()
+        query = self.search_query
+        cached = []
+        changed = set()
+        if from_cache:
+            cached = self.gmail.get_cached_threads(self.max_results)
+        elif query and not page_token:
+            # Results from the local index are shown while the server searches
+            cached = self.gmail.search_cached_threads(query, self.max_results)
+        for thread in cached:
+            self.call_from_thread(self.add_thread, thread, worker)
+        if cached:
+            _logger.debug("Cached rows after %.3fs", time.perf_counter() - started)
+        if from_cache:
+            changed = self.gmail.sync()
+
+        thread_ids, next_page_token = self.gmail.list_threads(
+            max_results=self.max_results,
+            page_token=page_token,
+            query=query,
+        )
+        if worker.is_cancelled:
+            return
+        if cached:
+            if (
+                changed is not None
+                and not changed.intersection(thread_ids)
+                and [thread.id for thread in cached] == thread_ids
+            ):
+                self.call_from_thread(
+                    self.remember_page,
+                    query,
+                    page_token,
+                    [ThreadRow.from_thread(thread) for thread in cached],
+                    next_page_token,
+                )
+                self.call_from_thread(self.finish_page, next_page_token, worker)
+                return
+            self.call_from_thread(self.clear_threads, worker)
+
+        rows = []
+        for index, thread in enumerate(
+            self.gmail.iter_threads(
+                thread_ids,
+                message_format="metadata",
+                batch_size=self.stream_batch_size,
+            )
+        ):
+            if worker.is_cancelled:
+                return
+            if index == 0:
+                _logger.debug("First row after %.3fs", time.perf_counter() - started)
+            self.call_from_thread(self.add_thread, thread, worker)
+            rows.append(ThreadRow.from_thread(thread))
+        if worker.is_cancelled:
+            return
+        _logger.debug(
+            "Page of %d threads after %.3fs",
+            len(thread_ids),
+            time.perf_counter() - started,
+        )
+        self.call_from_thread(
+            self.remember_page, query, page_token, rows, next_page_token
+        )
+        self.call_from_thread(self.finish_page, next_page_token, worker)
+
+    def remember_page(
+        self,
+        query: Union[str, None],
+        page_token: str,
+        rows: list[ThreadRow],
+        next_page_token: str,
+    ) -> None:
+        self.pages[(query, page_token)] = (
+            tuple(rows),
+            next_page_token,
+            time.monotonic(),
+        )
+        self.pages.move_to_end((query, page_token))
+        while len(self.pages) > self.page_cache_size:
+            self.pages.popitem(last=False)
+
+    def show_page(self, page_token: str) -> bool:
+        """
+        Adds the rows of a page of the current search kept in `pages`.
+
+        Returns:
+            Whether the page was kept, otherwise it must be fetched.
+
+        """
+        page = self.fresh_page(self.search_query, page_token)
+        tracer.cache_lookup("pages", page is not None)
+        if page is None:
+            return False
+        self.pages.move_to_end((self.search_query, page_token))
+        rows, next_page_token = page
+        for row in rows:
+            self.add_row(row)
+        self.finish_page(next_page_token)
+        return True
+
+    def fresh_page(
+        self, query: Union[str, None], page_token: str
+    ) -> Union[tuple[tuple[ThreadRow, ...], str], None]:
+        """The rows and next page token of a kept page, unless it expired"""
+        page = self.pages.get((query, page_token))
+        if page is None or time.monotonic() - page[2] > self.views.ttl:
+            return None
+        return page[:2]
+
+    def forget_threads(self, thread_ids: set[str]) -> None:
+        """Drops the kept pages and tables that show any of the threads"""
+        for key, (rows, _, _) in list(self.pages.items()):
+            if any(row.id in thread_ids for row in rows):
+                del self.pages[key]
+        self.views.forget_threads(thread_ids)
+
+    def replace_kept_rows(self, rows: Iterable[ThreadRow]) -> None:
+        """Updates the rows of the kept pages and tables of the same threads"""
+        rows = {row.id: row for row in rows}
+        for key, (page_rows, next_page_token, fetched_at) in list(self.pages.items()):
+            if any(row.id in rows for row in page_rows):
+                self.pages[key] = (
+                    tuple(rows.get(row.id, row) for row in page_rows),
+                    next_page_token,
+                    fetched_at,
+                )
+        self.views.replace_rows(rows.values())
+
+    def save_view(self) -> None:
+        """Keeps the table of the current search, if its last page loaded"""
+        if not self.rows or not any(
+            key in self.table.rows for key in ("load_more", "no_more")
+        ):
+            return
+        self.views.put(
+            self.search_query,
+            TableView(
+                tuple(self.rows),
+                self.next_page_token,
+                self.table.cursor_row,
+                self.table.scroll_y,
+            ),
+        )
 
-    def add_threads(self, threads: list[Thread]) -> None:
-        for thread in threads:
+    def restore_view(self) -> bool:
+        """
+        Shows the kept table of the current search, with the cursor and the
+        scroll position it had.
+
+        Returns:
+            Whether a table was kept for the search.
+
+        """
+        view = self.views.get(self.search_query)
+        tracer.cache_lookup("tables", view is not None)
+        if view is None:
+            return False
+        for row in view.rows:
+            self.add_row(row)
+        self.finish_page(view.next_page_token)
+        self.table.move_cursor(row=view.cursor_row, animate=False)
+        self.call_after_refresh(self.table.scroll_to, y=view.scroll_y, animate=False)
+        return True
+
+    def add_thread(self, thread: Thread, worker: Worker = None) -> None:
+        # Rows of a cancelled fetch may still be queued after a new search
+        if worker is not None and worker.is_cancelled:
+            return
+        self.add_row(ThreadRow.from_thread(thread))
+        self.threads[thread.id] = thread
+        self.trim_threads()
+
+    def add_row(self, row: ThreadRow) -> None:
+        self.hide_loading()
+        with tracer.span("table.add_row", "render"):
             self.table.add_row(
-                Text("✉")
-                if "UNREAD" in [label.name for label in thread.last_message.labels]
-                else "",
-                Text(
-                    thread.last_message.sender.name
-                    if thread.last_message.sender.name is not None
-                    else thread.last_message.sender.email,
-                    no_wrap=True,
-                    overflow="ellipsis",
-                ),
-                Text(thread.last_message.subject, no_wrap=True, overflow="ellipsis")
+                self.status_cell(row),
+                Text(row.sender, no_wrap=True, overflow="ellipsis"),
+                Text(row.subject, no_wrap=True, overflow="ellipsis")
                 + (
                     Text(
-                        " - " + thread.last_message.snippet
-                        if thread.last_message.snippet is not None
-                        else "",
+                        " - " + row.snippet if row.snippet is not None else "",
                         style="magenta",
                         no_wrap=True,
                         overflow="ellipsis",
                     )
                 ),
-                parse_date(thread.last_message.date),
-                key=thread.id,
+                parse_date(row.date),
+                key=row.id,
             )
+        self.rows.append(row)
+
+    def trim_threads(self) -> None:
+        """Drop the threads of the rows outside the window around the cursor"""
+        if len(self.threads) <= self.thread_window:
+            return
+        start = max(0, self.table.cursor_row - self.thread_window // 2)
+        window = {row.id for row in self.rows[start : start + self.thread_window]}
+        for thread_id in list(self.threads):
+            if thread_id not in window:
+                del self.threads[thread_id]
+
+    def clear_threads(self, worker: Worker = None) -> None:
+        if worker is not None and worker.is_cancelled:
+            return
+        self.table.clear()
+        self.rows = []
+        self.threads = {}
+        self.selected.clear()
+
+    def finish_page(self, next_page_token: str, worker: Worker = None) -> None:
+        if worker is not None and worker.is_cancelled:
+            return
+        self.hide_loading()
+        self.next_page_token = next_page_token
         self.table.add_row("+", "Load more...", key="load_more")
+        if next_page_token and self.prefetch_pages > 0:
+            self.prefetch_next_pages(next_page_token)
+
+    @work(thread=True, exclusive=True, group="prefetch")
+    def prefetch_next_pages(self, page_token: str) -> None:
+        """Fetch the pages after the last one shown, for 'Load more...'"""
+        worker = get_current_worker()
+        query = self.search_query
+        # Requests for the user come first
+        with self.gmail.scheduler.lane(Priority.PREFETCH):
+            for _ in range(self.prefetch_pages):
+                if not page_token or worker.is_cancelled:
+                    return
+                if self.fresh_page(query, page_token) is None:
+                    thread_ids, next_page_token = self.gmail.list_threads(
+                        max_results=self.max_results,
+                        page_token=page_token,
+                        query=query,
+                    )
+                    rows = [
+                        ThreadRow.from_thread(thread)
+                        for thread in self.gmail.iter_threads(
+                            thread_ids, message_format="metadata"
+                        )
+                    ]
+                    if worker.is_cancelled:
+                        return
+                    self.call_from_thread(
+                        self.remember_page, query, page_token, rows, next_page_token
+                    )
+                page = self.fresh_page(query, page_token)
+                if page is None:
+                    return
+                page_token = page[1]
+
+    def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        self.trim_threads()
+        if self.prefetch_budget <= 0 or event.cursor_row >= len(self.rows):
+            return
+        # Closest rows first
+        indexes = [event.cursor_row]
+        for distance in range(1, self.prefetch_depth + 1):
+            indexes += [event.cursor_row + distance, event.cursor_row - distance]
+        rows = [
+            self.rows[index]
+            for index in indexes
+            if 0 <= index < len(self.rows)
+            and (
+                self.rows[index].id not in self.threads
+                or not self.threads[self.rows[index].id].is_loaded
+            )
+        ]
+        if rows:
+            self.prefetch_threads(rows[: self.prefetch_budget])
+
+    @work(thread=True, exclusive=True, group="prefetch_threads")
+    def prefetch_threads(self, rows: list[ThreadRow]) -> None:
+        """Fetch the full threads around the cursor before they are opened"""
+        worker = get_current_worker()
+        # Requests for the user come first
+        with self.gmail.scheduler.lane(Priority.PREFETCH):
+            # Wait for the cursor to settle, moving it again cancels this worker
+            time.sleep(0.2)
+            for row in rows:
+                if worker.is_cancelled:
+                    return
+                self.get_thread(row)
+
+    def get_thread(self, row: ThreadRow) -> Thread:
+        """
+        Returns the full thread of a row, fetching it if it left the window.
+        If another worker is already fetching it, such as a prefetch of the
+        thread being opened, waits for that worker instead of fetching it
+        again. Only call it from a worker.
+        """
+        with self._thread_loads_lock:
+            load = self._thread_loads.get(row.id)
+            fetching = load is None
+            if fetching:
+                load = self._thread_loads[row.id] = Future()
+        if not fetching:
+            return load.result()
+        try:
+            thread = self.threads.get(row.id)
+            if thread is None:
+                thread = self.gmail.get_thread(row.id)
+                self.call_from_thread(self.threads.__setitem__, row.id, thread)
+            else:
+                thread.load()
+            load.set_result(thread)
+            return thread
+        except BaseException as error:
+            load.set_exception(error)
+            raise error
+        finally:
+            with self._thread_loads_lock:
+                del self._thread_loads[row.id]
+
+    def cancel_prefetch(self) -> None:
+        self.workers.cancel_group(self, "prefetch")
+        self.workers.cancel_group(self, "prefetch_threads")
+
+    def on_unmount(self) -> None:
+        if self._gmail is not None:
+            # Send the changes still queued before exiting
+            self._gmail.mutations.close(timeout=10)
 
     def on_resize(self, event: events.Resize) -> None:
-        self.table.columns["subject"].width = event.size.width - 37
-        self.table.refresh_column(2)
+        table = self.query_one(DataTable)
+        if "subject" in table.columns:
+            table.columns["subject"].width = event.size.width - 37
+            table.refresh_column(2)
 
     def action_select_cursor(self):
         row = self.table.cursor_row
@@ -212,32 +754,210 @@ class Main(App):
                 self.table.add_row("-", "No more results", key="no_more")
                 self.table.move_cursor(row=row)
             else:
-                new_threads, self.next_page_token = gmail.get_threads(
-                    max_results=self.max_results,
-                    page_token=self.next_page_token,
-                    query=self.search_query,
-                )
                 self.table.remove_row("load_more")
-                self.add_threads(new_threads)
-                self.threads += new_threads
+                if not self.show_page(self.next_page_token):
+                    self.workers.cancel_group(self, "prefetch")
+                    self.load_threads(self.next_page_token)
         elif self.table.get_row_at(row)[0] == "-":
             pass
         else:
-            thread = self.threads[row]
-            thread.last_message.mark_as_read()
-            self.table.update_cell_at(Coordinate(row=row, column=0), value="")
-            self.push_screen(ThreadScreen(thread))
+            self.open_thread(self.rows[row])
+
+    @work(thread=True, exclusive=True, group="open")
+    @tracer.traced("open thread", "ui")
+    def open_thread(self, row: ThreadRow) -> None:
+        # The inbox only fetches the metadata of the messages
+        thread = self.get_thread(row)
+        # Sent in the background, the thread opens without waiting for it
+        self.gmail.mutations.modify([thread.last_message], remove_labels=["UNREAD"])
+        # Render the body here rather than when the screen is composed
+        self.render_cache.render(thread.last_message)
+        if get_current_worker().is_cancelled:
+            return
+        self.call_from_thread(self.mark_row_as_read, row)
+        # Screens are built on the UI thread
+        self.call_from_thread(lambda: self.push_screen(ThreadScreen(thread)))
+
+    def mark_row_as_read(self, row: ThreadRow) -> None:
+        # Rows may have been loaded, hidden or searched away since the thread
+        # was opened, so the row is looked up again by its thread id
+        row = row._replace(unread=False)
+        for index, current in enumerate(self.rows):
+            if current.id == row.id:
+                row = self.rows[index] = current._replace(unread=False)
+                self.refresh_status(index)
+                break
+        self.replace_kept_rows([row])
+
+    def status_cell(self, row: ThreadRow) -> Union[Text, str]:
+        if row.id in self.selected:
+            return Text("✓", style="bold")
+        return Text("✉") if row.unread else ""
+
+    def refresh_status(self, index: int) -> None:
+        self.table.update_cell_at(
+            Coordinate(row=index, column=0), value=self.status_cell(self.rows[index])
+        )
+
+    def action_toggle_selection(self) -> None:
+        index = self.table.cursor_row
+        if index >= len(self.rows):
+            return
+        self.selected ^= {self.rows[index].id}
+        self.refresh_status(index)
+        self.table.move_cursor(row=index + 1)
+
+    def selected_rows(self) -> list[ThreadRow]:
+        """The selected rows, or the row under the cursor if none is selected"""
+        if self.selected:
+            return [row for row in self.rows if row.id in self.selected]
+        if self.table.cursor_row < len(self.rows):
+            return [self.rows[self.table.cursor_row]]
+        return []
+
+    def action_mark_read(self) -> None:
+        self.modify_rows(remove_labels=["UNREAD"])
+
+    def action_mark_unread(self) -> None:
+        self.modify_rows(add_labels=["UNREAD"])
+
+    def action_archive(self) -> None:
+        self.modify_rows(remove_labels=["INBOX"], hide=True)
+
+    def action_trash(self) -> None:
+        self.modify_rows(add_labels=["TRASH"], hide=True)
+
+    def modify_rows(
+        self,
+        add_labels: Union[list[str], None] = None,
+        remove_labels: Union[list[str], None] = None,
+        hide: bool = False,
+    ) -> None:
+        """
+        Adds and removes labels of the selected threads. The table is updated
+        right away, and reloaded if the request fails.
+        """
+        rows = self.selected_rows()
+        if not rows:
+            return
+        self.selected.clear()
+        if hide:
+            # Kept pages would show the threads again
+            self.forget_threads({row.id for row in rows})
+        for row in rows:
+            index = self.rows.index(row)
+            if hide:
+                self.rows.pop(index)
+                self.table.remove_row(row.id)
+                self.threads.pop(row.id, None)
+            else:
+                if "UNREAD" in (add_labels or []) + (remove_labels or []):
+                    self.rows[index] = row._replace(unread=bool(add_labels))
+                self.refresh_status(index)
+        if not hide:
+            # Kept pages and tables show the new status too
+            thread_ids = {row.id for row in rows}
+            self.replace_kept_rows(row for row in self.rows if row.id in thread_ids)
+        self.apply_modification(
+            [row.id for row in rows], add_labels or [], remove_labels or []
+        )
+
+    @work(thread=True, group="modify")
+    def apply_modification(
+        self, thread_ids: list[str], add_labels: list[str], remove_labels: list[str]
+    ) -> None:
+        threads = [
+            self.threads[thread_id]
+            for thread_id in thread_ids
+            if thread_id in self.threads
+        ]
+        # Rows outside the window only need the ids of their messages
+        threads += self.gmail.iter_threads(
+            [thread_id for thread_id in thread_ids if thread_id not in self.threads],
+            message_format="metadata",
+        )
+        self.gmail.mutations.modify(
+            [message for thread in threads for message in thread.messages],
+            add_labels,
+            remove_labels,
+        )
+
+    def mutation_failed(self, error: Exception, message_ids: list[str]) -> None:
+        """Called from the mutation queue thread when a change is rolled back"""
+        _logger.error("Could not modify %d messages: %s", len(message_ids), error)
+        if self.is_running:
+            self.call_from_thread(self.modification_failed, error)
+
+    def modification_failed(self, error: Exception) -> None:
+        self.notify(f"The change could not be saved: {error}", severity="error")
+        # The table was changed before the request was sent
+        self.workers.cancel_group(self, "threads")
+        self.cancel_prefetch()
+        self.pages.clear()
+        self.views.clear()
+        self.clear_threads()
+        self.show_loading()
+        self.load_threads()
+
+    @tracer.traced("search", "ui")
+    def search(self, search_query: str) -> bool:
+        """
+        Shows the threads matching a search query, from `views` or `pages`
+        if it was searched recently.
+
+        Returns:
+            Whether the threads are being fetched.
+
+        """
+        search_query = search_query or None
+        if self.search_query == search_query:
+            return False
+        self.save_view()
+        self.search_query = search_query
+        # Drop the rows of a page that is still being fetched. Its request
+        # can't be aborted, but its results are ignored.
+        self.workers.cancel_group(self, "threads")
+        self.cancel_prefetch()
+        self.clear_threads()
+        if self.restore_view() or self.show_page(""):
+            return False
+        self.load_threads()
+        return True
 
     def action_show_search(self):
         def on_dismiss(search_query: str):
-            if self.search_query != search_query:
-                self.search_query = search_query
-                self.push_screen(LoadingScreen())
-                self.threads, self.next_page_token = gmail.get_threads(
-                    query=search_query, max_results=self.max_results
-                )
-                self.table.clear()
-                self.add_threads(self.threads)
-                self.pop_screen()
+            if self.search(search_query):
+                self.show_loading()
+            search_query = search_query or None
+            if self.history[self.history_index] != search_query:
+                del self.history[self.history_index + 1 :]
+                self.history.append(search_query)
+                self.history_index += 1
+
+        self.push_screen(
+            SearchScreen(
+                self.search_query or "",
+                on_change=self.search,
+                debounce=self.search_debounce,
+            ),
+            on_dismiss,
+        )
 
-        self.push_screen(SearchScreen(self.search_query), on_dismiss)
+    def action_toggle_hud(self) -> None:
+        self.query_one(PerformanceHud).toggle()
+
+    def action_back(self) -> None:
+        # A query typed but not submitted goes back to the last one searched
+        if self.search_query == self.history[self.history_index]:
+            if self.history_index == 0:
+                return
+            self.history_index -= 1
+        if self.search(self.history[self.history_index]):
+            self.show_loading()
+
+    def action_forward(self) -> None:
+        if self.history_index + 1 >= len(self.history):
+            return
+        self.history_index += 1
+        if self.search(self.history[self.history_index]):
+            self.show_loading()
@@ -25,6 +25,10 @@ import logging
 import sys
 
 from gmail_tui import __version__
+from gmail_tui.client import Gmail
+from gmail_tui.client.gmail import MAX_WORKERS
+from gmail_tui.client.store import CACHE_PATH_VARIABLE, open_store
+from gmail_tui.client.tracing import tracer
 from gmail_tui.interface import Main
 
 __author__ = "Pablo"
@@ -63,6 +67,38 @@ def parse_args(args):
         action="version",
         version="gmail_tui {ver}".format(ver=__version__),
     )
+    parser.add_argument(
+        "--hydration",
+        choices=["batch", "parallel"],
+        default="batch",
+        help="fetch threads with batch requests or with parallel requests",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help="number of parallel requests used by --hydration parallel",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["httplib2", "session"],
+        default="httplib2",
+        help="send requests with a connection per thread (httplib2) or with a"
+        " pool of connections shared by all threads (session)",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="where fetched mail is cached, by default the"
+        f" {CACHE_PATH_VARIABLE} environment variable or"
+        " ~/.cache/gmail-tui/cache.db",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="write how long every request, parse and render took to a trace"
+        " file in the Chrome trace format, for chrome://tracing or Perfetto",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -107,8 +143,22 @@ def main(args):
     args = parse_args(args)
     setup_logging(args.loglevel)
     _logger.debug("Starting crazy calculations...")
-    app = Main()
-    app.run()
+    app = Main(
+        gmail_factory=lambda: Gmail(
+            store=open_store(args.cache),
+            hydration=args.hydration,
+            max_workers=args.workers,
+            transport=args.transport,
+        )
+    )
+    if args.profile:
+        tracer.start_trace()
+    try:
+        app.run()
+    finally:
+        if args.profile:
+            tracer.write_chrome_trace(args.profile)
+            _logger.info("Trace written to %s", args.profile)
 
     _logger.info("Script ends here")
 
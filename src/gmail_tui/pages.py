@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, NamedTuple, Union
+
+# Bytes a row takes besides its text: the tuple, its datetime and the
+# strings' headers
+ROW_OVERHEAD = 300
+
+
+class TableView(NamedTuple):
+    """What the inbox table showed for a search query"""
+
+    # The rows of every page loaded, as `ThreadRow`s
+    rows: tuple
+    next_page_token: str
+    cursor_row: int
+    scroll_y: float
+
+    @property
+    def thread_ids(self) -> list[str]:
+        return [row.id for row in self.rows]
+
+
+def _view_size(view: TableView) -> int:
+    return sum(
+        ROW_OVERHEAD + sum(len(value) for value in row if isinstance(value, str))
+        for row in view.rows
+    )
+
+
+class PageCache:
+    """
+    Keeps the table of the most recent search queries, so going back to one
+    shows the same rows at the same scroll position without fetching them.
+
+    A table is dropped `ttl` seconds after it was saved, and the least
+    recently used ones are dropped once the rows take more than `max_bytes`
+    bytes, roughly.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 1024 * 1024,
+        ttl: float = 300,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        # View, its size and when it was saved, by query
+        self._views: OrderedDict[
+            Union[str, None], tuple[TableView, int, float]
+        ] = OrderedDict()
+        self._size = 0
+
+    def get(self, query: Union[str, None]) -> Union[TableView, None]:
+        """Returns the table saved for a query, unless it expired"""
+        entry = self._views.get(query)
+        if entry is None:
+            return None
+        view, _, saved_at = entry
+        if self._clock() - saved_at > self.ttl:
+            self.discard(query)
+            return None
+        self._views.move_to_end(query)
+        return view
+
+    def put(self, query: Union[str, None], view: TableView):
+        self.discard(query)
+        size = _view_size(view)
+        self._views[query] = (view, size, self._clock())
+        self._size += size
+        while self._size > self.max_bytes and len(self._views) > 1:
+            _, (_, evicted, _) = self._views.popitem(last=False)
+            self._size -= evicted
+
+    def discard(self, query: Union[str, None]):
+        entry = self._views.pop(query, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def replace_rows(self, rows: Iterable):
+        """Updates the rows of the saved tables that show the same threads"""
+        rows = {row.id: row for row in rows}
+        for query, (view, size, saved_at) in list(self._views.items()):
+            if any(row.id in rows for row in view.rows):
+                view = view._replace(
+                    rows=tuple(rows.get(row.id, row) for row in view.rows)
+                )
+                self._views[query] = (view, size, saved_at)
+
+    def forget_threads(self, thread_ids: set[str]):
+        """Drops the saved tables that show any of the threads"""
+        for query, (view, _, _) in list(self._views.items()):
+            if any(row.id in thread_ids for row in view.rows):
+                self.discard(query)
+
+    def clear(self):
+        self._views.clear()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._views)
+
+    def __contains__(self, query: Union[str, None]) -> bool:
+        return query in self._views
@@ -0,0 +1,272 @@
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import Union
+
+from gmail_tui.client import Message
+from gmail_tui.client.tracing import tracer
+
+# Tags whose content is never shown
+SKIP_TAGS = {"head", "noscript", "script", "style", "template", "title"}
+# Tags that start and end a line
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "aside",
+    "center",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "fieldset",
+    "figcaption",
+    "figure",
+    "footer",
+    "form",
+    "header",
+    "main",
+    "nav",
+    "p",
+    "section",
+    "table",
+    "tbody",
+    "tfoot",
+    "thead",
+    "tr",
+}
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+EMPHASIS = {"b": "**", "strong": "**", "i": "*", "em": "*", "code": "`"}
+ESCAPES = str.maketrans({char: "\\" + char for char in "\\`*_[]<>"})
+
+
+class HtmlConverter(HTMLParser):
+    """
+    Converts HTML to Markdown, keeping only what a terminal can show:
+    paragraphs, headings, lists, quotes, preformatted text, emphasis and
+    links. Scripts, styles and images are dropped and whitespace is collapsed
+    like a browser does.
+
+    It is built on the standard library parser, so it is much cheaper than
+    building a tree of the whole document.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._out: list[str] = []
+        # Text written before the next text, such as list markers
+        self._pending = ""
+        self._newlines = 0
+        self._space = False
+        self._skip = 0
+        self._pre = 0
+        self._quote = 0
+        # Counter of every open list, None for unordered lists
+        self._lists: list[Union[int, None]] = []
+        # [tag, marker, written] of the open emphasis tags
+        self._marks: list[list] = []
+        # [href, index in _out where the text starts, length of _pending when
+        # the link started] of the open links
+        self._links: list[list] = []
+
+    def convert(self, html: str) -> str:
+        self.feed(html)
+        self.close()
+        return "".join(self._out).strip() + "\n"
+
+    def _block(self, newlines: int = 1):
+        if self._out:
+            self._newlines = max(self._newlines, newlines)
+        self._pending = ""
+
+    def _write(self, text: str):
+        if self._newlines:
+            prefix = "> " * self._quote
+            if self._newlines > 1:
+                self._out.append("\n\n" + prefix)
+            elif (
+                self._pre
+                or self._pending[:1] in ("#", "-", " ")
+                or (self._pending[:1].isdigit())
+            ):
+                self._out.append("\n" + prefix)
+            else:
+                # Two trailing spaces make a single newline a line break
+                self._out.append("  \n" + prefix)
+        elif self._space and self._out:
+            self._out.append(" ")
+        elif not self._out and self._quote:
+            self._out.append("> " * self._quote)
+        self._newlines = 0
+        self._space = False
+        pending, self._pending = self._pending, ""
+        if pending:
+            for mark in self._marks:
+                mark[2] = True
+        for link in self._links:
+            if link[1] is None:
+                # Markers added before the link started go outside of it
+                self._out.append(pending[: link[2]])
+                pending = pending[link[2] :]
+                link[1] = len(self._out)
+        if pending:
+            self._out.append(pending)
+        self._out.append(text)
+
+    def handle_starttag(self, tag: str, attrs: list):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        if self._skip:
+            return
+        if tag == "br":
+            if self._out:
+                self._newlines = min(self._newlines + 1, 2)
+        elif tag in HEADINGS:
+            self._block(2)
+            self._pending = "#" * int(tag[1]) + " "
+        elif tag in ("ul", "ol"):
+            self._block(1 if self._lists else 2)
+            self._lists.append(0 if tag == "ol" else None)
+        elif tag == "li":
+            self._block(1)
+            indent = "  " * max(len(self._lists) - 1, 0)
+            if self._lists and self._lists[-1] is not None:
+                self._lists[-1] += 1
+                self._pending = f"{indent}{self._lists[-1]}. "
+            else:
+                self._pending = f"{indent}- "
+        elif tag == "blockquote":
+            self._block(2)
+            self._quote += 1
+        elif tag == "pre":
+            self._block(2)
+            self._pre += 1
+            self._write("```")
+            self._newlines = 1
+        elif tag == "hr":
+            self._block(2)
+            self._write("---")
+            self._block(2)
+        elif tag in EMPHASIS and not self._pre:
+            self._marks.append([tag, EMPHASIS[tag], False])
+            self._pending += EMPHASIS[tag]
+        elif tag == "a":
+            self._links.append(
+                [dict(attrs).get("href") or "", None, len(self._pending)]
+            )
+        elif tag in ("td", "th"):
+            self._space = bool(self._out)
+        elif tag in BLOCK_TAGS:
+            self._block(2 if tag == "p" else 1)
+
+    def handle_endtag(self, tag: str):
+        if tag in SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+            return
+        if self._skip:
+            return
+        if tag in HEADINGS:
+            self._block(2)
+        elif tag in ("ul", "ol"):
+            if self._lists:
+                self._lists.pop()
+            self._block(1 if self._lists else 2)
+        elif tag == "li":
+            self._block(1)
+        elif tag == "blockquote":
+            self._quote = max(self._quote - 1, 0)
+            self._block(2)
+        elif tag == "pre":
+            if self._pre:
+                self._newlines = 1
+                self._write("```")
+                self._pre -= 1
+                self._block(2)
+        elif tag in EMPHASIS:
+            for index in range(len(self._marks) - 1, -1, -1):
+                if self._marks[index][0] == tag:
+                    _, marker, written = self._marks.pop(index)
+                    if written:
+                        self._out.append(marker)
+                    elif self._pending.endswith(marker):
+                        self._pending = self._pending[: -len(marker)]
+                    break
+        elif tag == "a" and self._links:
+            href, start, _ = self._links.pop()
+            # Links without text, like images, are dropped
+            if start is not None and href.startswith(("http:", "https:", "mailto:")):
+                text = "".join(self._out[start:])
+                if "\n" not in text and text != href.translate(ESCAPES):
+                    self._out[start:] = [f"[{text}]({href.replace(' ', '%20')})"]
+        elif tag in BLOCK_TAGS:
+            self._block(2 if tag == "p" else 1)
+
+    def handle_data(self, data: str):
+        if self._skip:
+            return
+        if self._pre:
+            lines = data.split("\n")
+            for index, line in enumerate(lines):
+                if index:
+                    self._newlines = 1
+                if line:
+                    self._write(line.replace("```", "` ` `"))
+            return
+        text = " ".join(data.split())
+        if not text:
+            self._space = self._space or bool(data)
+            return
+        if data[0].isspace():
+            self._space = True
+        self._write(text.translate(ESCAPES))
+        self._space = data[-1].isspace()
+
+
+def html_to_markdown(html: str) -> str:
+    """Converts an HTML document or fragment to Markdown"""
+    return HtmlConverter().convert(html)
+
+
+class RenderCache:
+    """
+    Renders the body of messages as Markdown and keeps the result of the
+    most recently rendered ones, by message id, until they take more than
+    `max_chars` characters.
+
+    The plain text part of a message is shown as it is. HTML is only
+    converted when a message has no plain text part, and only the first time
+    the message is rendered.
+    """
+
+    def __init__(self, max_chars: int = 4 * 1024 * 1024):
+        self.max_chars = max_chars
+        self._rendered: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def render(self, message: Message) -> str:
+        with self._lock:
+            hit = message.id in self._rendered
+            if hit:
+                self._rendered.move_to_end(message.id)
+                rendered = self._rendered[message.id]
+        tracer.cache_lookup("render", hit)
+        if hit:
+            return rendered
+        if message.body is not None:
+            rendered = message.body
+        elif message.html is not None:
+            with tracer.span("html_to_markdown", "render", chars=len(message.html)):
+                rendered = html_to_markdown(message.html)
+        else:
+            rendered = ""
+        with self._lock:
+            if message.id not in self._rendered:
+                self._rendered[message.id] = rendered
+                self._size += len(rendered)
+            while self._size > self.max_chars and len(self._rendered) > 1:
+                _, evicted = self._rendered.popitem(last=False)
+                self._size -= len(evicted)
+        return rendered
+
+    def __len__(self) -> int:
+        return len(self._rendered)
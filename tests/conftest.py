@@ -1,8 +1,39 @@
 """
-    Dummy conftest.py for gmail_tui.
+Fixtures shared by the tests of gmail_tui.
 
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    - https://docs.pytest.org/en/stable/fixture.html
-    - https://docs.pytest.org/en/stable/writing_plugins.html
+`mock_gmail` builds a Gmail client backed by an HttpMockSequence, so the
+tests never reach the API. The client knows the system labels in LABELS.
 """
+
+import pytest
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMockSequence
+
+from gmail_tui.client.gmail import Gmail
+from gmail_tui.client.scheduler import RequestScheduler
+
+LABELS = [
+    {"id": label_id, "name": label_id, "type": "system"}
+    for label_id in ("INBOX", "UNREAD", "TRASH")
+]
+
+
+@pytest.fixture
+def mock_gmail():
+    """
+    Builds a Gmail client whose service answers with a sequence of responses,
+    and returns it with its HttpMockSequence. The client knows LABELS and
+    doesn't sleep between retries.
+    """
+
+    def make(responses: list[tuple], **kwargs) -> tuple[Gmail, HttpMockSequence]:
+        http = HttpMockSequence(responses)
+        service = build("gmail", "v1", http=http, static_discovery=True)
+        kwargs.setdefault(
+            "scheduler", RequestScheduler(sleep=lambda seconds: None, jitter=lambda: 0)
+        )
+        gmail = Gmail(service=service, **kwargs)
+        gmail.label_catalog.update(LABELS)
+        return gmail, http
+
+    return make
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from gmail_tui.client.async_gmail import AsyncGmail, _method_id
+from gmail_tui.client.store import MessageStore
+
+httpx = pytest.importorskip("httpx")
+
+
+class FakeCredentials:
+    def __init__(self, valid: bool = True):
+        self.valid = valid
+        self.token = "token"
+        self.refreshed = 0
+
+    def refresh(self, request):
+        self.refreshed += 1
+        self.valid = True
+        self.token = "refreshed"
+
+
+def message_resource(message_id: str, thread_id: str, labels: list[str]) -> dict:
+    return {
+        "id": message_id,
+        "threadId": thread_id,
+        "historyId": "1",
+        "labelIds": labels,
+        "snippet": "Hello",
+        "internalDate": "1689588000000",
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "From", "value": "Jane Doe <jane@example.com>"},
+                {"name": "Subject", "value": f"Message {message_id}"},
+            ],
+        },
+    }
+
+
+class FakeApi:
+    """Answers the Gmail API requests of an httpx.MockTransport"""
+
+    def __init__(self):
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        path = request.url.path.split("/users/me/")[1]
+        parts = path.split("/")
+        if path == "threads":
+            return httpx.Response(
+                200,
+                json={
+                    "threads": [{"id": "t1", "historyId": "1"}, {"id": "t2"}],
+                    "nextPageToken": "next",
+                },
+            )
+        if parts[0] == "threads" and len(parts) == 2:
+            message = message_resource(f"m{parts[1]}", parts[1], ["INBOX", "UNREAD"])
+            return httpx.Response(
+                200, json={"id": parts[1], "historyId": "1", "messages": [message]}
+            )
+        if parts[0] == "messages" and parts[-1] == "modify":
+            body = json.loads(request.content)
+            labels = ["INBOX", "UNREAD", *body["addLabelIds"]]
+            return httpx.Response(
+                200,
+                json={
+                    "id": parts[1],
+                    "labelIds": [
+                        label for label in labels if label not in body["removeLabelIds"]
+                    ],
+                },
+            )
+        if path == "messages/m1":
+            return httpx.Response(200, json=message_resource("m1", "t1", ["INBOX"]))
+        return httpx.Response(404, json={"error": {"code": 404}})
+
+    def paths(self) -> list[str]:
+        return [request.url.path.split("/users/me/")[1] for request in self.requests]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MessageStore(str(tmp_path / "cache.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def client(mock_gmail):
+    """Builds an AsyncGmail client whose requests are answered by a FakeApi"""
+
+    def make(credentials=None, **kwargs):
+        gmail, _ = mock_gmail([], **kwargs)
+        gmail.credentials = credentials or FakeCredentials()
+        api = FakeApi()
+        return AsyncGmail(gmail, transport=httpx.MockTransport(api)), api
+
+    return make
+
+
+def run(async_gmail: AsyncGmail, coroutine):
+    async def main():
+        async with async_gmail:
+            return await coroutine
+
+    return asyncio.run(main())
+
+
+def test_method_ids():
+    assert _method_id("GET", "threads") == "gmail.users.threads.list"
+    assert _method_id("GET", "threads/t1") == "gmail.users.threads.get"
+    assert _method_id("POST", "messages/batchModify") == (
+        "gmail.users.messages.batchModify"
+    )
+    assert _method_id("POST", "threads/t1/modify") == "gmail.users.threads.modify"
+
+
+def test_get_threads(client):
+    async_gmail, api = client()
+
+    threads, next_page_token = run(
+        async_gmail, async_gmail.get_threads(message_format="metadata")
+    )
+
+    assert [thread.id for thread in threads] == ["t1", "t2"]
+    assert threads[0].last_message.subject == "Message mt1"
+    assert {label.id for label in threads[0].last_message.labels} == {
+        "INBOX",
+        "UNREAD",
+    }
+    assert next_page_token == "next"
+    assert sorted(api.paths()) == ["threads", "threads/t1", "threads/t2"]
+    thread_request = api.requests[1]
+    assert thread_request.headers["Authorization"] == "Bearer token"
+    assert thread_request.url.params["format"] == "metadata"
+    assert thread_request.url.params.get_list("metadataHeaders")[0] == "From"
+    assert async_gmail.gmail.scheduler.calls["gmail.users.threads.get"] == 2
+
+
+def test_cached_threads_and_messages_are_read_off_the_event_loop(
+    client, store, monkeypatch
+):
+    async_gmail, api = client(store=store)
+    threads = []
+    for name in ("get_thread", "save_thread", "get_message"):
+        method = getattr(store, name)
+
+        def record(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+
+        monkeypatch.setattr(store, name, record)
+
+    async def get_twice():
+        await async_gmail.list_threads()
+        first = await async_gmail.get_thread("t1")
+        second = await async_gmail.get_thread("t1")
+        message = await async_gmail.get_message("mt1")
+        return first, second, message
+
+    first, second, message = run(async_gmail, get_twice())
+
+    assert api.paths() == ["threads", "threads/t1"]
+    assert first.last_message.subject == second.last_message.subject
+    assert message.subject == "Message mt1"
+    assert len(threads) == 4
+    assert threading.get_ident() not in threads
+
+
+def test_errors_are_http_errors(client):
+    async_gmail, _ = client()
+
+    with pytest.raises(HttpError) as error:
+        run(async_gmail, async_gmail.get_message("missing"))
+
+    assert error.value.status_code == 404
+
+
+def test_modify_message_updates_the_labels(client, store):
+    async_gmail, api = client(store=store)
+
+    async def read():
+        message = await async_gmail.get_message("m1")
+        await async_gmail.modify_message(message, ["trash"], ["unread"])
+        return message
+
+    message = run(async_gmail, read())
+
+    assert json.loads(api.requests[-1].content) == {
+        "addLabelIds": ["TRASH"],
+        "removeLabelIds": ["UNREAD"],
+    }
+    assert {label.id for label in message.labels} == {"INBOX", "TRASH"}
+    assert store.get_message("m1", full=False)["labelIds"] == ["INBOX", "TRASH"]
+
+
+def test_expired_credentials_are_refreshed(client, monkeypatch):
+    credentials = FakeCredentials(valid=False)
+    async_gmail, api = client(credentials)
+    monkeypatch.setattr("google.auth.transport.requests.Request", lambda: None)
+
+    run(async_gmail, async_gmail.list_threads())
+
+    assert credentials.refreshed == 1
+    assert api.requests[0].headers["Authorization"] == "Bearer refreshed"
+
+
+def test_credentials_of_the_transport_are_used(mock_gmail):
+    gmail, http = mock_gmail([])
+
+    with pytest.raises(ValueError):
+        AsyncGmail(gmail)
+
+    http.credentials = FakeCredentials()
+    api = FakeApi()
+    async_gmail = AsyncGmail(gmail, transport=httpx.MockTransport(api))
+    run(async_gmail, async_gmail.list_threads())
+
+    assert api.requests[0].headers["Authorization"] == "Bearer token"
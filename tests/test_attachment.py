@@ -0,0 +1,194 @@
+import base64
+import hashlib
+import io
+import json
+import os
+
+import pytest
+import requests
+from googleapiclient.errors import HttpError
+
+from gmail_tui.client.attachment import (
+    Attachment,
+    AttachmentCache,
+    _decode_to,
+    _json_data,
+)
+
+CONTENT = bytes(range(256)) * 40 + b"end"
+
+
+def b64(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data)
+
+
+def split(data: bytes, size: int) -> list[bytes]:
+    return [data[start : start + size] for start in range(0, len(data), size)]
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def decode(chunks: list[bytes]) -> tuple[bytes, int, str]:
+    file = io.BytesIO()
+    size, digest = _decode_to(chunks, file)
+    return file.getvalue(), size, digest
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 5, 7, 4096])
+def test_chunks_can_split_a_base64_quantum(chunk_size):
+    data, size, digest = decode(split(b64(CONTENT), chunk_size))
+
+    assert data == CONTENT
+    assert size == len(CONTENT)
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.mark.parametrize("content", [b"a", b"ab", b"abc", CONTENT[:-1]])
+def test_padding_can_be_missing(content):
+    assert decode(split(b64(content).rstrip(b"="), 5))[0] == content
+    assert decode([b64(content)])[0] == content
+
+
+def test_data_field_is_read_from_chunks():
+    body = json.dumps({"size": len(CONTENT), "data": b64(CONTENT).decode()}).encode()
+
+    # Even when the field name is split between two chunks
+    assert b"".join(_json_data(split(body, 5))) == b64(CONTENT)
+    assert list(_json_data([b'{"size": 0}'])) == []
+
+
+class FakeSession:
+    """Streams the JSON responses of attachments.get calls"""
+
+    def __init__(self, contents: dict[str, bytes]):
+        self.contents = contents
+        self.urls = []
+
+    def get(self, url: str, stream: bool = False) -> requests.Response:
+        self.urls.append(url)
+        attachment_id = url.split("/attachments/")[1].split("?")[0]
+        response = requests.Response()
+        if attachment_id in self.contents:
+            response.status_code = 200
+            data = b64(self.contents[attachment_id]).decode().rstrip("=")
+            response.raw = io.BytesIO(json.dumps({"data": data}).encode())
+        else:
+            response.status_code = 404
+            response.raw = io.BytesIO(b'{"error": {"code": 404}}')
+        return response
+
+
+def attachment(
+    attachment_id: str, message_id: str = "m1", filename: str = "minutes.pdf"
+) -> Attachment:
+    return Attachment(
+        None,
+        {
+            "attachment_id": attachment_id,
+            "part_id": "1",
+            "filename": filename,
+            "filetype": "application/pdf",
+        },
+        message_id,
+    )
+
+
+def test_attachments_are_streamed_to_a_file(tmp_path):
+    session = FakeSession({"a1": CONTENT})
+
+    path = attachment("a1").save_to(str(tmp_path / "out.pdf"), session=session)
+
+    assert path == str(tmp_path / "out.pdf")
+    assert (tmp_path / "out.pdf").read_bytes() == CONTENT
+    assert session.urls == [
+        "https://gmail.googleapis.com/gmail/v1/users/me/messages/m1"
+        "/attachments/a1?fields=data"
+    ]
+
+
+def test_failed_downloads_leave_no_file(tmp_path):
+    with pytest.raises(HttpError):
+        attachment("missing").save_to(str(tmp_path), session=FakeSession({}))
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_cached_attachments_are_not_downloaded_again(tmp_path):
+    cache = AttachmentCache(str(tmp_path / "cache"))
+    session = FakeSession({"a1": CONTENT})
+    (tmp_path / "out").mkdir()
+
+    first = attachment("a1").save_to(str(tmp_path / "out"), cache, session)
+    # Attachment ids change between requests, the part id doesn't
+    second = attachment("a1-again").save_to(str(tmp_path / "out"), cache, session)
+
+    assert len(session.urls) == 1
+    assert first != second
+    assert read(second) == CONTENT
+    assert cache.get("m1", "1") is not None
+    assert cache.get("m2", "1") is None
+
+
+def test_cache_stores_each_content_once(tmp_path):
+    cache = AttachmentCache(str(tmp_path / "cache"))
+    session = FakeSession({"a1": CONTENT, "a2": CONTENT, "a3": b"other"})
+
+    attachment("a1", "m1").save_to(str(tmp_path / "1.pdf"), cache, session)
+    attachment("a2", "m2").save_to(str(tmp_path / "2.pdf"), cache, session)
+    attachment("a3", "m3").save_to(str(tmp_path / "3.pdf"), cache, session)
+
+    assert len(session.urls) == 3
+    assert cache.get("m1", "1") == cache.get("m2", "1")
+    assert cache.get("m3", "1") != cache.get("m1", "1")
+    assert len(os.listdir(tmp_path / "cache" / "objects")) == 2
+
+
+def test_attachments_with_the_same_filename_are_all_kept(tmp_path):
+    session = FakeSession({"a1": b"first", "a2": b"second", "a3": b"third"})
+
+    paths = [
+        attachment(attachment_id).save_to(str(tmp_path), session=session)
+        for attachment_id in ("a1", "a2", "a3")
+    ]
+
+    assert [os.path.basename(path) for path in paths] == [
+        "minutes.pdf",
+        "minutes (1).pdf",
+        "minutes (2).pdf",
+    ]
+    assert [read(path) for path in paths] == [
+        b"first",
+        b"second",
+        b"third",
+    ]
+
+
+def test_filenames_cant_leave_the_directory(tmp_path):
+    (tmp_path / "out").mkdir()
+    session = FakeSession({"a1": CONTENT})
+
+    path = attachment("a1", filename="../../minutes.pdf").save_to(
+        str(tmp_path / "out"), session=session
+    )
+
+    assert path == str(tmp_path / "out" / "minutes.pdf")
+
+
+def test_attachments_are_fetched_through_the_service_without_credentials(
+    mock_gmail, tmp_path
+):
+    data = b64(CONTENT).decode()
+    gmail, http = mock_gmail([({"status": "200"}, json.dumps({"data": data}))])
+    part = {
+        "attachment_id": "a1",
+        "filename": "minutes.pdf",
+        "filetype": "application/pdf",
+    }
+
+    path = Attachment(gmail._service, part, "m1").save_to(str(tmp_path), chunk_size=7)
+
+    assert read(path) == CONTENT
+    assert "/messages/m1/attachments/a1" in http.request_sequence[0][0]
@@ -0,0 +1,268 @@
+import json
+import re
+
+import pytest
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+
+from gmail_tui.client.store import MessageStore
+from gmail_tui.client.thread import Thread
+
+BOUNDARY = "batch_boundary"
+OK = ({"status": "200"}, "{}")
+
+
+def thread_resource(thread_id: str) -> dict:
+    return {
+        "id": thread_id,
+        "historyId": "1",
+        "messages": [
+            {
+                "id": f"m{thread_id}",
+                "threadId": thread_id,
+                "labelIds": ["INBOX"],
+                "snippet": "Hello",
+                "internalDate": "1689588000000",
+                "payload": {
+                    "headers": [
+                        {"name": "From", "value": "Jane Doe <jane@example.com>"},
+                        {"name": "Subject", "value": f"Thread {thread_id}"},
+                    ]
+                },
+            }
+        ],
+    }
+
+
+def list_response(thread_ids: list[str], next_page_token: str = None) -> tuple:
+    content = {
+        "threads": [{"id": thread_id, "historyId": "1"} for thread_id in thread_ids]
+    }
+    if next_page_token:
+        content["nextPageToken"] = next_page_token
+    return {"status": "200"}, json.dumps(content)
+
+
+def batch_response(parts: dict[str, tuple[int, dict]]) -> tuple:
+    """
+    A multipart/mixed batch response, with the status and the content of the
+    call of each request id.
+    """
+
+    body = ""
+    for request_id, (status, content) in parts.items():
+        body += (
+            f"--{BOUNDARY}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <response-id + {request_id}>\r\n"
+            "\r\n"
+            f"HTTP/1.1 {status} Status\r\n"
+            "Content-Type: application/json\r\n"
+            "\r\n"
+            f"{json.dumps(content)}\r\n"
+        )
+    body += f"--{BOUNDARY}--"
+    headers = {
+        "status": "200",
+        "content-type": f"multipart/mixed; boundary={BOUNDARY}",
+    }
+    return headers, body
+
+
+def batch_id(body: str) -> str:
+    """The id of the batch request of a body, from the Content-ID of its calls"""
+    return re.search(r"Content-ID: <(.+) \+ ", body, re.IGNORECASE)[1]
+
+
+def rate_limited() -> tuple[int, dict]:
+    return 429, {
+        "error": {
+            "code": 429,
+            "message": "Too many concurrent requests for user",
+            "errors": [{"reason": "rateLimitExceeded"}],
+        }
+    }
+
+
+def request_kinds(http: HttpMockSequence) -> list[str]:
+    """Whether each request sent was a threads.list call or a batch"""
+    kinds = []
+    for uri, method, body, headers in http.request_sequence:
+        if uri.endswith("/batch"):
+            assert headers["content-type"].startswith("multipart/mixed")
+            kinds.append("batch")
+        elif "/threads?" in uri:
+            kinds.append("threads.list")
+        else:
+            kinds.append(uri)
+    return kinds
+
+
+def test_get_threads_sends_one_batch_per_chunk(mock_gmail):
+    ids = [f"t{index}" for index in range(150)]
+    gmail, http = mock_gmail(
+        [
+            list_response(ids, "next"),
+            batch_response({i: (200, thread_resource(i)) for i in ids[:100]}),
+            batch_response({i: (200, thread_resource(i)) for i in ids[100:]}),
+        ],
+        batch_size=100,
+    )
+
+    threads, next_page_token = gmail.get_threads(
+        max_results=150, message_format="metadata"
+    )
+
+    assert request_kinds(http) == ["threads.list", "batch", "batch"]
+    assert [thread.id for thread in threads] == ids
+    assert threads[0].last_message.subject == "Thread t0"
+    assert next_page_token == "next"
+    assert gmail.scheduler.calls["gmail.users.threads.get"] == 2
+
+
+def test_get_threads_retries_rate_limited_calls(mock_gmail):
+    ids = ["t1", "t2", "t3"]
+    gmail, http = mock_gmail(
+        [
+            list_response(ids),
+            batch_response(
+                {
+                    "t1": (200, thread_resource("t1")),
+                    "t2": rate_limited(),
+                    "t3": rate_limited(),
+                }
+            ),
+            batch_response({"t2": (200, thread_resource("t2")), "t3": rate_limited()}),
+            batch_response({"t3": (200, thread_resource("t3"))}),
+        ]
+    )
+
+    threads, next_page_token = gmail.get_threads(message_format="metadata")
+
+    assert request_kinds(http) == ["threads.list", "batch", "batch", "batch"]
+    # Only the rate limited calls are sent again
+    retried = http.request_sequence[2][2]
+    assert "/threads/t2?" in retried and "/threads/t3?" in retried
+    assert "/threads/t1?" not in retried
+    assert "/threads/t2?" not in http.request_sequence[3][2]
+    assert [thread.id for thread in threads] == ids
+    assert next_page_token == ""
+    assert gmail.scheduler.retries == 2
+
+
+def test_get_threads_raises_errors_that_cant_be_retried(mock_gmail):
+    gmail, _ = mock_gmail(
+        [
+            list_response(["t1", "t2"]),
+            batch_response(
+                {
+                    "t1": (200, thread_resource("t1")),
+                    "t2": (404, {"error": {"code": 404, "message": "Not Found"}}),
+                }
+            ),
+        ]
+    )
+
+    with pytest.raises(HttpError):
+        gmail.get_threads(message_format="metadata")
+
+
+def test_batch_rate_limited_as_a_whole_is_sent_again(mock_gmail):
+    gmail, http = mock_gmail(
+        [
+            list_response(["t1", "t2"]),
+            ({"status": "429"}, json.dumps(rate_limited()[1])),
+            batch_response(
+                {"t1": (200, thread_resource("t1")), "t2": (200, thread_resource("t2"))}
+            ),
+        ]
+    )
+
+    threads, _ = gmail.get_threads(message_format="metadata")
+
+    assert request_kinds(http) == ["threads.list", "batch", "batch"]
+    # A new batch, with every call, is built for the retry
+    bodies = [body for _, _, body, _ in http.request_sequence[1:]]
+    assert batch_id(bodies[0]) != batch_id(bodies[1])
+    for body in bodies:
+        assert "/threads/t1?" in body and "/threads/t2?" in body
+    assert [thread.id for thread in threads] == ["t1", "t2"]
+    assert gmail.scheduler.retries == 1
+
+
+def batch_modify_bodies(http: HttpMockSequence, method: str = "batchModify") -> list:
+    return [
+        json.loads(body)
+        for uri, _, body, _ in http.request_sequence
+        if f"/messages/{method}?" in uri
+    ]
+
+
+def test_batch_modify_sends_one_request_per_1000_ids(mock_gmail, tmp_path):
+    store = MessageStore(str(tmp_path / "cache.db"))
+    store.save_message(thread_resource("t1")["messages"][0], full=False)
+    ids = [f"m{index}" for index in range(2500)] + ["mt1"]
+    gmail, http = mock_gmail([OK] * 3, store=store)
+
+    gmail.batch_modify(ids, ["starred"], ["inbox"])
+
+    bodies = batch_modify_bodies(http)
+    assert [body["ids"] for body in bodies] == [ids[:1000], ids[1000:2000], ids[2000:]]
+    for body in bodies:
+        assert body["addLabelIds"] == ["STARRED"]
+        assert body["removeLabelIds"] == ["INBOX"]
+    assert store.get_message("mt1", full=False)["labelIds"] == ["STARRED"]
+    store.close()
+
+
+def test_batch_delete_sends_one_request_per_1000_ids(mock_gmail):
+    ids = [f"m{index}" for index in range(1001)]
+    gmail, http = mock_gmail([OK, OK])
+
+    gmail.batch_delete(ids)
+
+    bodies = batch_modify_bodies(http, "batchDelete")
+    assert bodies == [{"ids": ids[:1000]}, {"ids": ids[1000:]}]
+
+
+def big_thread(thread_id: str, size: int, label_catalog) -> Thread:
+    (message,) = thread_resource(thread_id)["messages"]
+    resource = {
+        "id": thread_id,
+        "historyId": "1",
+        "messages": [
+            {**message, "id": f"{thread_id}-{index}", "labelIds": ["INBOX", "UNREAD"]}
+            for index in range(size)
+        ],
+    }
+    return Thread(None, thread_id, resource, label_catalog, "metadata")
+
+
+def test_modify_threads_modifies_every_message(mock_gmail):
+    gmail, http = mock_gmail([OK, OK])
+    threads = [big_thread(f"t{i}", 400, gmail.label_catalog) for i in range(3)]
+    ids = [message.id for thread in threads for message in thread.messages]
+
+    gmail.modify_threads(threads, remove_labels=["unread"])
+
+    bodies = batch_modify_bodies(http)
+    assert [body["ids"] for body in bodies] == [ids[:1000], ids[1000:]]
+    assert all(body["removeLabelIds"] == ["UNREAD"] for body in bodies)
+    for thread in threads:
+        for message in thread.messages:
+            assert [label.id for label in message.labels] == ["INBOX"]
+
+
+def test_modify_threads_restores_the_labels_on_failure(mock_gmail):
+    gmail, http = mock_gmail(
+        [OK, ({"status": "500"}, json.dumps({"error": {"code": 500}}))]
+    )
+    threads = [big_thread(f"t{i}", 600, gmail.label_catalog) for i in range(2)]
+
+    with pytest.raises(HttpError):
+        gmail.modify_threads(threads, remove_labels=["UNREAD"])
+
+    assert len(batch_modify_bodies(http)) == 2
+    for thread in threads:
+        for message in thread.messages:
+            assert [label.id for label in message.labels] == ["INBOX", "UNREAD"]
@@ -0,0 +1,75 @@
+from email.utils import getaddresses
+
+import pytest
+
+from gmail_tui.client.contact import Contact
+from gmail_tui.client.headers import index_headers, parse_address, parse_addresses
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("jane@example.com", [("jane@example.com", None)]),
+        ("Jane Doe <jane@example.com>", [("jane@example.com", "Jane Doe")]),
+        (
+            '"Doe, Jane" <jane@example.com>, bob@example.com',
+            [("jane@example.com", "Doe, Jane"), ("bob@example.com", None)],
+        ),
+        (
+            r'"Jane \"JD\" Doe" <jane@example.com>',
+            [("jane@example.com", 'Jane "JD" Doe')],
+        ),
+        (
+            "Team: jane@example.com, Bob <bob@example.com>;, carol@example.com",
+            [
+                ("jane@example.com", None),
+                ("bob@example.com", "Bob"),
+                ("carol@example.com", None),
+            ],
+        ),
+        ("undisclosed-recipients:;", []),
+        ("jane@example.com (Jane Doe)", [("jane@example.com", "Jane Doe")]),
+        ("Jane<jane@example.com>", [("jane@example.com", "Jane")]),
+        ("  Jane   Q.  Doe <jane@example.com> ", [("jane@example.com", "Jane Q. Doe")]),
+        ('"" <jane@example.com>', [("jane@example.com", None)]),
+        ("", []),
+    ],
+)
+def test_parse_addresses(value, expected):
+    contacts = parse_addresses(value)
+
+    assert contacts == tuple(Contact(email, name) for email, name in expected)
+    # The same contacts as the RFC 5322 parser of the standard library
+    assert [(contact.name or "", contact.email) for contact in contacts] == [
+        (name, email) for name, email in getaddresses([value]) if email
+    ]
+
+
+def test_parsed_headers_are_cached():
+    value = "Jane Doe <jane@example.com>, bob@example.com"
+
+    assert parse_addresses(value) is parse_addresses(value)
+
+
+def test_parse_address():
+    assert parse_address('"Doe, Jane" <jane@example.com>, bob@example.com') is (
+        Contact("jane@example.com", "Doe, Jane")
+    )
+    # A malformed sender is still shown
+    assert parse_address("Mailer Daemon <>") is Contact("Mailer Daemon <>")
+    assert parse_address("  ") is None
+
+
+def test_index_headers():
+    headers = [
+        {"name": "From", "value": "jane@example.com"},
+        {"name": "SUBJECT", "value": "Hi"},
+        {"name": "Received", "value": "first"},
+        {"name": "Received", "value": "last"},
+    ]
+
+    assert index_headers(headers) == {
+        "from": "jane@example.com",
+        "subject": "Hi",
+        "received": "last",
+    }
@@ -0,0 +1,165 @@
+import asyncio
+import json
+
+from gmail_tui.interface import Main, SearchScreen, ThreadRow
+
+
+def thread_resource(thread_id: str) -> dict:
+    return {
+        "id": thread_id,
+        "historyId": "1",
+        "messages": [
+            {
+                "id": f"m{thread_id}",
+                "threadId": thread_id,
+                "labelIds": ["INBOX", "UNREAD"],
+                "snippet": "Hello",
+                "internalDate": "1689588000000",
+                "payload": {
+                    "headers": [
+                        {"name": "From", "value": "Jane Doe <jane@example.com>"},
+                        {"name": "Subject", "value": f"Thread {thread_id}"},
+                    ]
+                },
+            }
+        ],
+    }
+
+
+def page_responses(thread_ids: list[str]) -> list[tuple]:
+    """The threads.list call and the batch of a page of up to 5 threads"""
+    boundary = "batch_boundary"
+    body = "".join(
+        f"--{boundary}\r\n"
+        "Content-Type: application/http\r\n"
+        f"Content-ID: <response-id + {thread_id}>\r\n"
+        "\r\n"
+        "HTTP/1.1 200 OK\r\n"
+        "Content-Type: application/json\r\n"
+        "\r\n"
+        f"{json.dumps(thread_resource(thread_id))}\r\n"
+        for thread_id in thread_ids
+    )
+    return [
+        (
+            {"status": "200"},
+            json.dumps({"threads": [{"id": thread_id} for thread_id in thread_ids]}),
+        ),
+        (
+            {
+                "status": "200",
+                "content-type": f"multipart/mixed; boundary={boundary}",
+            },
+            body + f"--{boundary}--",
+        ),
+    ]
+
+
+def row(thread_id: str) -> ThreadRow:
+    return ThreadRow(thread_id, "Jane", "Subject", "Hello", None, True)
+
+
+def run_app(app: Main, test):
+    async def main():
+        async with app.run_test(size=(100, 20)) as pilot:
+            await test(pilot)
+
+    asyncio.run(main())
+
+
+async def wait_for_rows(pilot, app: Main, count: int):
+    for _ in range(100):
+        if len(app.rows) >= count and app.loading_screen is None:
+            return
+        await pilot.pause(0.05)
+    raise AssertionError(f"{len(app.rows)} rows shown, expected {count}")
+
+
+def test_remember_page_keeps_the_most_recently_used_pages():
+    app = Main(gmail_factory=lambda: None, page_cache_size=2)
+    app.remember_page(None, "", [row("t1")], "p2")
+    app.remember_page(None, "p2", [row("t2")], "")
+    # Showing the first page again makes it the most recently used
+    app.pages.move_to_end((None, ""))
+    app.remember_page("abc", "", [row("t3")], "")
+
+    assert list(app.pages) == [(None, ""), ("abc", "")]
+    assert app.fresh_page(None, "") == ((row("t1"),), "p2")
+    assert app.fresh_page(None, "p2") is None
+
+
+def test_pages_expire_and_are_forgotten():
+    app = Main(gmail_factory=lambda: None)
+    app.remember_page(None, "", [row("t1"), row("t2")], "")
+    app.remember_page("abc", "", [row("t3")], "")
+
+    app.forget_threads({"t2"})
+
+    assert list(app.pages) == [("abc", "")]
+    app.views.ttl = -1
+    assert app.fresh_page("abc", "") is None
+
+
+def test_search_is_debounced(mock_gmail):
+    gmail, _ = mock_gmail(page_responses(["t1"]))
+    app = Main(gmail_factory=lambda: gmail, search_debounce=0.2, prefetch_budget=0)
+    searched = []
+
+    async def test(pilot):
+        await wait_for_rows(pilot, app, 1)
+        app.search = searched.append
+        await pilot.press("slash", *"abc")
+        assert isinstance(app.screen, SearchScreen)
+        assert searched == []
+        await pilot.pause(0.4)
+
+    run_app(app, test)
+    # Only the query the typing stopped at is searched
+    assert searched == ["abc"]
+
+
+def test_recent_queries_are_shown_without_requests(mock_gmail):
+    gmail, http = mock_gmail(page_responses(["t1", "t2"]) + page_responses(["t3"]))
+    app = Main(gmail_factory=lambda: gmail, prefetch_budget=0)
+
+    async def test(pilot):
+        await wait_for_rows(pilot, app, 2)
+        assert app.search("abc")
+        await wait_for_rows(pilot, app, 1)
+        assert [row.id for row in app.rows] == ["t3"]
+        requests = len(http.request_sequence)
+        # Only the page LRU is left
+        app.views.clear()
+
+        assert not app.search("")
+        assert [row.id for row in app.rows] == ["t1", "t2"]
+        assert not app.search("abc")
+        assert [row.id for row in app.rows] == ["t3"]
+        await pilot.pause(0.1)
+        assert len(http.request_sequence) == requests
+
+    run_app(app, test)
+
+
+def test_opened_thread_is_marked_read_by_id(mock_gmail):
+    gmail, _ = mock_gmail(page_responses(["t1", "t2"]))
+    app = Main(gmail_factory=lambda: gmail, prefetch_budget=0)
+
+    async def test(pilot):
+        await wait_for_rows(pilot, app, 2)
+        opened = app.rows[1]
+        # The row above is hidden while the thread opens
+        app.rows.pop(0)
+        app.table.remove_row("t1")
+
+        app.mark_row_as_read(opened)
+
+        assert [(row.id, row.unread) for row in app.rows] == [("t2", False)]
+        assert app.table.get_row_at(0)[0] == ""
+        rows, _, _ = app.pages[(None, "")]
+        assert [(row.id, row.unread) for row in rows] == [("t1", True), ("t2", False)]
+        # A row gone from the table is left alone
+        app.mark_row_as_read(row("t9"))
+        assert len(app.rows) == 1
+
+    run_app(app, test)
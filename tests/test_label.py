@@ -0,0 +1,135 @@
+import gc
+import json
+import weakref
+
+import pytest
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMockSequence
+
+from gmail_tui.client.label import LabelCatalog, shared_catalog
+from gmail_tui.client.store import MessageStore
+
+LABELS = [
+    {"id": label_id, "name": label_id, "type": "system"}
+    for label_id in ("INBOX", "UNREAD", "TRASH")
+]
+WORK = {"id": "Label_1", "name": "Work", "type": "user"}
+
+
+def labels_response(labels: list[dict]) -> tuple:
+    return {"status": "200"}, json.dumps({"labels": labels})
+
+
+def service(responses: list[tuple]):
+    http = HttpMockSequence(responses)
+    return build("gmail", "v1", http=http, static_discovery=True), http
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("gmail_tui.client.label.time.monotonic", clock)
+    return clock
+
+
+def test_labels_are_loaded_once_and_shared(clock):
+    gmail, http = service([labels_response(LABELS)])
+    catalog = LabelCatalog(gmail)
+
+    inbox = catalog.get("INBOX")
+
+    assert inbox.name == "INBOX"
+    assert catalog.get("UNREAD").type == "system"
+    assert catalog.get("INBOX") is inbox
+    assert len(http.request_sequence) == 1
+    assert [label.id for label in catalog] == ["INBOX", "UNREAD", "TRASH"]
+
+
+def test_catalog_is_reloaded_after_its_ttl(clock):
+    renamed = [*LABELS[:2], {**LABELS[2], "name": "Bin"}]
+    gmail, http = service([labels_response(LABELS), labels_response(renamed)])
+    catalog = LabelCatalog(gmail, ttl=60)
+    trash = catalog.get("TRASH")
+
+    clock.now += 60
+    assert catalog.get("TRASH").name == "TRASH"
+    assert len(http.request_sequence) == 1
+    clock.now += 1
+    assert catalog.is_stale
+    # The label already handed out is updated
+    assert catalog.get("TRASH") is trash
+    assert trash.name == "Bin"
+    assert len(http.request_sequence) == 2
+
+
+def test_unknown_ids_reload_the_catalog(clock):
+    gmail, http = service([labels_response(LABELS), labels_response([*LABELS, WORK])])
+    catalog = LabelCatalog(gmail)
+    catalog.get("INBOX")
+
+    # A label created since the catalog was loaded
+    assert catalog.get("Label_1").name == "Work"
+    assert len(http.request_sequence) == 2
+
+
+def test_missing_ids_dont_reload_until_the_ttl_expires(clock):
+    gmail, http = service([labels_response(LABELS)] * 3)
+    catalog = LabelCatalog(gmail, ttl=60)
+    catalog.get("INBOX")
+
+    assert catalog.get("Label_9") is None
+    assert catalog.get("Label_9") is None
+    assert len(http.request_sequence) == 2
+    clock.now += 61
+    assert catalog.get("Label_9") is None
+    assert len(http.request_sequence) == 3
+
+
+def test_catalog_starts_from_the_store_and_saves_to_it(clock, tmp_path):
+    store = MessageStore(str(tmp_path / "cache.db"))
+    store.save_labels(LABELS)
+    gmail, http = service([labels_response([*LABELS, WORK])])
+
+    catalog = LabelCatalog(gmail, store=store)
+
+    assert catalog.get("INBOX").name == "INBOX"
+    assert http.request_sequence == []
+    catalog.get("Label_1")
+    assert [label["id"] for label in store.get_labels()] == [
+        "INBOX",
+        "UNREAD",
+        "TRASH",
+        "Label_1",
+    ]
+    store.close()
+
+
+def test_shared_catalog_is_one_per_service():
+    first, _ = service([])
+    second, _ = service([])
+
+    catalog = shared_catalog(first)
+
+    assert shared_catalog(first) is catalog
+    assert shared_catalog(second) is not catalog
+
+
+def test_shared_catalog_goes_away_with_its_service(clock):
+    gmail, _ = service([labels_response(LABELS)])
+    catalog = shared_catalog(gmail)
+    assert catalog.get("INBOX").name == "INBOX"
+    catalog_ref, service_ref = weakref.ref(catalog), weakref.ref(gmail)
+
+    del gmail, catalog
+    gc.collect()
+
+    assert service_ref() is None
+    assert catalog_ref() is None
@@ -0,0 +1,199 @@
+import base64
+import gc
+import json
+from email.message import EmailMessage
+
+from gmail_tui.client.contact import Contact
+from gmail_tui.client.message import Message
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def message_resource(message_id: str, message_format: str = "full") -> dict:
+    payload = {
+        "mimeType": "multipart/mixed",
+        "headers": [
+            {"name": "From", "value": "Jane Doe <jane@example.com>"},
+            {"name": "To", "value": '"Doe, John" <john@example.com>, team@example.com'},
+            {"name": "Subject", "value": f"Message {message_id}"},
+        ],
+    }
+    if message_format == "full":
+        payload["parts"] = [
+            {
+                "mimeType": "multipart/alternative",
+                "parts": [
+                    {"mimeType": "text/plain", "body": {"data": _b64("Hello")}},
+                    {"mimeType": "text/html", "body": {"data": _b64("<p>Hi</p>")}},
+                ],
+            },
+            {
+                "mimeType": "application/pdf",
+                "filename": "minutes.pdf",
+                "partId": "1",
+                "body": {"attachmentId": "ANGjdJ", "size": 1024},
+            },
+        ]
+    return {
+        "id": message_id,
+        "threadId": "t1",
+        "labelIds": ["INBOX"],
+        "snippet": "Hello",
+        "internalDate": "1689588000000",
+        "payload": payload,
+    }
+
+
+def test_contacts_are_interned():
+    contact = Contact("jane@example.com", "Jane Doe")
+
+    assert Contact("jane@example.com", "Jane Doe") is contact
+    assert Contact("jane@example.com") is not contact
+    assert Contact("jane@example.com", "Jane") is not contact
+
+
+def test_contacts_are_dropped_once_unused():
+    Contact("nobody@example.com", "Nobody")
+    gc.collect()
+
+    assert ("nobody@example.com", "Nobody") not in Contact._interned
+
+
+def test_messages_share_their_contacts(mock_gmail):
+    gmail, _ = mock_gmail([])
+    first = Message(None, "m1", message_resource("m1"), gmail.label_catalog)
+    second = Message(None, "m2", message_resource("m2"), gmail.label_catalog)
+
+    assert first.sender is second.sender
+    assert first.receiver == (
+        Contact("john@example.com", "Doe, John"),
+        Contact("team@example.com"),
+    )
+    assert first.receiver[0] is second.receiver[0]
+
+
+def test_metadata_message_fetches_its_body_when_read(mock_gmail):
+    gmail, http = mock_gmail([({"status": "200"}, json.dumps(message_resource("m1")))])
+    message = Message(
+        gmail._service,
+        "m1",
+        message_resource("m1", "metadata"),
+        gmail.label_catalog,
+        "metadata",
+    )
+
+    assert not message.is_loaded
+    assert message.subject == "Message m1"
+    assert http.request_sequence == []
+
+    content = message.content
+
+    assert content.body == "Hello"
+    assert content.html == "<p>Hi</p>"
+    assert [attachment.filename for attachment in content.attachments] == [
+        "minutes.pdf"
+    ]
+    assert len(http.request_sequence) == 1
+    assert "format=full" in http.request_sequence[0][0]
+    # Read again without a request
+    assert message.content.body == "Hello"
+    assert len(http.request_sequence) == 1
+
+
+def test_full_message_decodes_each_kind_of_part_when_read(mock_gmail):
+    gmail, _ = mock_gmail([])
+    message = Message(None, "m1", message_resource("m1"), gmail.label_catalog)
+
+    assert message._parts is None
+    assert message.body == "Hello"
+    assert set(message._parts) == {"plain"}
+    assert message._leaves is not None
+
+    assert message.html == "<p>Hi</p>"
+    assert len(message.attachments) == 1
+    # Every kind is decoded, the parts aren't needed anymore
+    assert message._leaves is None
+    assert message.body == "Hello"
+
+
+def raw_message() -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "Jane Doe <jane@example.com>"
+    message["To"] = '"Doe, John" <john@example.com>, team@example.com'
+    message["Cc"] = "Bob <bob@example.com>"
+    message["Subject"] = "Minutes of the meeting"
+    message.set_content("Hello, café\n", cte="quoted-printable")
+    message.add_alternative("<p>Hello, café</p>\n", subtype="html")
+    message.add_attachment(b"%PDF-1.4", "application", "pdf", filename="minutes.pdf")
+    return message
+
+
+def full_payload(part: EmailMessage, part_id: str = "") -> dict:
+    """The 'full' payload the Gmail API returns for a message"""
+    payload = {
+        "partId": part_id,
+        "mimeType": part.get_content_type(),
+        "filename": part.get_filename() or "",
+        "headers": [
+            {"name": name, "value": str(value)} for name, value in part.items()
+        ],
+    }
+    if part.is_multipart():
+        payload["body"] = {"size": 0}
+        payload["parts"] = [
+            full_payload(child, f"{part_id}.{index}".lstrip("."))
+            for index, child in enumerate(part.get_payload())
+        ]
+    elif part.get_filename():
+        data = part.get_payload(decode=True)
+        payload["body"] = {"attachmentId": "ANGjdJ", "size": len(data)}
+    else:
+        data = part.get_payload(decode=True)
+        payload["body"] = {
+            "size": len(data),
+            "data": base64.urlsafe_b64encode(data).decode(),
+        }
+    return payload
+
+
+def test_raw_messages_read_like_full_ones(mock_gmail):
+    gmail, _ = mock_gmail([])
+    email = raw_message()
+    resource = {
+        "id": "m1",
+        "threadId": "t1",
+        "labelIds": ["INBOX", "UNREAD"],
+        "snippet": "Hello, café",
+        "internalDate": "1689588000000",
+    }
+    full = Message(
+        None,
+        "m1",
+        {**resource, "payload": full_payload(email)},
+        gmail.label_catalog,
+        "full",
+    )
+    raw = Message(
+        None,
+        "m1",
+        {**resource, "raw": base64.urlsafe_b64encode(email.as_bytes()).decode()},
+        gmail.label_catalog,
+        "raw",
+    )
+
+    assert raw.header == full.header
+    assert raw.sender is Contact("jane@example.com", "Jane Doe")
+    assert raw.cc == (Contact("bob@example.com", "Bob"),)
+    assert raw.labels == full.labels
+    assert raw.body == full.body == "Hello, café\n"
+    assert raw.html == full.html == "<p>Hello, café</p>\n"
+    (raw_attachment,) = raw.attachments
+    (full_attachment,) = full.attachments
+    for name in ("filename", "filetype", "size"):
+        assert getattr(raw_attachment, name) == getattr(full_attachment, name)
+    # The attachment of a raw message is in the message, it isn't fetched
+    assert raw_attachment.data == b"%PDF-1.4"
+    assert full_attachment.data is None
+    assert full_attachment.part_id == "1"
@@ -0,0 +1,213 @@
+import base64
+from email.message import EmailMessage
+
+import pytest
+
+from gmail_tui.client.mime import (
+    ATTACHMENT,
+    HTML,
+    PLAIN,
+    attachment_reference,
+    attachment_references,
+    email_part_kind,
+    join_text,
+    part_kind,
+    walk_email,
+    walk_parts,
+)
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def text(mime_type: str, content: str) -> dict:
+    return {"mimeType": mime_type, "body": {"data": _b64(content)}}
+
+
+def attached(mime_type: str, filename: str, attachment_id: str, **part) -> dict:
+    return {
+        "mimeType": mime_type,
+        "filename": filename,
+        "body": {"attachmentId": attachment_id, "size": 10},
+        **part,
+    }
+
+
+def multipart(subtype: str, *parts: dict) -> dict:
+    return {"mimeType": f"multipart/{subtype}", "body": {"size": 0}, "parts": parts}
+
+
+def recursive_walk(payload: dict) -> list[tuple[str, dict]]:
+    """The leaves found by the recursive walk walk_parts replaced"""
+    if "attachmentId" in payload["body"]:
+        return [(ATTACHMENT, payload)]
+    if payload["mimeType"] == "text/html":
+        return [(HTML, payload)]
+    if payload["mimeType"] == "text/plain":
+        return [(PLAIN, payload)]
+    if payload["mimeType"].startswith("multipart"):
+        return [
+            leaf for part in payload.get("parts", ()) for leaf in recursive_walk(part)
+        ]
+    return []
+
+
+# multipart/mixed with a multipart/alternative body, a forwarded message with
+# its own alternative and attachment, an inline image and attachments
+MESSAGE = multipart(
+    "mixed",
+    multipart(
+        "related",
+        multipart(
+            "alternative",
+            text("text/plain", "Hello"),
+            text("text/html", "<p>Hello</p>"),
+        ),
+        attached("image/png", "logo.png", "A1", headers=[{"name": "Content-ID"}]),
+    ),
+    attached("application/pdf", "minutes.pdf", "A2", partId="1"),
+    multipart(
+        "mixed",
+        multipart(
+            "alternative",
+            text("text/plain", "Forwarded"),
+            text("text/html", "<p>Forwarded</p>"),
+        ),
+        attached("text/plain", "notes.txt", "A3"),
+    ),
+    text("text/plain", "Signature"),
+    {"mimeType": "application/pgp-signature", "body": {"data": _b64("sig")}},
+)
+
+
+def test_leaves_are_in_the_order_of_the_recursive_walk():
+    leaves = list(walk_parts(MESSAGE))
+
+    assert leaves == recursive_walk(MESSAGE)
+    assert [kind for kind, _ in leaves] == [
+        PLAIN,
+        HTML,
+        ATTACHMENT,
+        ATTACHMENT,
+        PLAIN,
+        HTML,
+        ATTACHMENT,
+        PLAIN,
+    ]
+
+
+def test_text_of_nested_alternatives_is_joined_in_order():
+    leaves = list(walk_parts(MESSAGE))
+
+    assert join_text(leaves, PLAIN) == "Hello\nForwarded\nSignature"
+    assert join_text(leaves, HTML) == "<p>Hello</p><br/><p>Forwarded</p>"
+    assert join_text([], HTML) is None
+
+
+@pytest.mark.parametrize(
+    "part, kind",
+    [
+        (text("text/plain", "Hi"), PLAIN),
+        (text("text/html", "<p>Hi</p>"), HTML),
+        # Parts with an attachment id are attachments, whatever their type
+        # and even when shown inline
+        (attached("text/plain", "notes.txt", "A1"), ATTACHMENT),
+        (attached("text/html", "page.html", "A1"), ATTACHMENT),
+        (attached("image/png", "logo.png", "A1"), ATTACHMENT),
+        # Inline parts of other types are not shown
+        ({"mimeType": "image/png", "body": {"data": _b64("png")}}, None),
+        (multipart("alternative"), None),
+    ],
+)
+def test_part_kinds(part, kind):
+    assert part_kind(part) == kind
+
+
+def test_kinds_filter_the_leaves():
+    kinds = [kind for kind, _ in walk_parts(MESSAGE, kinds=[ATTACHMENT])]
+
+    assert kinds == [ATTACHMENT] * 3
+    assert list(walk_parts(MESSAGE, kinds=())) == []
+
+
+def test_attachment_references():
+    references = attachment_references(walk_parts(MESSAGE))
+
+    assert [reference["filename"] for reference in references] == [
+        "logo.png",
+        "minutes.pdf",
+        "notes.txt",
+    ]
+    assert references[1] == {
+        "part_type": ATTACHMENT,
+        "filetype": "application/pdf",
+        "filename": "minutes.pdf",
+        "attachment_id": "A2",
+        "part_id": "1",
+        "size": 10,
+        "data": None,
+    }
+    unnamed = attachment_references([(ATTACHMENT, attached("image/png", "", "A4"))])
+    assert unnamed[0]["filename"] == "unknown"
+
+
+def test_deep_nesting_doesnt_reach_the_recursion_limit():
+    payload = text("text/plain", "Deep")
+    for _ in range(5000):
+        payload = multipart("mixed", payload)
+
+    assert [kind for kind, _ in walk_parts(payload)] == [PLAIN]
+
+
+def nested_email() -> EmailMessage:
+    """A multipart/mixed message like MESSAGE, without its signature parts"""
+    alternative = EmailMessage()
+    alternative.set_content("Hello")
+    alternative.add_alternative("<p>Hello</p>", subtype="html")
+    related = EmailMessage()
+    related.make_related()
+    related.attach(alternative)
+    related.add_related(b"png", "image", "png", filename="logo.png", cid="<logo>")
+    forwarded = EmailMessage()
+    forwarded.set_content("Forwarded")
+    forwarded.add_alternative("<p>Forwarded</p>", subtype="html")
+    forwarded.add_attachment("Notes", filename="notes.txt")
+    message = EmailMessage()
+    message["From"] = "Jane Doe <jane@example.com>"
+    message.make_mixed()
+    message.attach(related)
+    message.add_attachment(b"%PDF", "application", "pdf", filename="minutes.pdf")
+    message.attach(forwarded)
+    return message
+
+
+def test_walk_email_finds_the_leaves_of_walk_parts():
+    leaves = list(walk_email(nested_email()))
+
+    assert [kind for kind, _ in leaves] == [
+        PLAIN,
+        HTML,
+        ATTACHMENT,
+        ATTACHMENT,
+        PLAIN,
+        HTML,
+        ATTACHMENT,
+    ]
+    assert join_text(leaves, PLAIN) == "Hello\n\nForwarded\n"
+    assert [reference["filename"] for reference in attachment_references(leaves)] == [
+        "logo.png",
+        "minutes.pdf",
+        "notes.txt",
+    ]
+
+
+def test_email_parts_with_a_filename_are_attachments():
+    inline = EmailMessage()
+    inline.set_content("Hi", disposition="inline")
+    image = EmailMessage()
+    image.set_content(b"png", "image", "png", disposition="inline", filename="a.png")
+
+    assert email_part_kind(inline) == PLAIN
+    assert email_part_kind(image) == ATTACHMENT
+    assert attachment_reference(image)["data"] == b"png"
@@ -0,0 +1,196 @@
+import json
+import threading
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from gmail_tui.client.message import Message
+from gmail_tui.client.mutations import MutationQueue
+from gmail_tui.client.store import MessageStore
+
+OK = ({"status": "200"}, "{}")
+SERVER_ERROR = ({"status": "500"}, json.dumps({"error": {"code": 500}}))
+
+
+def message_resource(message_id: str) -> dict:
+    return {
+        "id": message_id,
+        "threadId": "t1",
+        "labelIds": ["INBOX", "UNREAD"],
+        "snippet": "Hello",
+        "internalDate": "1689588000000",
+        "payload": {
+            "headers": [
+                {"name": "From", "value": "Jane Doe <jane@example.com>"},
+                {"name": "Subject", "value": f"Message {message_id}"},
+            ]
+        },
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MessageStore(str(tmp_path / "cache.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def client(mock_gmail, store):
+    """Builds a Gmail client and messages m1 and m2 saved in its store"""
+
+    def make(responses: list[tuple]):
+        gmail, http = mock_gmail(responses, store=store)
+        messages = []
+        for message_id in ("m1", "m2"):
+            resource = message_resource(message_id)
+            store.save_message(resource, full=False)
+            messages.append(
+                Message(
+                    gmail._service,
+                    message_id,
+                    resource,
+                    gmail.label_catalog,
+                    "metadata",
+                    store,
+                )
+            )
+        return gmail, http, messages
+
+    return make
+
+
+def label_ids(message: Message) -> set[str]:
+    return {label.id for label in message.labels}
+
+
+def sent_bodies(http) -> list[dict]:
+    return [
+        json.loads(body)
+        for uri, _, body, _ in http.request_sequence
+        if "/messages/batchModify?" in uri
+    ]
+
+
+def test_changes_are_collapsed_and_grouped(client, store):
+    gmail, http, (m1, m2) = client([OK, OK])
+    queue = MutationQueue(gmail, delay=60)
+
+    queue.modify([m1, m2], remove_labels=["unread"])
+    queue.modify([m1], add_labels=["TRASH"])
+
+    # Applied at once, and saved to survive a crash
+    assert label_ids(m1) == {"INBOX", "TRASH"}
+    assert store.get_message("m1", full=False)["labelIds"] == ["INBOX", "TRASH"]
+    assert sorted(store.get_mutations()) == [
+        ("m1", ["TRASH"], ["UNREAD"], ["INBOX", "UNREAD"]),
+        ("m2", [], ["UNREAD"], ["INBOX", "UNREAD"]),
+    ]
+    assert len(queue) == 2
+    queue.flush()
+
+    assert sent_bodies(http) == [
+        {"ids": ["m1"], "addLabelIds": ["TRASH"], "removeLabelIds": ["UNREAD"]},
+        {"ids": ["m2"], "addLabelIds": [], "removeLabelIds": ["UNREAD"]},
+    ]
+    assert len(queue) == 0
+    assert store.get_mutations() == []
+    queue.close()
+
+
+def test_messages_with_the_same_changes_are_sent_together(client):
+    gmail, http, (m1, m2) = client([OK])
+    queue = MutationQueue(gmail, delay=60)
+
+    queue.modify([m1], remove_labels=["UNREAD"])
+    queue.modify([m2], remove_labels=["UNREAD"])
+    queue.flush()
+
+    assert sent_bodies(http) == [
+        {"ids": ["m1", "m2"], "addLabelIds": [], "removeLabelIds": ["UNREAD"]}
+    ]
+    queue.close()
+
+
+def test_opposite_changes_cancel_out(client, store):
+    gmail, http, (m1, _) = client([])
+    queue = MutationQueue(gmail, delay=60)
+
+    queue.modify([m1], remove_labels=["UNREAD"])
+    queue.modify([m1], add_labels=["UNREAD"])
+
+    assert len(queue) == 0
+    assert store.get_mutations() == []
+    queue.flush()
+    assert http.request_sequence == []
+    queue.close()
+
+
+@pytest.mark.parametrize("error", [HttpError, TimeoutError, ConnectionError])
+def test_failed_changes_are_rolled_back(client, store, monkeypatch, error):
+    gmail, _, (m1, m2) = client([SERVER_ERROR])
+    if error is not HttpError:
+
+        def batch_modify(*args):
+            raise error("The request could not be sent")
+
+        monkeypatch.setattr(gmail, "batch_modify", batch_modify)
+    errors = []
+    queue = MutationQueue(gmail, delay=60, on_error=lambda *args: errors.append(args))
+
+    queue.modify([m1, m2], remove_labels=["UNREAD"])
+    queue.flush()
+
+    assert len(errors) == 1
+    assert isinstance(errors[0][0], error)
+    assert errors[0][1] == ["m1", "m2"]
+    for message in (m1, m2):
+        assert label_ids(message) == {"INBOX", "UNREAD"}
+        assert store.get_message(message.id, full=False)["labelIds"] == [
+            "INBOX",
+            "UNREAD",
+        ]
+    assert store.get_mutations() == []
+    queue.close()
+
+
+def test_the_queue_keeps_running_after_a_failure(client, monkeypatch):
+    gmail, _, (m1, m2) = client([])
+    sent = []
+    failed = threading.Event()
+    done = threading.Event()
+
+    def batch_modify(message_ids, add_labels, remove_labels):
+        if not failed.is_set():
+            raise OSError("Connection reset by peer")
+        sent.append(message_ids)
+        done.set()
+
+    monkeypatch.setattr(gmail, "batch_modify", batch_modify)
+    queue = MutationQueue(gmail, delay=0, on_error=lambda *args: failed.set())
+
+    queue.modify([m1], remove_labels=["UNREAD"])
+    assert failed.wait(5)
+    queue.modify([m2], remove_labels=["UNREAD"])
+    assert done.wait(5)
+
+    assert sent == [["m2"]]
+    assert label_ids(m1) == {"INBOX", "UNREAD"}
+    assert label_ids(m2) == {"INBOX"}
+    queue.close(timeout=5)
+
+
+def test_saved_changes_are_sent_when_the_client_starts(mock_gmail, store):
+    store.save_message(message_resource("m1"), full=False)
+    store.save_mutation("m1", ["TRASH"], ["UNREAD"], ["INBOX", "UNREAD"])
+
+    gmail, http = mock_gmail([OK], store=store)
+    assert len(gmail.mutations) == 1
+    # Closing the queue sends the changes without waiting for the delay
+    gmail.mutations.close(timeout=5)
+
+    assert sent_bodies(http) == [
+        {"ids": ["m1"], "addLabelIds": ["TRASH"], "removeLabelIds": ["UNREAD"]}
+    ]
+    assert store.get_mutations() == []
+    assert store.get_message("m1", full=False)["labelIds"] == ["INBOX", "TRASH"]
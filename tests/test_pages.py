@@ -0,0 +1,79 @@
+from gmail_tui.interface import ThreadRow
+from gmail_tui.pages import ROW_OVERHEAD, PageCache, TableView
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def view(*thread_ids: str, cursor_row: int = 0) -> TableView:
+    rows = tuple(
+        ThreadRow(thread_id, "Jane", "Subject", "Hello", None, True)
+        for thread_id in thread_ids
+    )
+    return TableView(rows, "", cursor_row, 0)
+
+
+# Bytes of a row of `view`
+ROW_SIZE = ROW_OVERHEAD + len("t1JaneSubjectHello")
+
+
+def test_views_expire_after_their_ttl():
+    clock = FakeClock()
+    cache = PageCache(ttl=10, clock=clock)
+    cache.put("abc", view("t1", cursor_row=1))
+
+    clock.now = 10
+    assert cache.get("abc").cursor_row == 1
+    clock.now = 10.5
+    assert cache.get("abc") is None
+    assert "abc" not in cache
+
+
+def test_least_recently_used_views_are_dropped_when_full():
+    cache = PageCache(max_bytes=ROW_SIZE * 3, clock=FakeClock())
+    cache.put(None, view("t1"))
+    cache.put("abc", view("t2"))
+    # Reading a view makes it the most recently used
+    assert cache.get(None) is not None
+
+    cache.put("def", view("t3", "t4"))
+
+    assert None in cache and "def" in cache
+    assert "abc" not in cache
+    assert len(cache) == 2
+
+
+def test_the_last_view_is_kept_even_if_too_big():
+    cache = PageCache(max_bytes=ROW_SIZE, clock=FakeClock())
+    cache.put(None, view("t1"))
+    cache.put("abc", view("t2", "t3", "t4"))
+
+    assert "abc" in cache and None not in cache
+
+
+def test_replacing_a_view_frees_its_size():
+    cache = PageCache(max_bytes=ROW_SIZE * 2, clock=FakeClock())
+    cache.put(None, view("t1"))
+    for _ in range(5):
+        cache.put("abc", view("t2"))
+
+    assert len(cache) == 2
+
+
+def test_rows_are_replaced_and_threads_forgotten():
+    cache = PageCache(clock=FakeClock())
+    cache.put(None, view("t1", "t2"))
+    cache.put("abc", view("t2", "t3"))
+    read = view("t2").rows[0]._replace(unread=False)
+
+    cache.replace_rows([read])
+
+    assert cache.get(None).rows[1] is read
+    assert cache.get("abc").rows[0] is read
+    cache.forget_threads({"t3"})
+    assert None in cache and "abc" not in cache
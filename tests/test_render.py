@@ -0,0 +1,124 @@
+import pytest
+
+from gmail_tui.render import RenderCache, html_to_markdown
+
+
+@pytest.mark.parametrize(
+    "html, markdown",
+    [
+        (
+            '<p>Hello <a href="https://example.com/a b">the <b>site</b></a>.</p>',
+            "Hello [the **site**](https://example.com/a%20b).\n",
+        ),
+        (
+            '<a href="mailto:jane@example.com">Jane</a>',
+            "[Jane](mailto:jane@example.com)\n",
+        ),
+        # Links showing their own address, other schemes and images
+        (
+            '<a href="https://example.com">https://example.com</a>',
+            "https://example.com\n",
+        ),
+        ('<a href="javascript:run()">Click</a>', "Click\n"),
+        ('<a href="https://example.com"><img src="logo.png"></a>After', "After\n"),
+    ],
+)
+def test_links(html, markdown):
+    assert html_to_markdown(html) == markdown
+
+
+def test_lists():
+    html = (
+        "<p>Agenda:</p><ul><li>One</li><li>Two<ol><li>First</li><li>Second</li>"
+        "</ol></li></ul><p>End</p>"
+    )
+
+    assert html_to_markdown(html) == (
+        "Agenda:\n\n- One\n- Two\n  1. First\n  2. Second\n\nEnd\n"
+    )
+
+
+def test_line_breaks():
+    assert html_to_markdown("One<br>Two<br/><br>Three") == "One  \nTwo\n\nThree\n"
+    # Leading breaks are dropped
+    assert html_to_markdown("<br><br>Text") == "Text\n"
+
+
+def test_tables_have_a_line_per_row():
+    html = (
+        "<table><tr><th>Item</th><th>Qty</th></tr>"
+        "<tr><td>Apple</td><td>2</td></tr></table>"
+    )
+
+    assert html_to_markdown(html) == "Item Qty  \nApple 2\n"
+
+
+def test_scripts_and_styles_are_dropped():
+    html = (
+        "<html><head><title>Title</title><style>p { color: red }</style></head>"
+        "<body><script>alert('hi')</script><p>Shown</p>"
+        "<noscript>Enable JavaScript</noscript></body></html>"
+    )
+
+    assert html_to_markdown(html) == "Shown\n"
+
+
+def test_blocks_and_escapes():
+    html = (
+        "<h2>Title</h2><blockquote>Quoted<br>text</blockquote>"
+        "<pre>a  b\n  c</pre><p>1 * 2 &lt; <i>3</i>\n   and  snake_case</p>"
+    )
+
+    assert html_to_markdown(html) == (
+        "## Title\n\n> Quoted  \n> text\n\n```\na  b\n  c\n```\n\n"
+        "1 \\* 2 \\< *3* and snake\\_case\n"
+    )
+
+
+class FakeMessage:
+    def __init__(self, message_id: str, body: str = None, html: str = None):
+        self.id = message_id
+        self.body = body
+        self.html = html
+
+
+def test_html_is_converted_once_and_only_without_plain_text(monkeypatch):
+    converted = []
+
+    def convert(html: str) -> str:
+        converted.append(html)
+        return html_to_markdown(html)
+
+    monkeypatch.setattr("gmail_tui.render.html_to_markdown", convert)
+    cache = RenderCache()
+
+    assert cache.render(FakeMessage("m1", "Plain", "<p>HTML</p>")) == "Plain"
+    assert converted == []
+    message = FakeMessage("m2", html="<p>HTML</p>")
+    assert cache.render(message) == "HTML\n"
+    assert cache.render(message) == "HTML\n"
+    assert converted == ["<p>HTML</p>"]
+    assert cache.render(FakeMessage("m3")) == ""
+
+
+def test_render_cache_keeps_the_most_recently_rendered():
+    cache = RenderCache(max_chars=10)
+    messages = [FakeMessage(f"m{index}", body="x" * 4) for index in range(3)]
+    cache.render(messages[0])
+    cache.render(messages[1])
+    # Reading a message makes it the most recently used
+    cache.render(messages[0])
+
+    cache.render(messages[2])
+
+    assert len(cache) == 2
+    assert list(cache._rendered) == ["m0", "m2"]
+    assert cache._size == 8
+
+
+def test_render_cache_keeps_the_last_message_even_if_too_big():
+    cache = RenderCache(max_chars=10)
+    cache.render(FakeMessage("m1", body="x" * 4))
+
+    assert cache.render(FakeMessage("m2", body="x" * 50)) == "x" * 50
+    assert list(cache._rendered) == ["m2"]
@@ -0,0 +1,199 @@
+import threading
+import time
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from gmail_tui.client.scheduler import Priority, RequestScheduler, is_retryable
+
+
+class FakeTime:
+    """A clock that only moves when the scheduler sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def http_error(status: int, content: bytes = b"", **headers) -> HttpError:
+    return HttpError(httplib2.Response({"status": status, **headers}), content)
+
+
+RATE_LIMITED = b'{"error": {"errors": [{"reason": "rateLimitExceeded"}]}}'
+FORBIDDEN = b'{"error": {"errors": [{"reason": "insufficientPermissions"}]}}'
+
+
+def make_scheduler(fake: FakeTime, **kwargs) -> RequestScheduler:
+    return RequestScheduler(
+        clock=fake.clock, sleep=fake.sleep, jitter=lambda: 0, **kwargs
+    )
+
+
+def failing(*errors: HttpError):
+    """A request that fails with the errors, then succeeds"""
+    errors = list(errors)
+    calls = []
+
+    def request():
+        calls.append(None)
+        if errors:
+            raise errors.pop(0)
+        return "done"
+
+    return request, calls
+
+
+def test_requests_wait_for_the_bucket_to_refill():
+    fake = FakeTime()
+    scheduler = make_scheduler(fake, rate=10)
+
+    scheduler.acquire(10)
+    assert fake.sleeps == []
+    scheduler.acquire(5)
+    assert fake.sleeps == [0.5]
+    # A request can't cost more than the bucket holds
+    scheduler.acquire(50)
+    assert fake.sleeps == [0.5, 1.0]
+
+
+def test_run_counts_units_and_calls():
+    fake = FakeTime()
+    scheduler = make_scheduler(fake)
+
+    assert scheduler.run(lambda: "done", 10, method_id="gmail.users.threads.get")
+    scheduler.run(lambda: "done", 5, method_id="gmail.users.messages.get")
+
+    assert scheduler.units == 15
+    assert scheduler.calls == {
+        "gmail.users.threads.get": 1,
+        "gmail.users.messages.get": 1,
+    }
+
+
+def test_lane_sets_the_priority_of_the_thread():
+    scheduler = RequestScheduler()
+
+    assert scheduler.priority == Priority.INTERACTIVE
+    with scheduler.lane(Priority.BACKGROUND):
+        assert scheduler.priority == Priority.BACKGROUND
+        priorities = []
+        thread = threading.Thread(target=lambda: priorities.append(scheduler.priority))
+        thread.start()
+        thread.join()
+        # Other threads keep their own lane
+        assert priorities == [Priority.INTERACTIVE]
+    assert scheduler.priority == Priority.INTERACTIVE
+
+
+def test_interactive_requests_go_before_waiting_prefetches():
+    fake = FakeTime()
+    sleepers = []
+    wake = threading.Event()
+
+    def sleep(seconds: float):
+        sleepers.append(threading.current_thread().name)
+        wake.wait(5)
+        fake.sleep(seconds)
+
+    scheduler = RequestScheduler(rate=1, clock=fake.clock, sleep=sleep)
+    # Empties the bucket
+    scheduler.acquire(1)
+    order = []
+
+    def request(priority: Priority):
+        scheduler.acquire(1, priority)
+        order.append(priority)
+
+    def start(priority: Priority, sleeping: int):
+        thread = threading.Thread(target=request, args=(priority,), name=priority.name)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while len(sleepers) < sleeping and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return thread
+
+    # Both wait for units, the prefetch first
+    threads = [start(Priority.PREFETCH, 1), start(Priority.INTERACTIVE, 2)]
+    assert sleepers == ["PREFETCH", "INTERACTIVE"]
+    wake.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == [Priority.INTERACTIVE, Priority.PREFETCH]
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        http_error(429),
+        http_error(500),
+        http_error(503),
+        http_error(403, RATE_LIMITED),
+        http_error(403, b"userRateLimitExceeded"),
+    ],
+)
+def test_rate_limits_and_server_errors_are_retried(error):
+    fake = FakeTime()
+    scheduler = make_scheduler(fake)
+    request, calls = failing(error, error)
+
+    assert scheduler.run(request) == "done"
+    assert len(calls) == 3
+    assert scheduler.retries == 2
+    # Exponential backoff, half of it random
+    assert fake.sleeps == [0.5, 1.0]
+
+
+@pytest.mark.parametrize(
+    "error", [http_error(400), http_error(403, FORBIDDEN), http_error(404)]
+)
+def test_other_errors_are_not_retried(error):
+    scheduler = make_scheduler(FakeTime())
+    request, calls = failing(error)
+
+    assert not is_retryable(error)
+    with pytest.raises(HttpError):
+        scheduler.run(request)
+    assert len(calls) == 1
+    assert scheduler.retries == 0
+
+
+def test_retries_give_up_after_max_retries():
+    fake = FakeTime()
+    scheduler = make_scheduler(fake, max_retries=3, max_delay=3)
+    request, calls = failing(*[http_error(429)] * 10)
+
+    with pytest.raises(HttpError):
+        scheduler.run(request)
+    assert len(calls) == 4
+    assert fake.sleeps == [0.5, 1.0, 1.5]
+
+
+def test_backoff_waits_at_least_retry_after():
+    fake = FakeTime()
+    scheduler = make_scheduler(fake)
+    request, _ = failing(http_error(429, **{"retry-after": "7"}))
+
+    scheduler.run(request)
+
+    assert fake.sleeps == [7.0]
+
+
+def test_backoff_makes_the_other_requests_wait():
+    fake = FakeTime()
+    scheduler = make_scheduler(fake, rate=10)
+
+    fake.sleep(scheduler.backoff(0))
+    fake.sleeps.clear()
+    scheduler.acquire(10)
+
+    # The bucket was emptied, it refilled while the backoff was slept
+    assert fake.sleeps == [0.5]
@@ -0,0 +1,163 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+from gmail_tui.client.search import SearchQuery, parse_query
+from gmail_tui.client.store import MessageStore
+
+
+def timestamp(year: int, month: int, day: int) -> int:
+    return int(datetime(year, month, day).timestamp() * 1000)
+
+
+def message_resource(
+    message_id: str,
+    thread_id: str,
+    labels: list[str],
+    date: int = 1689588000000,
+    to: str = "Bob <bob@example.com>",
+    body: str = "See you at the meeting",
+) -> dict:
+    return {
+        "id": message_id,
+        "threadId": thread_id,
+        "labelIds": labels,
+        "snippet": "Hello",
+        "internalDate": str(date),
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "From", "value": "Jane Doe <jane@example.com>"},
+                {"name": "To", "value": to},
+                {"name": "Subject", "value": f"Invoice {message_id}"},
+            ],
+            "body": {"data": base64.urlsafe_b64encode(body.encode()).decode()},
+        },
+    }
+
+
+def metadata(message: dict) -> dict:
+    """The message as fetched with the former METADATA_HEADERS"""
+    headers = [
+        header
+        for header in message["payload"]["headers"]
+        if header["name"] in ("From", "Subject", "Date")
+    ]
+    return {**message, "payload": {"mimeType": "text/plain", "headers": headers}}
+
+
+def test_text_terms_and_operators():
+    query = parse_query('meeting from:jane to:"Bob Smith" subject:invoice')
+
+    assert query.match == (
+        '"meeting"* AND sender : "jane"* AND recipients : "Bob Smith"*'
+        ' AND subject : "invoice"*'
+    )
+    assert query.exclude is None
+
+
+def test_negated_terms():
+    query = parse_query("-refund -from:bob -is:unread -label:work")
+
+    assert query.match is None
+    assert query.exclude == '"refund"* OR sender : "bob"*'
+    assert query.labels == ()
+    assert query.excluded_labels == ("UNREAD", "WORK")
+
+
+def test_is_and_in_operators_are_label_filters():
+    query = parse_query("is:starred in:inbox -in:spam is:read")
+
+    assert query.labels == ("STARRED", "INBOX")
+    assert query.excluded_labels == ("SPAM", "UNREAD")
+    assert query.match is None
+
+
+def test_label_names_are_resolved():
+    labels = {"work": "Label_1", "side projects": "Label_2"}
+
+    assert parse_query('label:"Side Projects"', labels).labels == ("Label_2",)
+    assert parse_query("label:side-projects", labels).labels == ("Label_2",)
+    assert parse_query("label:Work in:work", labels).labels == ("Label_1", "Label_1")
+    # Unknown labels are taken as label ids
+    assert parse_query("label:starred", labels).labels == ("STARRED",)
+
+
+def test_dates():
+    query = parse_query("after:2023/08/01 before:2023-09-01")
+
+    assert query.after == timestamp(2023, 8, 1)
+    assert query.before == timestamp(2023, 9, 1)
+    assert parse_query("after:1690848000").after == 1690848000000
+    assert parse_query("before:08/31/2023").before == timestamp(2023, 8, 31)
+    # Dates that can't be parsed are searched as text
+    assert parse_query("after:yesterday").match == '"after yesterday"*'
+
+
+def test_unsupported_operators_are_searched_as_text():
+    assert parse_query('has:attachment "say hi"').match == (
+        '"has attachment"* AND "say hi"*'
+    )
+    # Quotes are escaped
+    assert parse_query('o"clock').match == '"o""clock"*'
+    assert parse_query("") == SearchQuery()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MessageStore(str(tmp_path / "cache.db"))
+    if not store.searchable:
+        pytest.skip("SQLite was built without FTS5")
+    store.save_message(message_resource("m1", "t1", ["INBOX", "UNREAD"]), full=True)
+    store.save_message(
+        message_resource(
+            "m2", "t2", ["INBOX"], timestamp(2023, 8, 15), to="alice@example.com"
+        ),
+        full=False,
+    )
+    store.save_message(
+        message_resource("m3", "t2", ["INBOX", "Label_1"], timestamp(2023, 8, 20)),
+        full=True,
+    )
+    store.save_message(message_resource("m4", "t3", ["TRASH"]), full=True)
+    yield store
+    store.close()
+
+
+def search(store: MessageStore, query: str, **kwargs) -> list[str]:
+    return store.search_threads(parse_query(query, {"work": "Label_1"}), **kwargs)
+
+
+def test_search_threads_newest_first(store):
+    assert search(store, "invoice") == ["t2", "t1"]
+    assert search(store, "invoice", max_results=1) == ["t2"]
+    assert search(store, "invoice", offset=1) == ["t1"]
+    # Bodies are only indexed for messages fetched in full
+    assert search(store, "meeting -subject:m3") == ["t1"]
+    assert search(store, "subject:m2") == ["t2"]
+
+
+def test_search_threads_by_label_and_date(store):
+    assert search(store, "in:inbox is:unread") == ["t1"]
+    assert search(store, "label:work") == ["t2"]
+    assert search(store, "in:inbox -label:work") == ["t2", "t1"]
+    assert search(store, "after:2023/08/01 before:2023/08/18") == ["t2"]
+    assert search(store, "to:alice") == ["t2"]
+    assert search(store, "to:bob -to:alice") == ["t2", "t1"]
+
+
+def test_search_threads_only_finds_trash_when_asked(store):
+    assert "t3" not in search(store, "invoice")
+    assert search(store, "in:trash") == ["t3"]
+
+
+def test_search_threads_keeps_what_metadata_lacks(store):
+    store.save_message(metadata(message_resource("m1", "t1", ["INBOX"])), full=False)
+
+    assert search(store, "to:bob") == ["t2", "t1"]
+    assert search(store, "meeting") == ["t2", "t1"]
+
+
+def test_search_threads_with_invalid_syntax(store):
+    assert store.search_threads(SearchQuery(match='"unterminated')) == []
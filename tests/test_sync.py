@@ -0,0 +1,159 @@
+import json
+
+import pytest
+
+from gmail_tui.client.store import MessageStore
+
+
+def message_resource(message_id: str, label_ids: list[str], body: str = None) -> dict:
+    payload = {
+        "mimeType": "text/plain",
+        "headers": [
+            {"name": "From", "value": "Jane Doe <jane@example.com>"},
+            {"name": "Subject", "value": f"Message {message_id}"},
+        ],
+    }
+    if body is not None:
+        payload["body"] = {"size": len(body), "data": body}
+    return {
+        "id": message_id,
+        "threadId": f"t{message_id}",
+        "historyId": "1",
+        "labelIds": label_ids,
+        "snippet": "Hello",
+        "internalDate": "1689588000000",
+        "payload": payload,
+    }
+
+
+def response(content: dict, status: int = 200) -> tuple[dict, str]:
+    return {"status": str(status)}, json.dumps(content)
+
+
+def history_response(records: list[dict], history_id: str = "20") -> tuple:
+    return response({"history": records, "historyId": history_id})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MessageStore(str(tmp_path / "cache.db"))
+    yield store
+    store.close()
+
+
+def test_first_sync_starts_from_the_profile(mock_gmail, store):
+    gmail, http = mock_gmail([response({"historyId": "10"})], store=store)
+
+    assert gmail.sync() == set()
+    assert store.history_id == "10"
+    assert "/profile" in http.request_sequence[0][0]
+
+
+def test_sync_applies_label_changes_locally(mock_gmail, store):
+    store.save_message(message_resource("m1", ["INBOX", "UNREAD"]), full=False)
+    store.history_id = "10"
+    read = {"id": "m1", "threadId": "tm1", "labelIds": ["INBOX"]}
+    gmail, http = mock_gmail(
+        [
+            history_response(
+                [
+                    {
+                        "id": "15",
+                        "messages": [read],
+                        "labelsRemoved": [{"message": read, "labelIds": ["UNREAD"]}],
+                    }
+                ]
+            )
+        ],
+        store=store,
+    )
+
+    assert gmail.sync() == {"tm1"}
+    # Nothing is fetched again
+    assert len(http.request_sequence) == 1
+    assert store.get_message("m1", full=False)["labelIds"] == ["INBOX"]
+    assert store.get_thread("tm1", full=False, history_id="15") is not None
+    assert store.history_id == "20"
+
+
+def test_sync_fetches_added_messages_and_drops_deleted_ones(mock_gmail, store):
+    store.save_message(message_resource("m1", ["INBOX"]), full=False)
+    store.history_id = "10"
+    added = {"id": "m2", "threadId": "tm2", "labelIds": ["INBOX", "UNREAD"]}
+    short_lived = {"id": "m3", "threadId": "tm3", "labelIds": ["INBOX"]}
+    deleted = {"id": "m1", "threadId": "tm1"}
+    gmail, http = mock_gmail(
+        [
+            history_response(
+                [
+                    {
+                        "id": "11",
+                        "messages": [added, short_lived],
+                        "messagesAdded": [
+                            {"message": added},
+                            {"message": short_lived},
+                        ],
+                    },
+                    {
+                        "id": "12",
+                        "messages": [deleted, short_lived],
+                        "messagesDeleted": [
+                            {"message": deleted},
+                            {"message": short_lived},
+                        ],
+                    },
+                ]
+            ),
+            response(message_resource("m2", ["INBOX"])),
+        ],
+        store=store,
+        hydration="parallel",
+    )
+
+    assert gmail.sync() == {"tm1", "tm2", "tm3"}
+    # Only the message still there is fetched, in 'metadata' format
+    assert len(http.request_sequence) == 2
+    assert "/messages/m2?" in http.request_sequence[1][0]
+    assert "format=metadata" in http.request_sequence[1][0]
+    assert store.get_message("m1", full=False) is None
+    assert store.get_message("m3", full=False) is None
+    # The labels of the history win over the fetched ones
+    assert store.get_message("m2", full=False)["labelIds"] == ["INBOX", "UNREAD"]
+
+
+def test_sync_resets_the_store_when_the_history_is_too_old(mock_gmail, store):
+    store.save_message(message_resource("m1", ["INBOX"]), full=False)
+    store.history_id = "10"
+    gmail, _ = mock_gmail(
+        [
+            response({"error": {"code": 404, "message": "Not Found"}}, 404),
+            response({"historyId": "30"}),
+        ],
+        store=store,
+    )
+
+    assert gmail.sync() is None
+    assert store.get_message("m1", full=False) is None
+    assert store.history_id == "30"
+
+
+def test_store_evicts_the_least_recently_read_bodies(tmp_path, monkeypatch):
+    now = iter(range(1000))
+    monkeypatch.setattr("gmail_tui.client.store.time.time", lambda: next(now))
+    body = "x" * 200
+    size = len(json.dumps(message_resource("m1", ["INBOX"], body)["payload"]))
+    # Room for three and a half bodies
+    store = MessageStore(str(tmp_path / "cache.db"), max_body_bytes=size * 7 // 2)
+    for message_id in ("m1", "m2", "m3"):
+        store.save_message(message_resource(message_id, ["INBOX"], body), full=True)
+    # Reading a body makes it the most recently used
+    assert store.get_message("m1", full=True) is not None
+
+    store.save_message(message_resource("m4", ["INBOX"], body), full=True)
+
+    assert store.get_message("m2", full=True) is None
+    for message_id in ("m1", "m3", "m4"):
+        assert store.get_message(message_id, full=True) is not None
+    # The metadata of an evicted body is kept
+    assert store.get_message("m2", full=False) is not None
+    store.close()
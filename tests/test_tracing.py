@@ -0,0 +1,119 @@
+import json
+import threading
+
+import pytest
+
+from gmail_tui.client.tracing import Tracer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_spans_are_timed_with_the_requests_of_their_thread(clock):
+    tracer = Tracer(clock=clock)
+    clock.now = 101.0
+    with tracer.span("thread.parse", "parse", format="full"):
+        clock.now = 101.5
+        tracer.request()
+        tracer.request()
+    # Requests of other threads don't count
+    other = threading.Thread(target=tracer.request)
+    other.start()
+    other.join()
+
+    (span,) = tracer.recent()
+    assert span.name == "thread.parse"
+    assert span.category == "parse"
+    assert span.start == 1.0
+    assert span.duration == 0.5
+    assert span.requests == 2
+    assert span.args == {"format": "full"}
+    assert span.thread_id == threading.get_ident()
+    assert tracer.requests == 3
+
+
+def test_spans_are_recorded_when_their_block_raises(clock):
+    tracer = Tracer(clock=clock)
+
+    with pytest.raises(ValueError):
+        with tracer.span("render", "render"):
+            raise ValueError
+
+    assert [span.name for span in tracer.recent()] == ["render"]
+
+
+def test_traced_times_every_call(clock):
+    tracer = Tracer(clock=clock)
+
+    @tracer.traced("open thread", "ui")
+    def open_thread(thread_id: str) -> str:
+        clock.now += 2
+        return thread_id
+
+    assert open_thread("t1") == "t1"
+    assert open_thread.__name__ == "open_thread"
+    assert [(span.name, span.duration) for span in tracer.recent()] == [
+        ("open thread", 2.0)
+    ]
+
+
+def test_recent_spans_are_the_last_ones_first(clock):
+    tracer = Tracer(max_spans=3, clock=clock)
+    for index in range(5):
+        with tracer.span(f"span {index}", "ui" if index % 2 else "api"):
+            pass
+
+    assert [span.name for span in tracer.recent()] == ["span 4", "span 3", "span 2"]
+    assert [span.name for span in tracer.recent(1)] == ["span 4"]
+    assert [span.name for span in tracer.recent(category="ui")] == ["span 3"]
+
+
+def test_hit_rates_of_each_cache(clock):
+    tracer = Tracer(clock=clock)
+    for hit in (True, True, True, False):
+        tracer.cache_lookup("render", hit)
+    tracer.cache_lookup("store", False)
+
+    assert tracer.hit_rates() == {"render": 0.75, "store": 0.0}
+
+
+def test_chrome_trace_has_the_spans_since_it_started(clock, tmp_path):
+    tracer = Tracer(clock=clock)
+    with tracer.span("before", "ui"):
+        pass
+    tracer.start_trace()
+    clock.now = 100.25
+    with tracer.span("gmail.users.threads.get", "api", cost=10):
+        clock.now = 100.75
+        tracer.request()
+    tracer.cache_lookup("store", True)
+    path = tmp_path / "trace.json"
+
+    tracer.write_chrome_trace(str(path))
+
+    trace = json.loads(path.read_text(encoding="UTF-8"))
+    metadata, span = trace["traceEvents"]
+    assert metadata["ph"] == "M"
+    assert metadata["args"] == {"name": threading.current_thread().name}
+    assert span["ph"] == "X"
+    assert span["name"] == "gmail.users.threads.get"
+    assert span["cat"] == "api"
+    # In microseconds
+    assert span["ts"] == 250000
+    assert span["dur"] == 500000
+    assert span["tid"] == metadata["tid"]
+    assert span["args"] == {"cost": 10, "requests": 1}
+    assert trace["otherData"] == {
+        "requests": 1,
+        "cache_lookups": {"store hits": 1},
+    }
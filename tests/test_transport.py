@@ -0,0 +1,108 @@
+import gzip
+import json
+from unittest import mock
+
+import pytest
+import requests
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from gmail_tui.client.transport import SessionHttp
+
+
+class RecordingAdapter(BaseAdapter):
+    """Answers every request of a session with a gzipped JSON response"""
+
+    def __init__(self, content: dict):
+        super().__init__()
+        self.content = content
+        self.requests: list[requests.PreparedRequest] = []
+
+    def send(self, request, **kwargs) -> requests.Response:
+        self.requests.append(request)
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = request.url
+        response.request = request
+        response.headers = CaseInsensitiveDict(
+            {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+        response._content = json.dumps(self.content).encode()
+        compressed = gzip.compress(response._content)
+        response.headers["Content-Length"] = str(len(compressed))
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def http():
+    http = SessionHttp(Credentials(token="fresh"))
+    http.adapter = RecordingAdapter({"labels": [{"id": "INBOX"}]})
+    http.session.mount("https://", http.adapter)
+    yield http
+    http.close()
+
+
+def test_requests_are_sent_through_an_authorized_session(http):
+    assert isinstance(http.session, AuthorizedSession)
+    service = build("gmail", "v1", http=http, static_discovery=True)
+
+    labels = service.users().labels().list(userId="me").execute()
+
+    assert labels == {"labels": [{"id": "INBOX"}]}
+    (request,) = http.adapter.requests
+    assert request.url.startswith(
+        "https://gmail.googleapis.com/gmail/v1/users/me/labels"
+    )
+    assert request.headers["Authorization"] == "Bearer fresh"
+
+
+def test_authorization_added_by_googleapiclient_is_dropped(http):
+    http.request(
+        "https://gmail.googleapis.com/gmail/v1/users/me/labels",
+        "POST",
+        body='{"name": "Café"}',
+        headers={"Authorization": "Bearer stale", "content-type": "application/json"},
+    )
+
+    (request,) = http.adapter.requests
+    assert request.headers["Authorization"] == "Bearer fresh"
+    assert request.headers["Content-Type"] == "application/json"
+    assert request.body == '{"name": "Café"}'.encode("utf-8")
+
+
+def test_session_gets_no_authorization_header(http):
+    http.session = mock.Mock(wraps=http.session)
+
+    http.request(
+        "https://gmail.googleapis.com/gmail/v1/users/me/labels",
+        headers={"Authorization": "Bearer stale", "accept": "application/json"},
+        redirections=0,
+    )
+
+    http.session.request.assert_called_once_with(
+        "GET",
+        "https://gmail.googleapis.com/gmail/v1/users/me/labels",
+        data=None,
+        headers={"accept": "application/json"},
+        timeout=http.timeout,
+        allow_redirects=False,
+    )
+
+
+def test_response_describes_the_decoded_content(http):
+    response, content = http.request(
+        "https://gmail.googleapis.com/gmail/v1/users/me/labels"
+    )
+
+    assert json.loads(content) == {"labels": [{"id": "INBOX"}]}
+    assert response.status == 200
+    assert response["content-type"] == "application/json"
+    assert "content-encoding" not in response
+    assert "content-length" not in response